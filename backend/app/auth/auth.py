@@ -1,15 +1,54 @@
+import asyncio
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
+from app.cache.cache import TTLCache
+from app.middlewares.middleware import timed
 
 load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+def _load_signing_keys():
+    """Parse JWT_KEYS ("kid:secret,kid:secret"); SECRET_KEY alone when unset"""
+    keys = {}
+    for entry in os.getenv("JWT_KEYS", "").split(","):
+        kid, _, secret = entry.strip().partition(":")
+        if kid and secret:
+            keys[kid] = secret
+    return keys or {"default": SECRET_KEY}
+
+# Every key in JWT_KEYS is accepted for verification; new tokens are signed
+# with JWT_ACTIVE_KID. Rotate by adding a key, making it active once every
+# worker has it, and dropping the old one after ACCESS_TOKEN_EXPIRE_MINUTES.
+JWT_KEYS = _load_signing_keys()
+JWT_ACTIVE_KID = os.getenv("JWT_ACTIVE_KID", next(iter(JWT_KEYS)))
+if JWT_ACTIVE_KID not in JWT_KEYS:
+    raise RuntimeError(f"JWT_ACTIVE_KID {JWT_ACTIVE_KID!r} is not one of JWT_KEYS")
+# Verified tokens kept per process; each entry expires with its token
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+DEFAULT_ROLES = ["user"]
+
+# bcrypt cost factor; hashes below it are rehashed transparently on login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+# Dedicated hashing processes (0 = use the shared threadpool instead)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+# Hash requests allowed to wait for a worker before new ones are rejected with 503
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", 256))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS
+)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -17,16 +56,143 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+def _timed_hash(password):
+    started = time.perf_counter()
+    return get_password_hash(password), time.perf_counter() - started
+
+def _timed_verify_and_update(plain_password, hashed_password):
+    started = time.perf_counter()
+    valid, new_hash = pwd_context.verify_and_update(plain_password, hashed_password)
+    return (valid, new_hash), time.perf_counter() - started
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full; callers should answer 503"""
+
+
+class PasswordHasher:
+    """Runs bcrypt in a size-limited process pool, off the event loop and the GIL.
+
+    At most ``workers + max_queue`` operations are admitted; beyond that new
+    requests fail fast with ``PasswordHasherBusy`` instead of piling up.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_queue: int = PASSWORD_HASH_MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = None
+        self.pending = 0
+        self.peak_pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.wait_seconds_total = 0.0
+        self.run_seconds_total = 0.0
+
+    def _get_executor(self):
+        # Created on first use so each (forked) server worker owns its own pool
+        if self._executor is None and self.workers > 0:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def _submit(self, fn, *args):
+        capacity = max(self.workers, 1) + self.max_queue
+        if self.pending >= capacity:
+            self.rejected += 1
+            raise PasswordHasherBusy("Password hashing queue is full")
+        self.pending += 1
+        self.peak_pending = max(self.peak_pending, self.pending)
+        started = time.perf_counter()
+        try:
+            executor = self._get_executor()
+            with timed("hash"):
+                if executor is None:
+                    result, run_seconds = await run_in_threadpool(fn, *args)
+                else:
+                    result, run_seconds = await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        finally:
+            self.pending -= 1
+        self.completed += 1
+        self.run_seconds_total += run_seconds
+        self.wait_seconds_total += max(0.0, time.perf_counter() - started - run_seconds)
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(_timed_hash, password)
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str):
+        """Return ``(valid, new_hash)``; ``new_hash`` is set when the stored cost is outdated"""
+        valid, new_hash = await self._submit(_timed_verify_and_update, plain_password, hashed_password)
+        if new_hash:
+            self.rehashed += 1
+        return valid, new_hash
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "bcrypt_rounds": BCRYPT_ROUNDS,
+            "in_flight": min(self.pending, max(self.workers, 1)),
+            "queued": max(0, self.pending - max(self.workers, 1)),
+            "peak_pending": self.peak_pending,
+            "max_queue": self.max_queue,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+            "run_seconds_total": round(self.run_seconds_total, 6),
+        }
+
+
+password_hasher = PasswordHasher()
+
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, JWT_KEYS[JWT_ACTIVE_KID], algorithm=ALGORITHM,
+                             headers={"kid": JWT_ACTIVE_KID})
     return encoded_jwt
 
+def create_user_token(user: dict):
+    """Access token carrying everything authenticated requests need about the user"""
+    return create_access_token(data={
+        "sub": user["username"],
+        "uid": str(user["_id"]),
+        "roles": user.get("roles") or DEFAULT_ROLES
+    })
+
+def _verify(token: str):
+    kid = jwt.get_unverified_header(token).get("kid")
+    if kid is not None:
+        if kid not in JWT_KEYS:
+            return None
+        return jwt.decode(token, JWT_KEYS[kid], algorithms=[ALGORITHM])
+    # Tokens issued before key ids were introduced: try every known key
+    for secret in JWT_KEYS.values():
+        try:
+            return jwt.decode(token, secret, algorithms=[ALGORITHM])
+        except JWTError:
+            continue
+    return None
+
 def decode_access_token(token: str):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    """Verified claims of ``token`` or None; repeat tokens skip the HMAC check"""
+    payload = token_cache.get(token)
+    if payload is not None:
         return payload
+    try:
+        payload = _verify(token)
     except JWTError:
-        return None 
\ No newline at end of file
+        return None
+    if payload is not None:
+        remaining = payload.get("exp", 0) - time.time()
+        if remaining > 0:
+            token_cache.set(token, payload, ttl=remaining)
+    return payload 
\ No newline at end of file
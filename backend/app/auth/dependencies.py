@@ -1,23 +1,36 @@
-from fastapi import Depends, HTTPException, status
+from typing import Optional
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer
-from app.auth.auth import decode_access_token
-from app.database.database import db
+from app.auth.auth import DEFAULT_ROLES, decode_access_token
+from app.crud import crud
+from app.middlewares.middleware import timed
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login", auto_error=False)
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    payload = decode_access_token(token)
-    if payload is None:
-        raise credentials_exception
-    username: str = payload.get("sub")
-    if username is None:
-        raise credentials_exception
-    user = db.users.find_one({"username": username})
+    # JWT decode + user lookup, reported as the "auth" phase on /metrics
+    with timed("auth"):
+        payload = decode_access_token(token)
+        username: str = payload.get("sub") if payload else None
+        if username and "uid" in payload:
+            # Claims are signed by us, so the users collection is not consulted
+            user = {"_id": payload["uid"], "username": username, "roles": payload.get("roles", DEFAULT_ROLES)}
+        else:
+            # Tokens issued without user claims
+            user = await crud.get_authenticated_user(username) if username else None
     if user is None:
         raise credentials_exception
-    return user 
\ No newline at end of file
+    return user
+
+async def get_stream_user(
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+    access_token: Optional[str] = Query(None, description="Token for clients that cannot set headers (EventSource)")
+):
+    """Like get_current_user, but also accepts the token as a query parameter"""
+    return await get_current_user(token or access_token or "")
@@ -0,0 +1,95 @@
+import os
+import threading
+from app.cache.cache import TTLCache
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # optional: only needed for the shared (Redis) backend
+    redis = None
+
+# Shared state server: cache versions and rate-limit buckets, which must never be evicted;
+# "fakeredis://" runs an in-process Redis stand-in (dev/tests)
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Cached response bodies; may point at an evicting (LRU) instance of its own
+REDIS_CACHE_URL = os.getenv("REDIS_CACHE_URL", "") or REDIS_URL
+REDIS_KEY_PREFIX = os.getenv("REDIS_KEY_PREFIX", "fimoney:")
+
+
+class MemoryBackend:
+    """Per-process LRU store for cached bytes plus non-evictable counters"""
+
+    name = "memory"
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    async def get(self, key):
+        return self._cache.get(key)
+
+    async def set(self, key, value: bytes, ttl: float = None):
+        self._cache.set(key, value, ttl)
+
+    async def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    async def counter(self, key):
+        return self._counters.get(key, 0)
+
+    def stats(self):
+        return {"backend": self.name, **self._cache.stats()}
+
+
+class RedisBackend:
+    """Shared store so every worker process sees the same entries and versions.
+
+    Counters live on ``url`` and entries on ``cache_url``: an evicted
+    version counter would restart at a number whose old entries may still
+    be cached, so only the entries should sit where LRU eviction runs.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = REDIS_KEY_PREFIX, cache_url: str = REDIS_CACHE_URL):
+        self.prefix = prefix
+        self.client = create_redis_client(url)
+        self.cache_client = self.client if cache_url == url else create_redis_client(cache_url)
+
+    async def get(self, key):
+        return await self.cache_client.get(self.prefix + key)
+
+    async def set(self, key, value: bytes, ttl: float = None):
+        await self.cache_client.set(self.prefix + key, value, px=int(ttl * 1000) if ttl else None)
+
+    async def incr(self, key):
+        return await self.client.incr(self.prefix + key)
+
+    async def counter(self, key):
+        value = await self.client.get(self.prefix + key)
+        return int(value) if value is not None else 0
+
+    def stats(self):
+        return {"backend": self.name}
+
+
+def create_redis_client(url: str = REDIS_URL):
+    """redis.asyncio client for ``url``, or a fakeredis stand-in for ``fakeredis://``"""
+    if url.startswith("fakeredis://"):
+        import fakeredis
+
+        return fakeredis.aioredis.FakeRedis()
+    if redis is None:
+        raise RuntimeError("The shared cache backend requires the 'redis' package")
+    return redis.from_url(url)
+
+
+def create_backend(kind: str, maxsize: int, ttl: float):
+    """Build the backend named by ``kind``: memory (default) or redis"""
+    if kind == "redis":
+        return RedisBackend()
+    if kind == "memory":
+        return MemoryBackend(maxsize=maxsize, ttl=ttl)
+    raise ValueError(f"Unknown cache backend: {kind}")
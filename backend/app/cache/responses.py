@@ -0,0 +1,128 @@
+import hashlib
+import os
+import orjson
+from fastapi import Request, Response
+from app.cache.backends import create_backend
+from app.middlewares.middleware import timed
+
+# memory (per-process LRU, default), redis (shared between workers) or none
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory").lower()
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 2048))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 30))
+
+# Authenticated data: browsers may keep it but must revalidate with the ETag
+CACHE_CONTROL = "private, no-cache"
+
+
+def dump_json(data) -> bytes:
+    """Serialize already response-shaped data (see ``crud.product_out``) with orjson.
+
+    Skips FastAPI's per-item response_model validation and jsonable_encoder
+    pass; the route's ``response_model`` still documents the OpenAPI schema.
+    """
+    with timed("serialize"):
+        return orjson.dumps(data)
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+class ResponseCache:
+    """Caches serialized JSON bodies for read endpoints.
+
+    Keys embed a namespace version; writers call ``invalidate()`` to bump it,
+    which orphans every cached page at once (old entries age out via LRU/TTL).
+    Backend failures degrade to cache misses rather than failing the request.
+    """
+
+    def __init__(self, namespace: str, backend=None, ttl: float = RESPONSE_CACHE_TTL_SECONDS):
+        self.namespace = namespace
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    @property
+    def version_key(self):
+        return f"{self.namespace}:version"
+
+    async def key_for(self, request: Request):
+        version = await self.backend.counter(self.version_key)
+        params = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+        return f"{self.namespace}:v{version}:{request.url.path}?{params}"
+
+    async def lookup(self, request: Request):
+        """Return ``(key, response)``; response is None on a miss"""
+        if self.backend is None:
+            return None, None
+        try:
+            key = await self.key_for(request)
+            cached = await self.backend.get(key)
+        except Exception:
+            self.errors += 1
+            return None, None
+        if cached is None:
+            self.misses += 1
+            return key, None
+        self.hits += 1
+        etag, body = cached.split(b"\n", 1)
+        return key, self.respond(request, etag.decode(), body, "HIT")
+
+    async def store(self, request: Request, key, body: bytes):
+        """Cache ``body`` under ``key`` and build the (possibly 304) response"""
+        etag = make_etag(body)
+        if key is not None:
+            try:
+                await self.backend.set(key, etag.encode() + b"\n" + body, self.ttl)
+            except Exception:
+                self.errors += 1
+        return self.respond(request, etag, body, "MISS")
+
+    def respond(self, request: Request, etag: str, body: bytes, status: str):
+        headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL, "X-Cache": status}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    async def invalidate(self):
+        if self.backend is None:
+            return
+        try:
+            await self.backend.incr(self.version_key)
+            self.invalidations += 1
+        except Exception:
+            self.errors += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            **(self.backend.stats() if self.backend is not None else {"backend": "none"}),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "not_modified": self.not_modified,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+        }
+
+
+def create_response_cache(namespace: str):
+    backend = None
+    if RESPONSE_CACHE_BACKEND != "none":
+        backend = create_backend(RESPONSE_CACHE_BACKEND, RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL_SECONDS)
+    return ResponseCache(namespace, backend)
+
+
+product_cache = create_response_cache("products")
@@ -1,50 +1,628 @@
-from app.database.database import db
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import re
+import time
+from app.database.database import get_database, get_listing_database
+from app.cache.cache import TTLCache
+from app.cache.responses import product_cache
+from app.events.events import product_events
+from app.images.images import image_pipeline, public_url
+from app.ledger import ledger
 from app.models import model
+from app.schemas import schema
 from bson import ObjectId
-from passlib.context import CryptContext
+from bson.errors import InvalidId
+from pymongo import DeleteOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Fields allowed as keyset sort keys; _id is always the tie-breaker
+PRODUCT_SORT_KEYS = ("_id", "name", "sku", "type", "price", "quantity")
+# How long the (estimated) product count is reused before asking MongoDB again
+PRODUCT_COUNT_CACHE_SECONDS = float(os.getenv("PRODUCT_COUNT_CACHE_SECONDS", 30))
+
+_products_count = {"value": None, "expires_at": 0.0}
+_filtered_counts = TTLCache(maxsize=1024, ttl=PRODUCT_COUNT_CACHE_SECONDS)
+
+# Products with quantity below this are "low stock" (filters and facets)
+LOW_STOCK_THRESHOLD = int(os.getenv("LOW_STOCK_THRESHOLD", 10))
+
+# Only the fields ProductOut serializes are fetched from MongoDB
+PRODUCT_FIELDS = tuple(name for name in schema.ProductOut.model_fields if name != "id")
+PRODUCT_PROJECTION = {field: 1 for field in PRODUCT_FIELDS}
+# Stock writes also increment the stock version "v" that orders the ledger
+STOCK_WRITE_PROJECTION = {**PRODUCT_PROJECTION, "v": 1}
+
+# Keep the inventory summary collections up to date on every product write
+INVENTORY_SUMMARY_ENABLED = os.getenv("INVENTORY_SUMMARY_ENABLED", "True").lower() == "true"
+# Low-stock items listed by the summary endpoint (the counts are always complete)
+INVENTORY_LOW_STOCK_LIMIT = int(os.getenv("INVENTORY_LOW_STOCK_LIMIT", 100))
+# Differences below this are float rounding, not drift
+INVENTORY_VALUE_TOLERANCE = 0.01
+# {_id: "build", state: "built"} once the summary has been built from products
+SUMMARY_STATE_COLLECTION = "inventory_summary_state"
+_SUMMARY_FIELDS = ("products", "units", "value", "low_stock")
+# Set once per process; the summary never goes back to unbuilt
+_summary_state = {"built": False}
+
+
+class InvalidPagination(ValueError):
+    """Raised for an undecodable cursor or unsupported keyset parameters"""
 
 # User CRUD
 
-def get_user_by_username(username: str):
-    return db.users.find_one({"username": username})
+async def get_user_by_username(username: str):
+    return await get_database().users.find_one({"username": username})
 
-def create_user(user: model.User):
+async def get_authenticated_user(username: str):
+    """Resolve the user behind a token issued without user claims, minus the password hash"""
+    return await get_database().users.find_one({"username": username}, {"password": 0})
+
+async def create_user(user: model.User):
     user_dict = user.dict()
     # Do NOT hash the password here; it is already hashed in the route
-    result = db.users.insert_one(user_dict)
+    result = await get_database().users.insert_one(user_dict)
     user_dict["_id"] = str(result.inserted_id)
     return user_dict
 
-def authenticate_user(username: str, password: str):
-    user = get_user_by_username(username)
-    if not user or not pwd_context.verify(password, user["password"]):
-        return None
-    return user
+async def update_user_password(username: str, hashed_password: str):
+    await get_database().users.update_one({"username": username}, {"$set": {"password": hashed_password}})
 
 # Product CRUD
 
-def create_product(product: model.Product):
+def product_out(doc: dict, rewrite_images: bool = True) -> dict:
+    """Shape a products document exactly as ProductOut serializes it, in one pass.
+
+    Lets read paths emit JSON straight from Mongo documents without
+    re-validating every document through Pydantic. ``image_url`` points at
+    the resized, cached variant unless ``rewrite_images`` is False.
+    """
+    out = {"_id": str(doc["_id"])}
+    for field in PRODUCT_FIELDS:
+        out[field] = doc.get(field)
+    if isinstance(out["price"], int):
+        out["price"] = float(out["price"])
+    if rewrite_images and out["image_url"]:
+        out["image_url"] = public_url(out["image_url"])
+    return out
+
+async def create_product(product: model.Product):
     product_dict = product.dict()
-    result = db.products.insert_one(product_dict)
+    result = await get_database().products.insert_one(product_dict)
     product_dict["_id"] = str(result.inserted_id)
+    if _products_count["value"] is not None:
+        _products_count["value"] += 1
+    changes = [(None, {**product_dict, "_id": result.inserted_id})]
+    await asyncio.gather(record_inventory_changes(changes), ledger.record_movements(changes, "created"))
+    await product_cache.invalidate()
+    product_events.emit("created", product_out(product_dict))
+    image_pipeline.warm([product_dict.get("image_url")])
     return product_dict
 
-def update_product_quantity(product_id: str, quantity: int):
-    result = db.products.update_one({"_id": ObjectId(product_id)}, {"$set": {"quantity": quantity}})
-    if result.modified_count:
-        prod = db.products.find_one({"_id": ObjectId(product_id)})
-        prod["_id"] = str(prod["_id"])
-        return prod
-    return None
-
-def get_products(skip: int = 0, limit: int = 10):
-    products = list(db.products.find().skip(skip).limit(limit))
-    for p in products:
-        p["_id"] = str(p["_id"])
-    return products
-
-def get_total_products_count():
-    """Get total number of products for pagination"""
-    return db.products.count_documents({}) 
\ No newline at end of file
+async def get_product(product_id: str):
+    try:
+        product_oid = ObjectId(product_id)
+    except (InvalidId, TypeError):
+        return None
+    prod = await get_database().products.find_one({"_id": product_oid}, PRODUCT_PROJECTION)
+    return product_out(prod) if prod is not None else None
+
+async def insert_products(products: list):
+    """Unordered bulk insert; one bad document does not stop the rest.
+
+    Returns ``(inserted_count, errors)`` where errors are ``(index, message)``
+    pairs relative to ``products``.
+    """
+    errors = []
+    try:
+        result = await get_database().products.insert_many(products, ordered=False)
+        inserted = len(result.inserted_ids)
+    except BulkWriteError as exc:
+        inserted = exc.details.get("nInserted", 0)
+        errors = [(e["index"], e.get("errmsg", "Write error")) for e in exc.details.get("writeErrors", [])]
+    if _products_count["value"] is not None:
+        _products_count["value"] += inserted
+    if inserted:
+        failed = {index for index, _ in errors}
+        created = [product for index, product in enumerate(products) if index not in failed]
+        changes = [(None, product) for product in created]
+        await asyncio.gather(record_inventory_changes(changes), ledger.record_movements(changes, "created"))
+        await product_cache.invalidate()
+        if product_events.listening:
+            for product in created:
+                product_events.emit("created", product_out(product))
+        image_pipeline.warm({product.get("image_url") for product in created})
+    return inserted, errors
+
+async def update_product_quantity(product_id: str, quantity: int, session=None):
+    """Set the quantity and return the updated product in one round trip.
+
+    Runs on the primary; pass a causally consistent ``session`` to get a
+    consistency token for the write afterwards.
+    """
+    try:
+        product_oid = ObjectId(product_id)
+    except (InvalidId, TypeError):
+        return None
+    # The previous quantity is what the inventory summary needs; the new
+    # document is just that with the quantity replaced
+    before = await get_database().products.find_one_and_update(
+        {"_id": product_oid},
+        {"$set": {"quantity": quantity}, "$inc": {"v": 1}},
+        projection=STOCK_WRITE_PROJECTION,
+        return_document=ReturnDocument.BEFORE,
+        session=session
+    )
+    if before is None:
+        return None
+    prod = {**before, "quantity": quantity}
+    await asyncio.gather(record_inventory_changes([(before, prod)]),
+                         ledger.record_movements([(before, prod)], "updated"))
+    await product_cache.invalidate()
+    product = product_out(prod)
+    product_events.emit("quantity_updated", product)
+    return product
+
+async def update_product_image(product_id: str, image_url: str):
+    """Point a product at a new image and return the updated product"""
+    try:
+        product_oid = ObjectId(product_id)
+    except (InvalidId, TypeError):
+        return None
+    prod = await get_database().products.find_one_and_update(
+        {"_id": product_oid},
+        {"$set": {"image_url": image_url}},
+        projection=PRODUCT_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
+    if prod is None:
+        return None
+    await product_cache.invalidate()
+    product = product_out(prod)
+    product_events.emit("updated", product)
+    image_pipeline.warm([image_url])
+    return product
+
+def _net_quantity_operations(operations, allow_negative: bool):
+    """Collapse the operations of one product into a single guarded update.
+
+    Returns ``(filter_extra, update)`` or ``None`` when the sequence can
+    never be applied without going negative.
+    """
+    set_value = None
+    delta = 0
+    lowest = 0  # lowest running delta applied on top of the current stock
+    for op in operations:
+        if op.set is not None:
+            set_value, delta = op.set, 0
+        else:
+            delta += op.delta
+        if set_value is None:
+            lowest = min(lowest, delta)
+        elif set_value + delta < 0 and not allow_negative:
+            return None
+    guard = {}
+    if lowest < 0 and not allow_negative:
+        guard = {"quantity": {"$gte": -lowest}}
+    if set_value is not None:
+        return guard, {"$set": {"quantity": set_value + delta}, "$inc": {"v": 1}}
+    return guard, {"$inc": {"quantity": delta, "v": 1}}
+
+async def apply_quantity_operations(operations: list, allow_negative: bool = False):
+    """Apply many stock movements with one atomic update per product.
+
+    SKUs are resolved to ids first, so all operations on one product
+    (whether addressed by ``id`` or ``sku``) are netted into a single
+    ``$inc``/``$set`` in request order, guarded so stock never goes
+    negative unless ``allow_negative``; all of a product's operations are
+    applied or rejected together. The per-product updates run concurrently
+    as ``find_one_and_update`` calls, so the summary and ledger get each
+    product's exact before/after pair even under concurrent writers.
+
+    Returns one ``(status, product)`` pair per operation, where status is
+    ``applied``, ``not_found``, ``insufficient_stock`` or ``invalid_id``.
+    """
+    results = [None] * len(operations)
+    db = get_database()
+    targets = []
+    for index, op in enumerate(operations):
+        if op.id is not None:
+            try:
+                targets.append((index, ObjectId(op.id)))
+            except (InvalidId, TypeError):
+                results[index] = ("invalid_id", None)
+        else:
+            targets.append((index, None))
+
+    skus = {operations[i].sku for i, oid in targets if oid is None}
+    id_by_sku = {}
+    if skus:
+        async for doc in db.products.find({"sku": {"$in": list(skus)}}, {"sku": 1}):
+            id_by_sku[doc["sku"]] = doc["_id"]
+
+    groups = {}
+    for index, oid in targets:
+        if oid is None:
+            oid = id_by_sku.get(operations[index].sku)
+            if oid is None:
+                results[index] = ("not_found", None)
+                continue
+        groups.setdefault(oid, []).append(index)
+
+    updates = {}
+    for oid, indexes in groups.items():
+        netted = _net_quantity_operations([operations[i] for i in indexes], allow_negative)
+        if netted is not None:
+            updates[oid] = netted
+
+    async def apply(oid, guard, update):
+        return await db.products.find_one_and_update(
+            {"_id": oid, **guard}, update, projection=STOCK_WRITE_PROJECTION, return_document=ReturnDocument.BEFORE
+        )
+    befores = await asyncio.gather(*(apply(oid, guard, update) for oid, (guard, update) in updates.items()))
+
+    changes = []
+    for (oid, (guard, update)), before in zip(updates.items(), befores):
+        if before is None:
+            continue
+        quantity = update["$set"]["quantity"] if "$set" in update else before["quantity"] + update["$inc"]["quantity"]
+        after = {**before, "quantity": quantity}
+        changes.append((before, after))
+        product = product_out(after)
+        product_events.emit("quantity_updated", product)
+        for i in groups[oid]:
+            results[i] = ("applied", product)
+
+    # Rejected by netting or the guard, or gone: report the current stock where there is any
+    unmatched = [oid for oid, indexes in groups.items() if results[indexes[0]] is None]
+    if unmatched:
+        current = {p["_id"]: p for p in await db.products.find({"_id": {"$in": unmatched}}, PRODUCT_PROJECTION)
+                   .to_list(length=None)}
+        for oid in unmatched:
+            product = current.get(oid)
+            outcome = ("insufficient_stock", product_out(product)) if product else ("not_found", None)
+            for i in groups[oid]:
+                results[i] = outcome
+    if changes:
+        await asyncio.gather(record_inventory_changes(changes), ledger.record_movements(changes, "batch"))
+        await product_cache.invalidate()
+    return results
+
+def build_product_query(type: str = None, min_price: float = None, max_price: float = None,
+                        min_quantity: int = None, max_quantity: int = None, low_stock: bool = False,
+                        sku_prefix: str = None, q: str = None) -> dict:
+    """Translate listing filters into an index-friendly MongoDB query"""
+    query = {}
+    if type is not None:
+        query["type"] = type
+    price = {}
+    if min_price is not None:
+        price["$gte"] = min_price
+    if max_price is not None:
+        price["$lte"] = max_price
+    if price:
+        query["price"] = price
+    quantity = {}
+    if min_quantity is not None:
+        quantity["$gte"] = min_quantity
+    if max_quantity is not None:
+        quantity["$lte"] = max_quantity
+    if low_stock:
+        quantity["$lt"] = LOW_STOCK_THRESHOLD
+    if quantity:
+        query["quantity"] = quantity
+    if sku_prefix:
+        # Anchored, case-sensitive prefix regexes are answered from the sku index
+        query["sku"] = {"$regex": f"^{re.escape(sku_prefix)}"}
+    if q:
+        query["$text"] = {"$search": q}
+    return query
+
+# Listing reads below go through get_listing_database() and may be served by
+# a secondary; ``session`` is a causal session when the client sent a
+# consistency token, so it sees its own earlier writes. ``primary`` is set
+# when the result will be stored in the response cache.
+
+async def get_products(skip: int = 0, limit: int = 10, query: dict = None, session=None, primary: bool = False):
+    cursor = get_listing_database(primary).products.find(query or {}, PRODUCT_PROJECTION, session=session)
+    cursor = cursor.skip(skip).limit(limit)
+    return [product_out(p) for p in await cursor.to_list(length=None)]
+
+def iter_products(query: dict = None, batch_size: int = 1000):
+    """Server-side cursor over matching products in ``_id`` order.
+
+    Documents are fetched ``batch_size`` at a time as the caller iterates,
+    so nothing is materialized up front (exports, full-catalog scans).
+    """
+    return get_listing_database().products.find(query or {}, PRODUCT_PROJECTION).sort("_id", 1).batch_size(batch_size)
+
+def _filters_fingerprint(filters: dict) -> str:
+    return hashlib.sha1(json.dumps(filters, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+def encode_cursor(sort: str, doc: dict, page: int, filters: dict = None) -> str:
+    """Opaque cursor pointing just after ``doc`` in ``sort`` order"""
+    state = {"s": sort, "id": str(doc["_id"]), "p": page, "f": _filters_fingerprint(filters or {})}
+    if sort != "_id":
+        state["v"] = doc.get(sort)
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort: str, filters: dict = None) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        state["id"] = ObjectId(state["id"])
+    except (ValueError, TypeError, KeyError, InvalidId) as exc:
+        raise InvalidPagination("Malformed pagination cursor") from exc
+    if state.get("s") != sort:
+        raise InvalidPagination("Cursor was issued for a different sort order")
+    if state.get("f") != _filters_fingerprint(filters or {}):
+        raise InvalidPagination("Cursor was issued for different filters")
+    return state
+
+async def get_products_page(cursor: str = None, limit: int = 10, sort: str = "_id", query: dict = None,
+                            session=None, primary: bool = False):
+    """Keyset pagination: seek past the last seen (sort key, _id) instead of skipping.
+
+    Returns ``(products, next_cursor, page)``; every page costs one indexed
+    range scan of ``limit + 1`` documents no matter how deep it is.
+    """
+    if sort not in PRODUCT_SORT_KEYS:
+        raise InvalidPagination(f"Unsupported sort key: {sort}")
+    if limit < 1:
+        raise InvalidPagination("limit must be at least 1")
+    filters = query or {}
+    query = filters
+    page = 1
+    if cursor:
+        state = decode_cursor(cursor, sort, filters)
+        page = state.get("p", 1) + 1
+        if sort == "_id":
+            seek = {"_id": {"$gt": state["id"]}}
+        else:
+            seek = {"$or": [
+                {sort: {"$gt": state["v"]}},
+                {sort: state["v"], "_id": {"$gt": state["id"]}},
+            ]}
+        query = {"$and": [filters, seek]} if filters else seek
+    order = [("_id", 1)] if sort == "_id" else [(sort, 1), ("_id", 1)]
+    cursor = get_listing_database(primary).products.find(query, PRODUCT_PROJECTION, session=session) \
+        .sort(order).limit(limit + 1)
+    products = await cursor.to_list(length=None)
+    next_cursor = None
+    if len(products) > limit:
+        products = products[:limit]
+        next_cursor = encode_cursor(sort, products[-1], page, filters)
+    return [product_out(p) for p in products], next_cursor, page
+
+async def get_product_facets(query: dict = None, session=None, primary: bool = False):
+    """Counts per type, low-stock count and total in a single aggregation"""
+    pipeline = [
+        {"$match": query or {}},
+        {"$facet": {
+            "types": [
+                {"$group": {"_id": "$type", "count": {"$sum": 1}}},
+                {"$sort": {"count": -1, "_id": 1}},
+            ],
+            "low_stock": [
+                {"$match": {"quantity": {"$lt": LOW_STOCK_THRESHOLD}}},
+                {"$count": "count"},
+            ],
+            "total": [{"$count": "count"}],
+        }},
+    ]
+    result = (await get_listing_database(primary).products.aggregate(pipeline, session=session).to_list(length=1))[0]
+    return {
+        "total": result["total"][0]["count"] if result["total"] else 0,
+        "low_stock": result["low_stock"][0]["count"] if result["low_stock"] else 0,
+        "low_stock_threshold": LOW_STOCK_THRESHOLD,
+        "types": [{"value": t["_id"], "count": t["count"]} for t in result["types"]],
+    }
+
+# Inventory summary
+#
+# inventory_summary holds one document per product type with running
+# totals; inventory_low_stock holds the products below LOW_STOCK_THRESHOLD.
+# Every product write applies its delta with $inc, so reading the summary
+# never scans products. reconcile_inventory_summary() rebuilds both from
+# scratch and reports how far they had drifted. Until it has been built
+# once, writes leave the summary alone and readers aggregate products.
+
+def _summary_pipeline():
+    return [{"$group": {
+        "_id": "$type",
+        "products": {"$sum": 1},
+        "units": {"$sum": "$quantity"},
+        "value": {"$sum": {"$multiply": ["$quantity", "$price"]}},
+        "low_stock": {"$sum": {"$cond": [{"$lt": ["$quantity", LOW_STOCK_THRESHOLD]}, 1, 0]}},
+    }}]
+
+_LOW_STOCK_PROJECTION = {"name": 1, "sku": 1, "type": 1, "quantity": 1, "price": 1}
+
+async def inventory_summary_built():
+    """Whether the summary collections can be read instead of products"""
+    if not _summary_state["built"]:
+        state = await get_database()[SUMMARY_STATE_COLLECTION].find_one({"_id": "build", "state": "built"})
+        _summary_state["built"] = state is not None
+    return _summary_state["built"]
+
+async def mark_inventory_summary_built():
+    await get_database()[SUMMARY_STATE_COLLECTION].update_one(
+        {"_id": "build"}, {"$set": {"state": "built"}}, upsert=True
+    )
+    _summary_state["built"] = True
+
+def _summary_contribution(product: dict):
+    quantity = product.get("quantity") or 0
+    return {
+        "products": 1,
+        "units": quantity,
+        "value": quantity * (product.get("price") or 0),
+        "low_stock": int(quantity < LOW_STOCK_THRESHOLD),
+    }
+
+def _low_stock_entry(product: dict):
+    return {field: product.get(field) for field in ("name", "sku", "type", "quantity", "price")}
+
+async def record_inventory_changes(changes: list):
+    """Apply ``(before, after)`` product states to the summary collections.
+
+    ``before`` is None for a newly created product. All deltas are merged
+    per type, so a batch costs at most one write to each collection.
+    """
+    if not INVENTORY_SUMMARY_ENABLED or not changes or not await inventory_summary_built():
+        return
+    totals = {}
+    low_stock = []
+    for before, after in changes:
+        for product, sign in ((before, -1), (after, 1)):
+            if product is None:
+                continue
+            entry = totals.setdefault(product.get("type"), dict.fromkeys(_SUMMARY_FIELDS, 0))
+            for field, amount in _summary_contribution(product).items():
+                entry[field] += sign * amount
+        _id = ObjectId(after["_id"]) if isinstance(after["_id"], str) else after["_id"]
+        if after.get("quantity", 0) < LOW_STOCK_THRESHOLD:
+            low_stock.append(UpdateOne({"_id": _id}, {"$set": _low_stock_entry(after)}, upsert=True))
+        elif before is not None and before.get("quantity", 0) < LOW_STOCK_THRESHOLD:
+            low_stock.append(DeleteOne({"_id": _id}))
+
+    db = get_database()
+    summary = [
+        UpdateOne({"_id": type}, {"$inc": entry, "$setOnInsert": {"type": type}}, upsert=True)
+        for type, entry in totals.items() if any(entry.values())
+    ]
+    writes = []
+    if summary:
+        writes.append(db.inventory_summary.bulk_write(summary, ordered=False))
+    if low_stock:
+        writes.append(db.inventory_low_stock.bulk_write(low_stock, ordered=False))
+    await asyncio.gather(*writes)
+
+async def get_inventory_summary(low_stock_limit: int = INVENTORY_LOW_STOCK_LIMIT):
+    """Totals per type, overall totals and the lowest-stock items.
+
+    Reads the summary collections once they are built; before that (status
+    "building") the same figures are aggregated from products.
+    """
+    db = get_database()
+    lowest = [("quantity", 1), ("_id", 1)]
+    if await inventory_summary_built():
+        status = "built"
+        types, items = await asyncio.gather(
+            db.inventory_summary.find({}).to_list(length=None),
+            db.inventory_low_stock.find({}).sort(lowest).limit(low_stock_limit + 1).to_list(length=None),
+        )
+    else:
+        status = "building"
+        types, items = await asyncio.gather(
+            db.products.aggregate(_summary_pipeline()).to_list(length=None),
+            db.products.find({"quantity": {"$lt": LOW_STOCK_THRESHOLD}}, _LOW_STOCK_PROJECTION)
+              .sort(lowest).limit(low_stock_limit + 1).to_list(length=None),
+        )
+    rows = sorted(
+        ({"type": doc.get("type", doc["_id"]), **{field: doc.get(field, 0) for field in _SUMMARY_FIELDS}}
+         for doc in types if doc.get("products")),
+        key=lambda row: -row["value"]
+    )
+    totals = {field: sum(row[field] for row in rows) for field in _SUMMARY_FIELDS}
+    for row in rows + [totals]:
+        row["value"] = round(row["value"], 2)
+    return {
+        "status": status,
+        "totals": totals,
+        "types": rows,
+        "low_stock_threshold": LOW_STOCK_THRESHOLD,
+        "low_stock_items": [{"_id": str(doc["_id"]), **_low_stock_entry(doc)} for doc in items[:low_stock_limit]],
+        "low_stock_truncated": len(items) > low_stock_limit,
+    }
+
+async def reconcile_inventory_summary(fix: bool = False):
+    """Recompute the summary from products, report drift and optionally repair it.
+
+    Writes that land while this runs can be overwritten by the repair, so
+    run it with ``fix`` during quiet periods; the report alone is safe. A
+    fix also marks the summary built, so readers switch over to it.
+    """
+    started = time.perf_counter()
+    db = get_database()
+    expected = {doc["_id"]: doc for doc in await db.products.aggregate(_summary_pipeline()).to_list(length=None)}
+    stored = {doc["_id"]: doc for doc in await db.inventory_summary.find({}).to_list(length=None)}
+
+    drift = []
+    for type in sorted(set(expected) | set(stored), key=str):
+        for field in _SUMMARY_FIELDS:
+            want = (expected.get(type) or {}).get(field, 0)
+            have = (stored.get(type) or {}).get(field, 0)
+            if abs(want - have) > (INVENTORY_VALUE_TOLERANCE if field == "value" else 0):
+                drift.append({"type": type, "field": field, "expected": want, "stored": have})
+
+    low_query = {"quantity": {"$lt": LOW_STOCK_THRESHOLD}}
+    expected_low = {doc["_id"]: doc for doc in await db.products.find(low_query, _LOW_STOCK_PROJECTION)
+                    .to_list(length=None)}
+    stored_low = {doc["_id"]: doc for doc in await db.inventory_low_stock.find({}).to_list(length=None)}
+    missing = [_id for _id in expected_low if _id not in stored_low]
+    stale = [_id for _id in stored_low if _id not in expected_low
+             or stored_low[_id].get("quantity") != expected_low[_id].get("quantity")]
+
+    if fix and (drift or missing or stale):
+        summary = [
+            UpdateOne({"_id": type}, {"$set": {"type": type, **{f: doc[f] for f in _SUMMARY_FIELDS}}}, upsert=True)
+            for type, doc in expected.items()
+        ] + [DeleteOne({"_id": type}) for type in stored if type not in expected]
+        low_stock = [
+            UpdateOne({"_id": _id}, {"$set": _low_stock_entry(expected_low[_id])}, upsert=True)
+            for _id in set(missing) | set(stale) if _id in expected_low
+        ] + [DeleteOne({"_id": _id}) for _id in stale if _id not in expected_low]
+        if summary:
+            await db.inventory_summary.bulk_write(summary, ordered=False)
+        if low_stock:
+            await db.inventory_low_stock.bulk_write(low_stock, ordered=False)
+    if fix:
+        await mark_inventory_summary_built()
+        await product_cache.invalidate()
+
+    return {
+        "products": sum(doc["products"] for doc in expected.values()),
+        "drift": drift,
+        "low_stock_missing": len(missing),
+        "low_stock_stale": len(stale),
+        "fixed": fix and bool(drift or missing or stale),
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+    }
+
+async def ensure_inventory_summary():
+    """Mark the summary built when there is nothing to build; True if it still needs building.
+
+    A new database is tracked from its first write, and summaries built
+    before the state document existed are kept. An existing catalog is
+    never scanned here: that is left to ``reconcile-inventory --fix``.
+    """
+    if not INVENTORY_SUMMARY_ENABLED or await inventory_summary_built():
+        return False
+    db = get_database()
+    if await db.inventory_summary.find_one({}) is not None or await db.products.find_one({}, {"_id": 1}) is None:
+        await mark_inventory_summary_built()
+        return False
+    return True
+
+async def get_total_products_count(query: dict = None, session=None, primary: bool = False):
+    """Get total number of products for pagination.
+
+    Unfiltered totals use collection metadata (``estimated_document_count``)
+    instead of a full count; both those and filtered counts are reused for
+    PRODUCT_COUNT_CACHE_SECONDS.
+    """
+    if query:
+        key = json.dumps(query, sort_keys=True, default=str)
+        total = _filtered_counts.get(key)
+        if total is None:
+            total = await get_listing_database(primary).products.count_documents(query, session=session)
+            _filtered_counts.set(key, total)
+        return total
+    now = time.monotonic()
+    if _products_count["value"] is None or now >= _products_count["expires_at"]:
+        _products_count["value"] = await get_listing_database(primary).products.estimated_document_count()
+        _products_count["expires_at"] = now + PRODUCT_COUNT_CACHE_SECONDS
+    return _products_count["value"]
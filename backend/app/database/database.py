@@ -1,6 +1,20 @@
+import asyncio
+import base64
+import hashlib
+import hmac
 import os
-from pymongo import MongoClient, errors
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from functools import partial
+from itertools import islice
+import bson
+from pymongo import MongoClient, monitoring, read_preferences
+from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
+from app.middlewares.middleware import metrics as request_metrics
 
 load_dotenv()
 
@@ -8,14 +22,438 @@ load_dotenv()
 MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
 DATABASE_NAME = os.getenv("DATABASE_NAME", "fimoney_inventory")
 
-db = None
-try:
-    client = MongoClient(MONGODB_URL, serverSelectionTimeoutMS=5000)
-    client.server_info()  # Will throw if cannot connect
-    db = client[DATABASE_NAME]
-    print(f"MongoDB connected successfully to database: {DATABASE_NAME}")
-except errors.ServerSelectionTimeoutError as err:
-    print(f"MongoDB connection error: {err}")
-    print("Please ensure MongoDB is running and the connection string is correct.")
-except Exception as err:
-    print(f"Database error: {err}") 
\ No newline at end of file
+# Async (Motor) driver by default; set USE_ASYNC_DB=false to fall back to
+# blocking pymongo calls dispatched to the threadpool
+USE_ASYNC_DB = os.getenv("USE_ASYNC_DB", "True").lower() == "true"
+
+# Connection pool settings (0 keeps the driver default of "no limit")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 0))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 0))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+MONGO_WARM_ON_STARTUP = os.getenv("MONGO_WARM_ON_STARTUP", "True").lower() == "true"
+
+# Read routing: listing, search and export reads use this read preference
+# (primary, primaryPreferred, secondary, secondaryPreferred or nearest);
+# writes and read-your-own-write paths always go to the primary
+MONGO_LISTING_READ_PREFERENCE = os.getenv("MONGO_LISTING_READ_PREFERENCE", "secondaryPreferred")
+# Skip secondaries lagging further behind the primary than this (0 = no limit,
+# otherwise at least 90 as MongoDB requires)
+MONGO_MAX_STALENESS_SECONDS = int(os.getenv("MONGO_MAX_STALENESS_SECONDS", 90))
+# Hand out consistency tokens on writes and honour them on listing reads
+MONGO_CAUSAL_CONSISTENCY = os.getenv("MONGO_CAUSAL_CONSISTENCY", "True").lower() == "true"
+CONSISTENCY_TOKEN_KEY = os.getenv("CONSISTENCY_TOKEN_KEY", os.getenv("SECRET_KEY", "your-secret-key-here")).encode()
+
+# Response/request header carrying a causal consistency token
+CONSISTENCY_HEADER = "X-Consistency-Token"
+
+
+def listing_read_preference(mode: str = MONGO_LISTING_READ_PREFERENCE, max_staleness: int = MONGO_MAX_STALENESS_SECONDS):
+    """Build the read preference used for listing reads"""
+    modes = {cls.__name__.lower(): cls for cls in (
+        read_preferences.Primary, read_preferences.PrimaryPreferred, read_preferences.Secondary,
+        read_preferences.SecondaryPreferred, read_preferences.Nearest
+    )}
+    cls = modes.get(mode.lower())
+    if cls is None:
+        raise ValueError(f"Unknown read preference: {mode}")
+    if cls is read_preferences.Primary:
+        return cls()
+    return cls(max_staleness=max(max_staleness, 90) if max_staleness > 0 else -1)
+
+
+LISTING_READ_PREFERENCE = listing_read_preference()
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection pool counters fed by pymongo CMAP events"""
+
+    def __init__(self, max_pool_size: int):
+        self.max_pool_size = max_pool_size
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.connections_open = 0
+            self.connections_created = 0
+            self.in_use = 0
+            self.peak_in_use = 0
+            self.waiting = 0
+            self.peak_waiting = 0
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.checkout_timeouts = 0
+            self.wait_seconds_total = 0.0
+            self.wait_seconds_max = 0.0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_pool_size": self.max_pool_size,
+                "connections_open": self.connections_open,
+                "connections_created": self.connections_created,
+                "in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+                "waiting": self.waiting,
+                "peak_waiting": self.peak_waiting,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "checkout_timeouts": self.checkout_timeouts,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+                "saturation": round(self.in_use / self.max_pool_size, 3) if self.max_pool_size else 0.0,
+            }
+
+    # Checkouts happen on the calling thread (Motor uses its own executor
+    # threads), so the start time of the pending checkout is thread-local
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+        with self._lock:
+            self.waiting += 1
+            self.peak_waiting = max(self.peak_waiting, self.waiting)
+
+    def connection_checked_out(self, event):
+        waited = time.perf_counter() - getattr(self._local, "started", time.perf_counter())
+        with self._lock:
+            self.waiting -= 1
+            self.checkouts += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.waiting -= 1
+            self.checkout_failures += 1
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self.checkout_timeouts += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_open += 1
+            self.connections_created += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_open -= 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+
+class MongoManager:
+    """Owns the MongoDB clients for this process.
+
+    Clients are created on first use, never at import time, so importing the
+    app (tests, CLI commands, every forked worker) does not touch the network.
+    The FastAPI lifespan calls ``startup()`` to warm the pool and ``close()``
+    on shutdown.
+    """
+
+    def __init__(self):
+        self.metrics = PoolMetrics(MONGO_MAX_POOL_SIZE)
+        self._client = None
+        self._async_client = None
+        self._warm_task = None
+        self._replicated = None
+        self._lock = threading.Lock()
+
+    def _client_options(self):
+        options = {
+            "maxPoolSize": MONGO_MAX_POOL_SIZE,
+            "minPoolSize": MONGO_MIN_POOL_SIZE,
+            "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            "event_listeners": [self.metrics, request_metrics],
+        }
+        if MONGO_MAX_IDLE_TIME_MS:
+            options["maxIdleTimeMS"] = MONGO_MAX_IDLE_TIME_MS
+        if MONGO_WAIT_QUEUE_TIMEOUT_MS:
+            options["waitQueueTimeoutMS"] = MONGO_WAIT_QUEUE_TIMEOUT_MS
+        return options
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = MongoClient(MONGODB_URL, **self._client_options())
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    self._async_client = AsyncIOMotorClient(MONGODB_URL, **self._client_options())
+        return self._async_client
+
+    @property
+    def db(self):
+        """Blocking pymongo database (scripts, CLI commands, sync fallback)"""
+        return self.client[DATABASE_NAME]
+
+    @property
+    def async_db(self):
+        return self.async_client[DATABASE_NAME]
+
+    @property
+    def listing_db(self):
+        return self.client.get_database(DATABASE_NAME, read_preference=LISTING_READ_PREFERENCE)
+
+    @property
+    def async_listing_db(self):
+        return self.async_client.get_database(DATABASE_NAME, read_preference=LISTING_READ_PREFERENCE)
+
+    def attach(self, client=None, async_client=None):
+        """Use pre-built clients instead of connecting (e.g. a local stand-in)"""
+        self._client = client
+        self._async_client = async_client
+        self._replicated = None
+
+    async def startup(self):
+        """Warm the pool in the background so app startup never waits on MongoDB"""
+        if MONGO_WARM_ON_STARTUP:
+            self._warm_task = asyncio.create_task(self.warm())
+
+    async def warm(self):
+        """Open minPoolSize connections up front with concurrent pings"""
+        started = time.perf_counter()
+        database = get_database()
+        try:
+            await asyncio.gather(*(database.command("ping") for _ in range(max(1, MONGO_MIN_POOL_SIZE))))
+            print(f"MongoDB connected to database: {DATABASE_NAME} "
+                  f"({(time.perf_counter() - started) * 1000:.0f}ms)")
+        except Exception as err:
+            print(f"MongoDB connection error: {err}")
+            print("Please ensure MongoDB is running and the connection string is correct.")
+
+    async def is_replica_set(self):
+        """True on a replica set or sharded cluster; asked once per process"""
+        if self._replicated is None:
+            try:
+                hello = await get_database().command("hello")
+            except Exception:
+                # Unreachable right now, or a stand-in without hello; ask again next time
+                return False
+            self._replicated = bool(hello.get("setName") or hello.get("msg") == "isdbgrid")
+        return self._replicated
+
+    async def supports_transactions(self):
+        """True on a replica set or sharded cluster with the async driver"""
+        return USE_ASYNC_DB and await self.is_replica_set()
+
+    async def run_transaction(self, callback):
+        """Run ``callback(session)`` in a transaction, retried on transient errors"""
+        async with await self.async_client.start_session() as session:
+            return await session.with_transaction(callback)
+
+    @asynccontextmanager
+    async def causal_session(self, token: str = None):
+        """Causally consistent session, or None where there is nothing to be consistent with.
+
+        Operations in the session read their own writes. With ``token`` (from
+        an earlier write's response) a read served by a secondary first waits
+        until that member has replicated the write.
+        """
+        if not MONGO_CAUSAL_CONSISTENCY or not await self.is_replica_set():
+            yield None
+            return
+        if USE_ASYNC_DB:
+            session = await self.async_client.start_session(causal_consistency=True)
+        else:
+            session = self.client.start_session(causal_consistency=True)
+        try:
+            position = decode_consistency_token(token) if token else None
+            if position is not None:
+                session.advance_cluster_time(position["c"])
+                session.advance_operation_time(position["o"])
+            yield session
+        finally:
+            if USE_ASYNC_DB:
+                await session.end_session()
+            else:
+                session.end_session()
+
+    def close(self):
+        if self._warm_task is not None:
+            self._warm_task.cancel()
+            self._warm_task = None
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+            if self._async_client is not None:
+                self._async_client.close()
+            self._client = None
+            self._async_client = None
+
+    def _after_fork(self):
+        """Forget clients inherited from a parent process (e.g. a preloaded app).
+
+        Their sockets and monitor threads belong to the parent; each worker
+        connects on its own on first use.
+        """
+        self._lock = threading.Lock()
+        self._client = None
+        self._async_client = None
+        self._warm_task = None
+        self._replicated = None
+        self.metrics.reset()
+
+    def stats(self):
+        return {
+            "driver": "motor" if USE_ASYNC_DB else "pymongo",
+            "client_initialized": (self._async_client if USE_ASYNC_DB else self._client) is not None,
+            "pool": self.metrics.stats(),
+            "replica_set": self._replicated,
+            "listing_read_preference": LISTING_READ_PREFERENCE.document,
+            "causal_consistency": MONGO_CAUSAL_CONSISTENCY,
+        }
+
+
+def _token_signature(payload: bytes) -> str:
+    return hmac.new(CONSISTENCY_TOKEN_KEY, payload, hashlib.sha256).hexdigest()[:32]
+
+
+def consistency_token(session):
+    """Opaque token for the position a session has reached, or None.
+
+    Signed, because the cluster time inside it is gossiped back to MongoDB
+    and a forged one would make the reads that carry it fail.
+    """
+    if session is None or session.operation_time is None or session.cluster_time is None:
+        return None
+    payload = base64.urlsafe_b64encode(bson.encode({"o": session.operation_time, "c": session.cluster_time}))
+    return f"{payload.decode().rstrip('=')}.{_token_signature(payload.rstrip(b'='))}"
+
+
+def decode_consistency_token(token: str):
+    """``{"o": operation time, "c": cluster time}``, or None for a malformed or forged token"""
+    payload, _, signature = token.partition(".")
+    if not hmac.compare_digest(_token_signature(payload.encode()), signature):
+        return None
+    try:
+        position = bson.decode(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+    except Exception:
+        return None
+    if not isinstance(position.get("o"), bson.Timestamp) or not isinstance(position.get("c"), dict):
+        return None
+    return position
+
+
+mongo = MongoManager()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=mongo._after_fork)
+
+
+class ThreadedCursor:
+    """Motor-style cursor over a blocking pymongo cursor"""
+
+    def __init__(self, cursor, batch_size: int = 100):
+        self._cursor = cursor
+        self._batch_size = batch_size
+        self._buffer = deque()
+
+    def __getattr__(self, name):
+        # sort/skip/limit/batch_size/hint... chain just like on Motor cursors
+        method = getattr(self._cursor, name)
+
+        def chained(*args, **kwargs):
+            if name == "batch_size" and args:
+                self._batch_size = args[0]
+            method(*args, **kwargs)
+            return self
+        return chained
+
+    def _take(self, length):
+        return list(islice(self._cursor, length))
+
+    async def to_list(self, length=None):
+        docs = list(self._buffer) + await run_in_threadpool(self._take, length)
+        self._buffer.clear()
+        return docs
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        # Pull a whole batch per threadpool hop instead of one document
+        if not self._buffer:
+            self._buffer.extend(await run_in_threadpool(self._take, self._batch_size))
+            if not self._buffer:
+                raise StopAsyncIteration
+        return self._buffer.popleft()
+
+
+class ThreadedCollection:
+    """Awaitable facade over a pymongo collection, mirroring the Motor API"""
+
+    _CURSOR_METHODS = ("find", "aggregate", "list_indexes")
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name in self._CURSOR_METHODS:
+            return lambda *args, **kwargs: ThreadedCursor(attr(*args, **kwargs))
+        if name == "with_options":
+            return lambda *args, **kwargs: ThreadedCollection(attr(*args, **kwargs))
+        return partial(run_in_threadpool, attr)
+
+
+class ThreadedDatabase:
+    """Awaitable facade over a pymongo database"""
+
+    def __init__(self, database):
+        self._database = database
+
+    def __getitem__(self, name):
+        return ThreadedCollection(self._database[name])
+
+    def __getattr__(self, name):
+        if name == "command":
+            return partial(run_in_threadpool, self._database.command)
+        return self[name]
+
+
+def get_database():
+    """Return the awaitable database handle used by the crud layer"""
+    if USE_ASYNC_DB:
+        return mongo.async_db
+    return ThreadedDatabase(mongo.db)
+
+
+def get_listing_database(primary: bool = False):
+    """Like get_database(), but reads follow LISTING_READ_PREFERENCE.
+
+    For listing, search and export reads that can tolerate replication lag;
+    never write through it or read back a write with it. ``primary`` reads
+    from the primary anyway, for results that outlive the request (response
+    cache fills): a lagging secondary read cached under a freshly bumped
+    version would be served until the next write.
+    """
+    if primary:
+        return get_database()
+    if USE_ASYNC_DB:
+        return mongo.async_listing_db
+    return ThreadedDatabase(mongo.listing_db)
@@ -0,0 +1,183 @@
+import os
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+from app.idempotency.idempotency import COLLECTION as IDEMPOTENCY_COLLECTION, IDEMPOTENCY_TTL_SECONDS
+from app.jobs.jobs import COLLECTION as JOBS_COLLECTION
+from app.warehouses.warehouses import COLLECTION as WAREHOUSE_STOCK_COLLECTION
+
+# Apply the registry in the background when the app starts
+ENSURE_INDEXES_ON_STARTUP = os.getenv("ENSURE_INDEXES_ON_STARTUP", "True").lower() == "true"
+
+# Declarative index registry: collection name -> indexes it must have.
+# create_indexes() is idempotent, so this is safe to apply on every start.
+INDEXES = {
+    "users": [
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+    ],
+    "products": [
+        IndexModel([("sku", ASCENDING)], name="sku_unique", unique=True),
+        # Listing by type, ordered by name (dashboard views)
+        IndexModel([("type", ASCENDING), ("name", ASCENDING), ("_id", ASCENDING)], name="type_name_id"),
+        # Keyset pagination: one (sort key, _id) index per sortable field
+        IndexModel([("name", ASCENDING), ("_id", ASCENDING)], name="name_id"),
+        IndexModel([("sku", ASCENDING), ("_id", ASCENDING)], name="sku_id"),
+        IndexModel([("type", ASCENDING), ("_id", ASCENDING)], name="type_id"),
+        IndexModel([("price", ASCENDING), ("_id", ASCENDING)], name="price_id"),
+        IndexModel([("quantity", ASCENDING), ("_id", ASCENDING)], name="quantity_id"),
+        # Full-text search over name/description
+        IndexModel([("name", TEXT), ("description", TEXT)], name="name_description_text"),
+    ],
+    # Lowest-stock items first on the inventory summary
+    "inventory_low_stock": [
+        IndexModel([("quantity", ASCENDING), ("_id", ASCENDING)], name="quantity_id"),
+    ],
+    # Stock ledger: one product's history, and time-range replays across the catalog
+    "stock_movements": [
+        # t last: point-in-time lookups filter on it from the index keys
+        IndexModel([("p", ASCENDING), ("v", DESCENDING), ("_id", DESCENDING), ("t", ASCENDING)], name="p_v_id_t"),
+        IndexModel([("t", ASCENDING), ("_id", ASCENDING)], name="t_id"),
+    ],
+    "stock_snapshots": [
+        IndexModel([("complete", ASCENDING), ("completed_at", DESCENDING)], name="complete_completed_at"),
+    ],
+    # Multikey over each chunk's product ids
+    "stock_snapshot_items": [
+        IndexModel([("s", ASCENDING), ("p", ASCENDING)], name="s_p"),
+    ],
+    # Stored Idempotency-Key responses expire on their own
+    IDEMPOTENCY_COLLECTION: [
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS),
+    ],
+    # A SKU across all warehouses, answered from the index alone; {sku, w} is also the shard key
+    WAREHOUSE_STOCK_COLLECTION: [
+        IndexModel([("sku", ASCENDING), ("w", ASCENDING), ("q", ASCENDING)], name="sku_w_q"),
+    ],
+    # Durable job queue: next due job, and finished jobs expire at their expires_at
+    JOBS_COLLECTION: [
+        IndexModel([("state", ASCENDING), ("run_after", ASCENDING)], name="state_run_after"),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+}
+
+_SAMPLE_ID = ObjectId("000000000000000000000000")
+KEYSET_QUERY_PREFIX = "keyset_page:"
+
+# Hot-path queries issued by app.crud, as (name, collection, filter, sort),
+# plus a projection for queries that must be covered by their index.
+# The explain check fails if any of them is planned as a collection scan,
+# or if a keyset page (KEYSET_QUERY_PREFIX) needs an in-memory SORT.
+HOT_QUERIES = [
+    ("get_user_by_username", "users", {"username": "__explain__"}, None),
+    ("update_product_quantity", "products", {"_id": _SAMPLE_ID}, None),
+    ("product_by_sku", "products", {"sku": "__explain__"}, None),
+    ("products_by_type", "products", {"type": "__explain__"}, [("name", 1), ("_id", 1)]),
+    (f"{KEYSET_QUERY_PREFIX}_id", "products", {"_id": {"$gt": _SAMPLE_ID}}, [("_id", 1)]),
+    ("filter:low_stock", "products", {"quantity": {"$lt": 10}}, [("quantity", 1), ("_id", 1)]),
+    ("filter:price_range", "products", {"price": {"$gte": 1, "$lte": 100}}, [("price", 1), ("_id", 1)]),
+    ("filter:sku_prefix", "products", {"sku": {"$regex": "^__explain__"}}, None),
+    ("search:text", "products", {"$text": {"$search": "__explain__"}}, None),
+    ("inventory_low_stock", "inventory_low_stock", {}, [("quantity", 1), ("_id", 1)]),
+    ("stock_at:product", "stock_movements", {"p": _SAMPLE_ID, "t": {"$lte": _SAMPLE_ID.generation_time}},
+     [("p", 1), ("v", -1), ("_id", -1)]),
+    ("stock_at:replay", "stock_movements", {"t": {"$gt": _SAMPLE_ID.generation_time}}, None),
+    ("stock_at:snapshot", "stock_snapshot_items", {"s": "__explain__", "p": {"$in": [_SAMPLE_ID]}}, None),
+    ("warehouse_stock:sku", WAREHOUSE_STOCK_COLLECTION, {"sku": "__explain__"}, [("sku", 1), ("w", 1)],
+     {"_id": 0, "w": 1, "q": 1}),
+    ("jobs:claim", JOBS_COLLECTION, {"state": "queued", "run_after": {"$lte": _SAMPLE_ID.generation_time}},
+     [("state", 1), ("run_after", 1)]),
+] + [
+    (f"{KEYSET_QUERY_PREFIX}{key}", "products",
+     {"$or": [{key: {"$gt": 0}}, {key: 0, "_id": {"$gt": _SAMPLE_ID}}]},
+     [(key, 1), ("_id", 1)])
+    for key in ("name", "sku", "type", "price", "quantity")
+]
+
+
+def ensure_indexes(db):
+    """Create every registered index with the blocking driver (CLI use)"""
+    report = []
+    for name, models in INDEXES.items():
+        try:
+            report.append({"collection": name, "indexes": db[name].create_indexes(models), "error": None})
+        except OperationFailure:
+            # e.g. duplicate keys blocking a unique index, or a conflicting spec;
+            # the whole command fails, so build the others one at a time
+            created, errors = [], []
+            for model in models:
+                try:
+                    created += db[name].create_indexes([model])
+                except OperationFailure as err:
+                    errors.append(f"{model.document['name']}: {err}")
+            report.append({"collection": name, "indexes": created, "error": "; ".join(errors) or None})
+    return report
+
+
+async def ensure_indexes_async(db):
+    """Create every registered index through the awaitable crud database handle"""
+    report = []
+    for name, models in INDEXES.items():
+        try:
+            report.append({"collection": name, "indexes": await db[name].create_indexes(models), "error": None})
+        except OperationFailure:
+            created, errors = [], []
+            for model in models:
+                try:
+                    created += await db[name].create_indexes([model])
+                except OperationFailure as err:
+                    errors.append(f"{model.document['name']}: {err}")
+            report.append({"collection": name, "indexes": created, "error": "; ".join(errors) or None})
+    return report
+
+
+def missing_unique_indexes(db):
+    """Registered unique indexes that do not exist, as (collection, index name) pairs.
+
+    The 409 conflict responses rely on them, and building one fails while
+    the collection holds duplicates, so their absence is an error.
+    """
+    missing = []
+    for name, models in INDEXES.items():
+        existing = None
+        for model in models:
+            if not model.document.get("unique"):
+                continue
+            if existing is None:
+                existing = db[name].index_information()
+            if model.document["name"] not in existing:
+                missing.append((name, model.document["name"]))
+    return missing
+
+
+def _plan_stages(plan):
+    """Yield every stage name in an explain() plan tree"""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for key in ("inputStage", "queryPlan", "winningPlan"):
+            if key in plan:
+                yield from _plan_stages(plan[key])
+        for child in plan.get("inputStages", []):
+            yield from _plan_stages(child)
+
+
+def explain_hot_queries(db):
+    """Explain each hot-path query; returns one report row per query"""
+    report = []
+    for name, collection, query, sort, *projection in HOT_QUERIES:
+        cursor = db[collection].find(query, *projection).limit(10)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        stages = list(_plan_stages(plan))
+        report.append({
+            "query": name,
+            "collection": collection,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+            "in_memory_sort": "SORT" in stages,
+            "uncovered": bool(projection) and "FETCH" in stages,
+            # Keyset pages must be read in index order, or every page sorts the rest of the collection
+            "failed": "COLLSCAN" in stages or (name.startswith(KEYSET_QUERY_PREFIX) and "SORT" in stages),
+        })
+    return report
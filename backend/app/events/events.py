@@ -0,0 +1,192 @@
+import asyncio
+import itertools
+import os
+import time
+import orjson
+from app.database.database import USE_ASYNC_DB, mongo
+
+# Where product events come from: "changestream" (MongoDB replica set, sees
+# writes from every worker), "memory" (this process's writes only), or
+# "auto" to use change streams when the server supports them
+PRODUCT_EVENTS_SOURCE = os.getenv("PRODUCT_EVENTS_SOURCE", "auto").lower()
+# Events buffered per subscriber; beyond that the oldest are dropped
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", 256))
+STREAM_MAX_SUBSCRIBERS = int(os.getenv("STREAM_MAX_SUBSCRIBERS", 1000))
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", 15))
+# Delay before reopening a change stream that failed after it was established
+CHANGE_STREAM_RETRY_SECONDS = float(os.getenv("CHANGE_STREAM_RETRY_SECONDS", 2))
+
+_CLOSED = {"type": "stream.closed"}
+
+
+class StreamFull(Exception):
+    """Raised when STREAM_MAX_SUBSCRIBERS are already connected"""
+
+
+class Subscription:
+    """One connected client: a bounded queue plus its type/SKU filters.
+
+    A slow consumer never blocks publishers: when its queue is full the
+    oldest event is dropped and the client is sent a ``stream.lagged`` event
+    with the number of missed events, so it knows to refetch.
+    """
+
+    def __init__(self, types=None, skus=None, maxsize: int = EVENT_QUEUE_SIZE):
+        self.types = set(types or ())
+        self.skus = set(skus or ())
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self.missed = 0
+        self.closed = False
+
+    def matches(self, product: dict):
+        if self.types and product.get("type") not in self.types:
+            return False
+        if self.skus and product.get("sku") not in self.skus:
+            return False
+        return True
+
+    def offer(self, event):
+        """Queue ``event``; returns True if an older event had to be dropped"""
+        dropped = self.queue.full()
+        if dropped:
+            self.queue.get_nowait()
+            self.dropped += 1
+            self.missed += 1
+        self.queue.put_nowait(event)
+        return dropped
+
+    def close(self):
+        self.closed = True
+        while self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(_CLOSED)
+
+    async def next(self, timeout: float = None):
+        """Next event, a lagged notice, or None on timeout or once closed"""
+        if self.missed and not self.closed:
+            missed, self.missed = self.missed, 0
+            return {"type": "stream.lagged", "missed": missed}
+        try:
+            event = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return None if event is _CLOSED else event
+
+
+class EventBroker:
+    """Fans product change events out to stream subscribers in this process"""
+
+    def __init__(self, source: str = PRODUCT_EVENTS_SOURCE):
+        self.requested_source = source
+        self.source = "memory"
+        self.subscribers = set()
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self._ids = itertools.count(1)
+        self._task = None
+
+    def subscribe(self, types=None, skus=None):
+        if len(self.subscribers) >= STREAM_MAX_SUBSCRIBERS:
+            raise StreamFull("Too many stream subscribers")
+        subscription = Subscription(types, skus)
+        self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscribers.discard(subscription)
+
+    def publish(self, kind: str, product: dict):
+        event = {"id": next(self._ids), "type": f"product.{kind}", "ts": time.time(), "product": product}
+        self.published += 1
+        for subscription in list(self.subscribers):
+            if subscription.matches(product):
+                self.dropped += subscription.offer(event)
+                self.delivered += 1
+
+    @property
+    def listening(self):
+        """True when crud writes should emit events (in-process source, someone subscribed)"""
+        return self.source == "memory" and bool(self.subscribers)
+
+    def emit(self, kind: str, product: dict):
+        """Called by the crud write paths; ignored while a change stream is the source"""
+        if self.listening:
+            self.publish(kind, product)
+
+    async def start(self):
+        if self.requested_source == "memory":
+            return
+        if not USE_ASYNC_DB:
+            print("Product change streams need the async driver; using in-process events")
+            return
+        self._task = asyncio.create_task(self._watch())
+
+    async def _watch(self):
+        from app.crud.crud import product_out
+
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+        resume_token = None
+        while True:
+            try:
+                async with mongo.async_db.products.watch(
+                        pipeline, full_document="updateLookup", resume_after=resume_token) as stream:
+                    first = await stream.try_next()
+                    if self.source != "changestream":
+                        print("Product events: using MongoDB change streams")
+                    self.source = "changestream"
+                    change = first
+                    while True:
+                        if change is not None:
+                            resume_token = stream.resume_token
+                            document = change.get("fullDocument")
+                            if document is not None:
+                                self.publish(_change_kind(change), product_out(document))
+                        change = await stream.next()
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                if self.source != "changestream":
+                    # Standalone server or a stand-in without change streams
+                    print(f"Product change streams unavailable ({err}); using in-process events")
+                    return
+                print(f"Product change stream interrupted ({err}); retrying")
+                await asyncio.sleep(CHANGE_STREAM_RETRY_SECONDS)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.source = "memory"
+        # Wake every open stream so its response can finish
+        for subscription in list(self.subscribers):
+            subscription.close()
+
+    def stats(self):
+        return {
+            "source": self.source,
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "queue_size": EVENT_QUEUE_SIZE,
+        }
+
+
+def format_sse(event: dict) -> bytes:
+    """Encode one event as a Server-Sent Events message"""
+    head = f"id: {event['id']}\n" if "id" in event else ""
+    return f"{head}event: {event['type']}\n".encode() + b"data: " + orjson.dumps(event) + b"\n\n"
+
+
+def _change_kind(change):
+    if change["operationType"] == "insert":
+        return "created"
+    updated = set(change.get("updateDescription", {}).get("updatedFields", {}))
+    if "quantity" in updated and updated <= {"quantity", "v"}:
+        return "quantity_updated"
+    return "updated"
+
+
+product_events = EventBroker()
@@ -0,0 +1,126 @@
+import csv
+import io
+import os
+import orjson
+from app.crud import crud
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: only needed for Parquet exports
+    pa = pq = None
+
+# Documents fetched per cursor round trip (and encoded per output chunk)
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+EXPORT_MAX_BATCH_SIZE = int(os.getenv("EXPORT_MAX_BATCH_SIZE", 10000))
+# Rows per Parquet row group; one row group is buffered at a time
+EXPORT_PARQUET_ROW_GROUP = int(os.getenv("EXPORT_PARQUET_ROW_GROUP", 50000))
+
+COLUMNS = ("_id",) + crud.PRODUCT_FIELDS
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+class ExportError(ValueError):
+    """Raised when the requested export cannot be produced"""
+
+
+def check_format(format: str):
+    if format not in FORMATS:
+        raise ExportError(f"Unsupported export format {format!r}; use csv, ndjson or parquet")
+    if format == "parquet" and pa is None:
+        raise ExportError("Parquet export requires pyarrow (pip install pyarrow)")
+
+
+async def _batches(cursor, batch_size: int):
+    """Group an async cursor into lists of ``product_out`` rows"""
+    batch = []
+    async for doc in cursor:
+        batch.append(crud.product_out(doc, rewrite_images=False))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _ndjson(cursor, batch_size):
+    async for batch in _batches(cursor, batch_size):
+        yield b"".join(orjson.dumps(row) + b"\n" for row in batch)
+
+
+async def _csv(cursor, batch_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    async for batch in _batches(cursor, batch_size):
+        writer.writerows([row[column] for column in COLUMNS] for row in batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _Sink(io.RawIOBase):
+    """Write-only file that hands written bytes back to the response stream"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+async def _parquet(cursor, batch_size):
+    schema = pa.schema([
+        ("_id", pa.string()), ("name", pa.string()), ("type", pa.string()), ("sku", pa.string()),
+        ("image_url", pa.string()), ("description", pa.string()),
+        ("quantity", pa.int64()), ("price", pa.float64()),
+    ])
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema)
+    pending = []
+    try:
+        async for batch in _batches(cursor, batch_size):
+            pending.extend(batch)
+            if len(pending) >= EXPORT_PARQUET_ROW_GROUP:
+                writer.write_table(pa.Table.from_pylist(pending, schema=schema))
+                pending = []
+                yield sink.drain()
+        if pending:
+            writer.write_table(pa.Table.from_pylist(pending, schema=schema))
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+_WRITERS = {"csv": _csv, "ndjson": _ndjson, "parquet": _parquet}
+
+
+def stream_products(cursor, format: str, batch_size: int = EXPORT_BATCH_SIZE):
+    """Encode an async cursor of product documents chunk by chunk.
+
+    Only one ``batch_size`` batch (one row group for Parquet) is held in
+    memory at a time, however many documents the cursor yields.
+    """
+    check_format(format)
+    return _WRITERS[format](cursor, batch_size)
@@ -0,0 +1,129 @@
+import asyncio
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+import orjson
+from fastapi import HTTPException, Request, Response, status
+from pymongo.errors import DuplicateKeyError
+from app.cache.responses import dump_json
+from app.database.database import get_database
+
+IDEMPOTENCY_ENABLED = os.getenv("IDEMPOTENCY_ENABLED", "True").lower() == "true"
+# How long a key (and its stored response) can be replayed; enforced by a TTL index
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", 86400))
+# A key still "in progress" after this long belongs to a request that never finished
+IDEMPOTENCY_LOCK_SECONDS = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", 60))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+# Attempts at storing a response once its write has gone through
+COMPLETE_ATTEMPTS = 3
+
+HEADER = "Idempotency-Key"
+COLLECTION = "idempotency_keys"
+
+
+def _fingerprint(request: Request, payload) -> str:
+    """Identifies the request a key was first used for: route plus validated body"""
+    body = orjson.dumps(payload.model_dump(), option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(f"{request.method} {request.url.path}\n".encode() + body).hexdigest()
+
+
+def _replay(record):
+    return Response(record["body"], status_code=record["status_code"], media_type="application/json",
+                    headers={**record.get("headers", {}), "Idempotent-Replayed": "true"})
+
+
+async def _claim(collection, key_id, fingerprint, now):
+    """Reserve ``key_id`` for this request; returns the earlier record if it is taken"""
+    try:
+        await collection.insert_one({"_id": key_id, "fingerprint": fingerprint, "state": "pending",
+                                     "created_at": now})
+        return None
+    except DuplicateKeyError:
+        pass
+    record = await collection.find_one({"_id": key_id})
+    if record is None:
+        # Expired between the insert and the read
+        return await _claim(collection, key_id, fingerprint, now)
+    return record
+
+
+async def run_once(request: Request, user: dict, payload, operation, status_code: int = 200,
+                   headers: dict = None):
+    """Run ``operation`` at most once per ``Idempotency-Key`` header value.
+
+    The first request with a key stores its response (including 4xx
+    errors); repeats with the same body replay it with an
+    ``Idempotent-Replayed: true`` header instead of writing again. Reusing a
+    key for a different body is a 422, and a repeat that arrives while the
+    first is still running is a 409. Without the header ``operation`` just
+    runs. Server errors release the key so the client can retry.
+
+    ``headers`` is filled in by ``operation`` with response headers worth
+    replaying (e.g. a consistency token); they are stored with the body.
+    A key whose request never stored a response stays taken: it may have
+    written before it died, so it is never run again.
+    """
+    key = request.headers.get(HEADER)
+    if not IDEMPOTENCY_ENABLED or key is None:
+        return await operation()
+    if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{HEADER} must be 1-{IDEMPOTENCY_KEY_MAX_LENGTH} characters"
+        )
+
+    collection = get_database()[COLLECTION]
+    # Keys are per user, so clients cannot collide with (or replay) each other
+    key_id = f"{user['username']}:{key}"
+    fingerprint = _fingerprint(request, payload)
+    record = await _claim(collection, key_id, fingerprint, datetime.now(timezone.utc))
+    if record is not None:
+        if record["fingerprint"] != fingerprint:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"{HEADER} was already used for a different request"
+            )
+        if record["state"] != "completed":
+            created_at = record["created_at"].replace(tzinfo=timezone.utc)
+            if datetime.now(timezone.utc) - created_at > timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS):
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="The request with this Idempotency-Key did not finish and may have been applied; "
+                           "check the result before retrying with a new key"
+                )
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A request with this Idempotency-Key is still in progress",
+                headers={"Retry-After": "1"}
+            )
+        return _replay(record)
+
+    try:
+        result = await operation()
+    except HTTPException as e:
+        if e.status_code >= 500:
+            await collection.delete_one({"_id": key_id})
+            raise
+        await _complete(collection, key_id, e.status_code, dump_json({"detail": e.detail}), {})
+        raise
+    except Exception:
+        await collection.delete_one({"_id": key_id})
+        raise
+    body = dump_json(result)
+    await _complete(collection, key_id, status_code, body, headers or {})
+    return Response(body, status_code=status_code, media_type="application/json", headers=headers)
+
+
+async def _complete(collection, key_id, status_code, body, headers):
+    """Store the response for replay. The write has already happened, so a
+    failure here is logged rather than turned into an error response."""
+    for attempt in range(COMPLETE_ATTEMPTS):
+        try:
+            await collection.update_one({"_id": key_id}, {"$set": {
+                "state": "completed", "status_code": status_code, "body": body, "headers": headers}})
+            return
+        except Exception as err:
+            if attempt + 1 == COMPLETE_ATTEMPTS:
+                print(f"Idempotency key {key_id} left pending, response not stored: {err}")
+                return
+            await asyncio.sleep(0.1 * 2 ** attempt)
@@ -0,0 +1,187 @@
+import asyncio
+import csv
+import json
+import os
+import time
+from pydantic import ValidationError
+from app.crud import crud
+from app.schemas import schema
+
+# Rows validated and written per insert_many call
+BULK_INGEST_CHUNK_SIZE = int(os.getenv("BULK_INGEST_CHUNK_SIZE", 1000))
+BULK_INGEST_MAX_CHUNK_SIZE = int(os.getenv("BULK_INGEST_MAX_CHUNK_SIZE", 10000))
+# Per-row error reports kept in the response; further errors are only counted
+BULK_INGEST_MAX_ERRORS = int(os.getenv("BULK_INGEST_MAX_ERRORS", 1000))
+# A single line longer than this is rejected instead of being buffered
+BULK_INGEST_MAX_LINE_BYTES = int(os.getenv("BULK_INGEST_MAX_LINE_BYTES", 1024 * 1024))
+
+FORMATS = {
+    "ndjson": "ndjson",
+    "jsonl": "ndjson",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "csv": "csv",
+    "text/csv": "csv",
+    "application/csv": "csv",
+}
+
+# CSV cells that are empty mean "not provided" for these optional fields
+_OPTIONAL_FIELDS = ("image_url", "description")
+
+
+class IngestError(ValueError):
+    """Raised when the rest of the upload cannot be parsed (reading stops there)"""
+
+
+def resolve_format(format: str = None, content_type: str = None):
+    """Pick the upload format from an explicit ``format`` or the Content-Type"""
+    if format:
+        return FORMATS.get(format.lower())
+    if content_type:
+        return FORMATS.get(content_type.split(";")[0].strip().lower())
+    return None
+
+
+async def iter_lines(chunks):
+    """Split an async stream of byte chunks into decoded lines"""
+    buffer = b""
+    first = True
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        if len(buffer) > BULK_INGEST_MAX_LINE_BYTES:
+            raise IngestError(f"Line longer than {BULK_INGEST_MAX_LINE_BYTES} bytes")
+        for line in lines:
+            yield _decode(line, first)
+            first = False
+    if buffer:
+        yield _decode(buffer, first)
+
+
+def _decode(line: bytes, first: bool):
+    text = line.decode("utf-8-sig" if first else "utf-8")
+    return text[:-1] if text.endswith("\r") else text
+
+
+async def iter_rows(lines, format: str):
+    """Yield ``(row_number, record)`` pairs; ``record`` is a dict or an error message"""
+    if format == "ndjson":
+        row = 0
+        async for line in lines:
+            if not line.strip():
+                continue
+            row += 1
+            try:
+                record = json.loads(line)
+            except ValueError as exc:
+                yield row, f"Invalid JSON: {exc}"
+                continue
+            yield row, record if isinstance(record, dict) else "Row is not a JSON object"
+        return
+
+    header = None
+    pending = ""
+    row = 0
+    async for line in lines:
+        # Quoted cells may contain newlines: wait until the quotes balance
+        pending = f"{pending}\n{line}" if pending else line
+        if pending.count('"') % 2:
+            if len(pending) > BULK_INGEST_MAX_LINE_BYTES:
+                raise IngestError("Unterminated quoted CSV field")
+            continue
+        record, pending = pending, ""
+        if not record.strip():
+            continue
+        cells = next(csv.reader([record]))
+        if header is None:
+            header = [cell.strip() for cell in cells]
+            continue
+        row += 1
+        if len(cells) != len(header):
+            yield row, f"Expected {len(header)} columns, got {len(cells)}"
+            continue
+        values = dict(zip(header, cells))
+        for field in _OPTIONAL_FIELDS:
+            if values.get(field) == "":
+                values[field] = None
+        yield row, values
+    if pending:
+        raise IngestError("Unterminated quoted CSV field")
+
+
+def _validation_message(exc: ValidationError):
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in exc.errors()
+    )
+
+
+async def ingest_products(chunks, format: str, chunk_size: int = BULK_INGEST_CHUNK_SIZE,
+                          max_errors: int = BULK_INGEST_MAX_ERRORS):
+    """Stream-validate products and write them in ``chunk_size`` batches.
+
+    Memory is bounded by one chunk being validated plus one chunk being
+    written: the next chunk is parsed while the previous insert_many runs.
+
+    If the stream itself turns malformed (an overlong line, an unterminated
+    quote, bad UTF-8), reading stops: rows validated before it are still
+    written, the failing row is reported and ``aborted`` says why, so the
+    client knows exactly which rows to resend.
+    """
+    started = time.perf_counter()
+    stats = {"rows": 0, "inserted": 0, "failed": 0, "batches": 0}
+    errors = []
+
+    def report(row, message, sku=None):
+        stats["failed"] += 1
+        if len(errors) < max_errors:
+            errors.append(schema.BulkIngestError(row=row, sku=sku, error=message))
+
+    async def write(batch, rows):
+        inserted, write_errors = await crud.insert_products(batch)
+        stats["inserted"] += inserted
+        stats["batches"] += 1
+        for index, message in write_errors:
+            report(rows[index], message, batch[index].get("sku"))
+
+    in_flight = None
+    batch, rows = [], []
+    aborted = None
+    try:
+        async for row, record in iter_rows(iter_lines(chunks), format):
+            stats["rows"] += 1
+            if isinstance(record, str):
+                report(row, record)
+                continue
+            try:
+                product = schema.ProductCreate(**record)
+            except ValidationError as exc:
+                report(row, _validation_message(exc), record.get("sku"))
+                continue
+            batch.append(product.dict())
+            rows.append(row)
+            if len(batch) >= chunk_size:
+                if in_flight is not None:
+                    await in_flight
+                in_flight = asyncio.ensure_future(write(batch, rows))
+                batch, rows = [], []
+    except (IngestError, UnicodeDecodeError) as exc:
+        # Earlier batches are already committed, so report instead of failing the request
+        aborted = f"Malformed upload: {exc}"
+        stats["rows"] += 1
+        report(stats["rows"], aborted)
+    finally:
+        if in_flight is not None:
+            await in_flight
+    if batch:
+        await write(batch, rows)
+
+    elapsed = time.perf_counter() - started
+    return schema.BulkIngestResponse(
+        **stats,
+        elapsed_seconds=round(elapsed, 3),
+        rows_per_second=round(stats["rows"] / elapsed, 1) if elapsed else 0.0,
+        errors=errors,
+        errors_truncated=stats["failed"] > len(errors),
+        aborted=aborted
+    )
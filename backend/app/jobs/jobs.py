@@ -0,0 +1,331 @@
+import asyncio
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from fastapi import Request, status
+from fastapi.responses import JSONResponse
+from pymongo import ReturnDocument
+from app.crud import crud
+from app.database.database import get_database
+from app.ledger import ledger
+from app.middlewares.middleware import metrics
+
+# "memory" runs jobs in this process only; "mongo" keeps them in the jobs
+# collection, shared by every worker and surviving restarts
+JOBS_BACKEND = os.getenv("JOBS_BACKEND", "memory").lower()
+# Jobs run at once per worker process
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+# Queued jobs allowed before new ones are refused with 503
+JOB_MAX_QUEUE = int(os.getenv("JOB_MAX_QUEUE", 1000))
+# Attempts per job; failures are retried with exponential backoff
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+JOB_RETRY_BACKOFF_SECONDS = float(os.getenv("JOB_RETRY_BACKOFF_SECONDS", 2))
+JOB_RETRY_MAX_BACKOFF_SECONDS = float(os.getenv("JOB_RETRY_MAX_BACKOFF_SECONDS", 300))
+JOB_TIMEOUT_SECONDS = float(os.getenv("JOB_TIMEOUT_SECONDS", 900))
+# How long finished jobs (and their results) can be looked up
+JOB_RESULT_TTL_SECONDS = int(os.getenv("JOB_RESULT_TTL_SECONDS", 86400))
+# mongo backend: how often idle workers look for due jobs
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", 1))
+
+COLLECTION = "jobs"
+# A running mongo job whose worker went away is requeued once this has passed
+JOB_LEASE_SECONDS = JOB_TIMEOUT_SECONDS + 60
+_SWEEP_SECONDS = 30
+_DATES = ("created_at", "run_after", "started_at", "finished_at")
+
+JOB_TYPES = {}
+
+
+class JobQueueFull(Exception):
+    """Raised when JOB_MAX_QUEUE jobs are already waiting; callers should answer 503"""
+
+
+def job_type(name: str, max_attempts: int = None):
+    """Register an async function as a job type; its keyword arguments are the job params"""
+    def register(handler):
+        JOB_TYPES[name] = (handler, max_attempts or JOB_MAX_ATTEMPTS)
+        return handler
+    return register
+
+
+def _utc(value):
+    """Dates read back from MongoDB are naive UTC"""
+    if value is None:
+        return None
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def backoff(attempt: int) -> float:
+    """Delay before retrying after ``attempt`` failures: exponential, capped, with jitter"""
+    delay = min(JOB_RETRY_MAX_BACKOFF_SECONDS, JOB_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class JobRunner:
+    """Runs registered job types in the background with bounded concurrency.
+
+    One dispatcher per process claims due jobs (from an in-memory queue or
+    the jobs collection) and runs up to ``workers`` of them at a time.
+    Failures and timeouts are retried with backoff until ``max_attempts``.
+    With the mongo backend a job started by a worker that dies is picked
+    up again once its lease expires.
+    """
+
+    def __init__(self, backend: str = JOBS_BACKEND, workers: int = JOB_WORKERS, max_queue: int = JOB_MAX_QUEUE):
+        self.backend = backend
+        self.workers = workers
+        self.max_queue = max_queue
+        self.worker_id = None
+        self._jobs = {}
+        self._queue = None
+        self._wake = None
+        self._slots = None
+        self._dispatcher = None
+        self._running = set()
+        self._retries = set()
+        self._pruned_at = 0.0
+        self._swept_at = 0.0
+        self.enqueued = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retried = 0
+        self.rejected = 0
+
+    async def start(self):
+        # Per process, after any worker fork
+        self.worker_id = f"{os.getpid()}:{ObjectId()}"
+        self._queue = asyncio.Queue()
+        self._wake = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def close(self):
+        """Stop dispatching; mongo jobs still running here are handed back to the queue"""
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        for handle in self._retries:
+            handle.cancel()
+        for task in list(self._running):
+            task.cancel()
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+        if self.backend == "mongo" and self.worker_id is not None:
+            try:
+                await get_database()[COLLECTION].update_many(
+                    {"state": "running", "worker": self.worker_id},
+                    {"$set": {"state": "queued", "run_after": datetime.now(timezone.utc)}, "$inc": {"attempts": -1}}
+                )
+            except Exception as err:
+                print(f"Could not requeue running jobs: {err}")
+
+    async def enqueue(self, type: str, params: dict = None, user: str = None):
+        """Queue a job and return its record"""
+        if type not in JOB_TYPES:
+            raise ValueError(f"Unknown job type: {type}")
+        if await self._queued() >= self.max_queue:
+            self.rejected += 1
+            raise JobQueueFull("Job queue is full")
+        now = datetime.now(timezone.utc)
+        record = {
+            "_id": str(ObjectId()),
+            "type": type,
+            "params": params or {},
+            "state": "queued",
+            "attempts": 0,
+            "max_attempts": JOB_TYPES[type][1],
+            "created_at": now,
+            "run_after": now,
+            "started_at": None,
+            "finished_at": None,
+            "duration_seconds": None,
+            "result": None,
+            "error": None,
+            "submitted_by": user,
+        }
+        if self.backend == "mongo":
+            await get_database()[COLLECTION].insert_one(record)
+            self._wake.set()
+        else:
+            self._prune()
+            self._jobs[record["_id"]] = record
+            self._queue.put_nowait(record["_id"])
+        self.enqueued += 1
+        metrics.increment("jobs_enqueued_total", {"type": type})
+        return record
+
+    async def accept(self, request: Request, type: str, params: dict = None, user: dict = None):
+        """Enqueue from a route and answer ``202 Accepted`` pointing at the job's status"""
+        record = await self.enqueue(type, params, user["username"] if user else None)
+        url = request.app.url_path_for("get_job", id=record["_id"])
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={"job_id": record["_id"], "state": record["state"], "status_url": url},
+            headers={"Location": url}
+        )
+
+    async def get(self, job_id: str):
+        """A job's record, or None once it is unknown or expired"""
+        if self.backend == "mongo":
+            record = await get_database()[COLLECTION].find_one({"_id": job_id})
+        else:
+            record = self._jobs.get(job_id)
+        if record is None:
+            return None
+        return {**record, **{field: _utc(record.get(field)) for field in _DATES}}
+
+    async def _queued(self):
+        if self.backend == "mongo":
+            return await get_database()[COLLECTION].count_documents({"state": "queued"}, limit=max(self.max_queue, 1))
+        return self._queue.qsize() + len(self._retries)
+
+    def _prune(self):
+        """Forget finished in-memory jobs past JOB_RESULT_TTL_SECONDS (the TTL index does this in mongo)"""
+        if time.monotonic() - self._pruned_at < 60:
+            return
+        self._pruned_at = time.monotonic()
+        expired = datetime.now(timezone.utc) - timedelta(seconds=JOB_RESULT_TTL_SECONDS)
+        for job_id in [job_id for job_id, record in self._jobs.items()
+                       if record["finished_at"] is not None and record["finished_at"] < expired]:
+            del self._jobs[job_id]
+
+    async def _claim(self):
+        """The next due job, marked running; None after an idle poll"""
+        if self.backend != "mongo":
+            record = self._jobs.get(await self._queue.get())
+            if record is not None:
+                # Stamped once dequeued, not when the worker went idle
+                now = datetime.now(timezone.utc)
+                record.update(state="running", started_at=now, attempts=record["attempts"] + 1)
+            return record
+
+        now = datetime.now(timezone.utc)
+        collection = get_database()[COLLECTION]
+        if time.monotonic() - self._swept_at > _SWEEP_SECONDS:
+            self._swept_at = time.monotonic()
+            # Jobs whose worker died mid-run; attempts already counts that run
+            await collection.update_many({"state": "running", "lease_until": {"$lt": now}},
+                                         {"$set": {"state": "queued", "run_after": now}})
+        record = await collection.find_one_and_update(
+            {"state": "queued", "run_after": {"$lte": now}},
+            {"$set": {"state": "running", "started_at": now, "worker": self.worker_id,
+                      "lease_until": now + timedelta(seconds=JOB_LEASE_SECONDS)},
+             "$inc": {"attempts": 1}},
+            sort=[("state", 1), ("run_after", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if record is None:
+            try:
+                await asyncio.wait_for(self._wake.wait(), JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+        return record
+
+    async def _dispatch(self):
+        while True:
+            await self._slots.acquire()
+            try:
+                record = await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                print(f"Job claim failed: {err}")
+                record = None
+                await asyncio.sleep(JOB_POLL_SECONDS)
+            if record is None:
+                self._slots.release()
+                continue
+            task = asyncio.create_task(self._run(record))
+            self._running.add(task)
+            task.add_done_callback(self._finished)
+
+    def _finished(self, task):
+        self._running.discard(task)
+        self._slots.release()
+
+    async def _save(self, record, **fields):
+        record.update(fields)
+        if self.backend == "mongo":
+            await get_database()[COLLECTION].update_one({"_id": record["_id"], "worker": self.worker_id},
+                                                        {"$set": fields})
+
+    async def _run(self, record):
+        type, attempt = record["type"], record["attempts"]
+        waited = (datetime.now(timezone.utc) - _utc(record["run_after"])).total_seconds()
+        metrics.observe("job_queue_wait_seconds", {"type": type}, max(waited, 0.0))
+        started = time.perf_counter()
+        try:
+            if type not in JOB_TYPES:
+                raise ValueError(f"Unknown job type: {type}")
+            if attempt > record["max_attempts"]:
+                raise RuntimeError("Worker stopped while running the job")
+            handler = JOB_TYPES[type][0]
+            result = await asyncio.wait_for(handler(**record["params"]), JOB_TIMEOUT_SECONDS)
+        except asyncio.CancelledError:
+            raise
+        except Exception as err:
+            seconds = time.perf_counter() - started
+            error = f"Timed out after {JOB_TIMEOUT_SECONDS:g}s" if isinstance(err, asyncio.TimeoutError) \
+                else f"{err.__class__.__name__}: {err}"
+            print(f"Job {record['_id']} ({type}) attempt {attempt} failed: {error}")
+            metrics.observe("job_duration_seconds", {"type": type, "outcome": "error"}, seconds)
+            if type in JOB_TYPES and attempt < record["max_attempts"]:
+                delay = backoff(attempt)
+                self.retried += 1
+                await self._save(record, state="queued", error=error, duration_seconds=round(seconds, 6),
+                                 run_after=datetime.now(timezone.utc) + timedelta(seconds=delay))
+                if self.backend != "mongo":
+                    self._retry_later(record["_id"], delay)
+                return
+            self.failed += 1
+            metrics.increment("jobs_finished_total", {"type": type, "state": "failed"})
+            await self._save(record, state="failed", error=error, duration_seconds=round(seconds, 6),
+                             finished_at=datetime.now(timezone.utc),
+                             expires_at=datetime.now(timezone.utc) + timedelta(seconds=JOB_RESULT_TTL_SECONDS))
+            return
+        seconds = time.perf_counter() - started
+        self.succeeded += 1
+        metrics.observe("job_duration_seconds", {"type": type, "outcome": "success"}, seconds)
+        metrics.increment("jobs_finished_total", {"type": type, "state": "succeeded"})
+        await self._save(record, state="succeeded", result=result, error=None, duration_seconds=round(seconds, 6),
+                         finished_at=datetime.now(timezone.utc),
+                         expires_at=datetime.now(timezone.utc) + timedelta(seconds=JOB_RESULT_TTL_SECONDS))
+
+    def _retry_later(self, job_id, delay):
+        def requeue():
+            self._retries.discard(handle)
+            self._queue.put_nowait(job_id)
+        handle = asyncio.get_running_loop().call_later(delay, requeue)
+        self._retries.add(handle)
+
+    def stats(self):
+        return {
+            "backend": self.backend,
+            "workers": self.workers,
+            "running": len(self._running),
+            # Shared across workers with the mongo backend, so not tracked per process
+            "queued": self._queue.qsize() + len(self._retries) if self._queue is not None else 0,
+            "enqueued": self.enqueued,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retried": self.retried,
+            "rejected": self.rejected,
+        }
+
+
+# Job types
+
+@job_type("inventory.reconcile")
+async def reconcile_inventory(fix: bool = False):
+    return await crud.reconcile_inventory_summary(fix=fix)
+
+
+@job_type("stock.snapshot")
+async def snapshot_stock():
+    return await ledger.take_snapshot()
+
+
+job_runner = JobRunner()
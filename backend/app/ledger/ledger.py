@@ -0,0 +1,264 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import DuplicateKeyError
+from app.database.database import get_database
+
+# Append a stock movement for every product write
+LEDGER_ENABLED = os.getenv("LEDGER_ENABLED", "True").lower() == "true"
+# How often a worker materializes a catalog snapshot (0 = only on demand)
+LEDGER_SNAPSHOT_INTERVAL_SECONDS = int(os.getenv("LEDGER_SNAPSHOT_INTERVAL_SECONDS", 86400))
+# Products per snapshot chunk document
+LEDGER_SNAPSHOT_CHUNK = int(os.getenv("LEDGER_SNAPSHOT_CHUNK", 1000))
+# Completed snapshots to keep (0 = keep all; older point-in-time queries need them)
+LEDGER_SNAPSHOT_KEEP = int(os.getenv("LEDGER_SNAPSHOT_KEEP", 0))
+
+# Movements are compact, one per product change:
+#   {_id, p: product id, v: stock version, t: time, q: quantity after, d: change, k: kind}
+# Every stock write increments the product's ``v`` in the same atomic update
+# (creation is version 0), so v orders a product's movements the way the
+# writes happened; t is stamped afterwards and only places them in time.
+# Snapshots are a header in stock_snapshots plus chunks of parallel arrays
+# in stock_snapshot_items: {s: snapshot id, p: [product ids], q: [quantities]}
+KINDS = {"created": "c", "updated": "u", "batch": "b"}
+_KIND_NAMES = {code: name for name, code in KINDS.items()}
+
+# Movements recorded before versions existed have no v, sort below every
+# versioned one and fall back to insertion order (_id)
+NEWEST_FIRST = [("p", 1), ("v", -1), ("_id", -1)]
+
+
+class InvalidMovementCursor(ValueError):
+    """Raised for a movements page cursor that cannot be decoded"""
+
+
+def _utc(value: datetime):
+    """Stored datetimes come back naive; everything here is UTC"""
+    if value is None:
+        return None
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def _oid(value):
+    return ObjectId(value) if isinstance(value, str) else value
+
+
+async def record_movements(changes: list, kind: str):
+    """Append one movement per ``(before, after)`` product state; one insert per batch.
+
+    ``before`` is None for a newly created product, otherwise the document
+    the write replaced, including its stock version ``v``. Changes that
+    leave the quantity as it was are skipped.
+    """
+    if not LEDGER_ENABLED or not changes:
+        return
+    now = datetime.now(timezone.utc)
+    movements = []
+    for before, after in changes:
+        quantity = after.get("quantity") or 0
+        change = quantity - ((before.get("quantity") or 0) if before is not None else 0)
+        if before is not None and change == 0:
+            continue
+        version = (before.get("v") or 0) + 1 if before is not None else 0
+        movements.append({"p": _oid(after["_id"]), "v": version, "t": now, "q": quantity, "d": change,
+                          "k": KINDS[kind]})
+    if movements:
+        await get_database().stock_movements.insert_many(movements, ordered=False)
+
+
+def _movement_out(doc):
+    return {"at": _utc(doc["t"]), "quantity": doc["q"], "change": doc["d"], "kind": _KIND_NAMES.get(doc["k"], doc["k"])}
+
+
+def encode_movement_cursor(doc) -> str:
+    """Opaque cursor pointing just past ``doc`` in newest-first order"""
+    version = doc.get("v")
+    return f"{'' if version is None else version}-{doc['_id']}"
+
+
+def decode_movement_cursor(cursor: str):
+    try:
+        version, _, movement_id = cursor.partition("-")
+        return (int(version) if version else None), ObjectId(movement_id)
+    except (ValueError, TypeError, InvalidId) as exc:
+        raise InvalidMovementCursor("Malformed movements cursor") from exc
+
+
+async def get_movements(product_id: str, before: datetime = None, cursor: str = None, limit: int = 100):
+    """A product's movements, newest first, optionally only those before ``before``.
+
+    Returns ``(movements, next_cursor)``; pass ``next_cursor`` back as
+    ``cursor`` for the following page. The cursor is a (v, _id) position
+    in write order, so nothing is skipped or repeated at a page boundary.
+    """
+    query = {"p": ObjectId(product_id)}
+    if before is not None:
+        query["t"] = {"$lt": before}
+    if cursor:
+        version, movement_id = decode_movement_cursor(cursor)
+        seek = {"v": None, "_id": {"$lt": movement_id}}
+        if version is not None:
+            seek = {"$or": [{"v": {"$lt": version}}, {"v": None}, {"v": version, "_id": {"$lt": movement_id}}]}
+        query = {"$and": [query, seek]}
+    docs = await get_database().stock_movements.find(query).sort(NEWEST_FIRST).limit(limit).to_list(length=None)
+    next_cursor = encode_movement_cursor(docs[-1]) if len(docs) == limit else None
+    return [_movement_out(doc) for doc in docs], next_cursor
+
+
+async def _latest_snapshot(db, at: datetime):
+    docs = await db.stock_snapshots.find({"complete": True, "completed_at": {"$lte": at}}) \
+        .sort("completed_at", -1).limit(1).to_list(length=None)
+    return docs[0] if docs else None
+
+
+async def _snapshot_quantities(db, snapshot_id, product_ids):
+    """Quantities recorded in a snapshot for the given products"""
+    wanted = set(product_ids)
+    query = {"s": snapshot_id}
+    if len(wanted) <= LEDGER_SNAPSHOT_CHUNK:
+        # Otherwise most chunks match anyway; read them all rather than send a huge $in
+        query["p"] = {"$in": list(wanted)}
+    found = {}
+    async for chunk in db.stock_snapshot_items.find(query):
+        for product, quantity in zip(chunk["p"], chunk["q"]):
+            if product in wanted:
+                found[product] = quantity
+    return found
+
+
+async def get_stock_at(product_id: str, at: datetime):
+    """Stock of one product at ``at``: its last write stamped up to then, else the snapshot value"""
+    db = get_database()
+    product = ObjectId(product_id)
+    docs = await db.stock_movements.find({"p": product, "t": {"$lte": at}}).sort(NEWEST_FIRST).limit(1) \
+        .to_list(length=None)
+    if docs:
+        return {"product_id": product_id, "at": at, "quantity": docs[0]["q"], "source": "movement",
+                "as_of": _utc(docs[0]["t"])}
+    # No movement yet: unchanged since a snapshot (or not created by then)
+    snapshot = await _latest_snapshot(db, at)
+    quantity = None
+    if snapshot is not None:
+        quantity = (await _snapshot_quantities(db, snapshot["_id"], [product])).get(product)
+    return {"product_id": product_id, "at": at, "quantity": quantity,
+            "source": "snapshot" if quantity is not None else None,
+            "as_of": _utc(snapshot["started_at"]) if quantity is not None else None}
+
+
+async def get_catalog_stock_at(at: datetime):
+    """Catalog-wide stock at ``at`` as the latest snapshot plus a bounded replay.
+
+    Only movements between the snapshot's start and ``at`` are read (one
+    indexed range scan, at most one snapshot interval long), then each
+    replayed product's last quantity replaces its snapshot value. Without
+    a snapshot the whole log up to ``at`` is replayed, which counts only
+    products that have moved since the ledger was enabled.
+    """
+    started = time.perf_counter()
+    db = get_database()
+    snapshot = await _latest_snapshot(db, at)
+    window = {"$lte": at}
+    if snapshot is not None:
+        window["$gt"] = snapshot["started_at"]
+    pipeline = [
+        {"$match": {"t": window}},
+        {"$sort": {"p": 1, "v": 1, "_id": 1}},
+        {"$group": {"_id": "$p", "q": {"$last": "$q"}}},
+    ]
+    replayed = {doc["_id"]: doc["q"] for doc in await db.stock_movements.aggregate(pipeline, allowDiskUse=True)
+                .to_list(length=None)}
+
+    products, units = 0, 0
+    if snapshot is not None:
+        products, units = snapshot["products"], snapshot["units"]
+        base = await _snapshot_quantities(db, snapshot["_id"], replayed) if replayed else {}
+        for product, quantity in replayed.items():
+            if product in base:
+                units += quantity - base[product]
+            else:
+                products += 1
+                units += quantity
+    else:
+        products, units = len(replayed), sum(replayed.values())
+    return {
+        "at": at,
+        "products": products,
+        "units": units,
+        "snapshot_at": _utc(snapshot["started_at"]) if snapshot is not None else None,
+        "replayed_products": len(replayed),
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+async def take_snapshot(slot: str = None):
+    """Materialize every product's quantity as a new snapshot.
+
+    ``slot`` names the snapshot so that workers running the periodic job
+    take each slot once; returns None if the slot was already taken.
+    Writes that land during the scan are covered by movements after the
+    snapshot's ``started_at``, which is where replays start.
+    """
+    db = get_database()
+    started_at = datetime.now(timezone.utc)
+    snapshot_id = slot or str(ObjectId())
+    try:
+        await db.stock_snapshots.insert_one({"_id": snapshot_id, "started_at": started_at, "complete": False})
+    except DuplicateKeyError:
+        return None
+
+    products, units, chunk_index = 0, 0, 0
+    ids, quantities = [], []
+    async for doc in db.products.find({}, {"quantity": 1}).sort("_id", 1).batch_size(LEDGER_SNAPSHOT_CHUNK):
+        ids.append(doc["_id"])
+        quantities.append(doc.get("quantity") or 0)
+        if len(ids) >= LEDGER_SNAPSHOT_CHUNK:
+            await db.stock_snapshot_items.insert_one({"s": snapshot_id, "i": chunk_index, "p": ids, "q": quantities})
+            products, units, chunk_index = products + len(ids), units + sum(quantities), chunk_index + 1
+            ids, quantities = [], []
+    if ids:
+        await db.stock_snapshot_items.insert_one({"s": snapshot_id, "i": chunk_index, "p": ids, "q": quantities})
+        products, units = products + len(ids), units + sum(quantities)
+
+    completed_at = datetime.now(timezone.utc)
+    await db.stock_snapshots.update_one({"_id": snapshot_id}, {"$set": {
+        "complete": True, "completed_at": completed_at, "products": products, "units": units}})
+    if LEDGER_SNAPSHOT_KEEP:
+        await prune_snapshots(LEDGER_SNAPSHOT_KEEP)
+    return {"snapshot_id": snapshot_id, "started_at": started_at, "completed_at": completed_at,
+            "products": products, "units": units}
+
+
+async def prune_snapshots(keep: int):
+    """Delete all but the newest ``keep`` completed snapshots (and abandoned ones before them)"""
+    db = get_database()
+    kept = await db.stock_snapshots.find({"complete": True}, {"started_at": 1}) \
+        .sort("started_at", -1).limit(keep).to_list(length=None)
+    if len(kept) < keep:
+        return 0
+    old = [doc["_id"] async for doc in db.stock_snapshots.find({"started_at": {"$lt": kept[-1]["started_at"]}},
+                                                                 {"_id": 1})]
+    if old:
+        await db.stock_snapshot_items.delete_many({"s": {"$in": old}})
+        await db.stock_snapshots.delete_many({"_id": {"$in": old}})
+    return len(old)
+
+
+async def run_periodic_snapshots(interval: int = LEDGER_SNAPSHOT_INTERVAL_SECONDS):
+    """Lifespan task: take one snapshot per interval, shared by all workers"""
+    if not LEDGER_ENABLED or interval <= 0:
+        return
+    while True:
+        now = time.time()
+        slot = datetime.fromtimestamp(now - now % interval, timezone.utc)
+        try:
+            report = await take_snapshot(slot=f"periodic:{slot.isoformat()}")
+            if report is not None:
+                print(f"Stock snapshot {report['snapshot_id']}: {report['products']} products")
+        except asyncio.CancelledError:
+            raise
+        except Exception as err:
+            print(f"Stock snapshot skipped: {err}")
+        await asyncio.sleep(interval - time.time() % interval)
@@ -1,20 +1,85 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from app.routes import users, products
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pymongo import errors
+from app.routes import users, products, inventory, images, jobs, warehouses
+from app.database.database import mongo, get_database
+from app.database import indexes
+from app.auth.auth import password_hasher, token_cache, PasswordHasherBusy
+from app.crud import crud
+from app.cache.responses import product_cache
+from app.events.events import product_events
+from app.images.images import image_pipeline
+from app.jobs.jobs import job_runner, JobQueueFull
+from app.ledger import ledger
+from app.middlewares.middleware import TimingMiddleware, TimedORJSONResponse, metrics
+from app.middlewares import admission
+from app.middlewares.admission import AdmissionControlMiddleware
+import asyncio
 import os
 
+
+async def ensure_inventory_summary():
+    """Check the inventory summary without holding up startup"""
+    try:
+        if await crud.ensure_inventory_summary():
+            print("Inventory summary not built yet; run `python main.py reconcile-inventory --fix`")
+    except Exception as err:
+        print(f"Inventory summary check skipped: {err}")
+
+
+async def ensure_indexes():
+    """Apply the index registry without holding up startup"""
+    try:
+        for entry in await indexes.ensure_indexes_async(get_database()):
+            if entry["error"]:
+                print(f"Index creation failed on {entry['collection']}: {entry['error']}")
+                if "sku_unique" in entry["error"]:
+                    print("products.sku_unique is missing, so duplicate SKUs are accepted; "
+                          "run `python main.py dedupe-skus --fix`, then `python main.py ensure-indexes`")
+    except Exception as err:
+        print(f"Index creation skipped: {err}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Connect to MongoDB per process, after any worker fork"""
+    await mongo.startup()
+    await product_events.start()
+    index_task = asyncio.create_task(ensure_indexes()) if indexes.ENSURE_INDEXES_ON_STARTUP else None
+    summary_task = asyncio.create_task(ensure_inventory_summary())
+    snapshot_task = asyncio.create_task(ledger.run_periodic_snapshots())
+    await job_runner.start()
+    yield
+    await job_runner.close()
+    if index_task is not None:
+        index_task.cancel()
+    summary_task.cancel()
+    snapshot_task.cancel()
+    await product_events.close()
+    await image_pipeline.close()
+    password_hasher.shutdown()
+    mongo.close()
+
+
 # Create FastAPI app with proper metadata
 app = FastAPI(
     title="FIMoney Inventory Management Tool API",
     description="A comprehensive inventory management system API",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=TimedORJSONResponse,
+    lifespan=lifespan
 )
 
 # Configure CORS for production
 origins = os.getenv("ALLOWED_ORIGINS", "http://localhost:5173,http://localhost:3000").split(",")
 
+# Innermost of the three: rejections still get CORS headers and are timed
+app.add_middleware(AdmissionControlMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -23,9 +88,42 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so recorded latencies include CORS handling and error responses
+app.add_middleware(TimingMiddleware)
+
+@app.exception_handler(errors.ConnectionFailure)
+async def database_unavailable_handler(request: Request, exc: errors.ConnectionFailure):
+    """Fail fast with 503 instead of a generic 500 when MongoDB is unreachable"""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Database unavailable"}
+    )
+
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusy):
+    """Shed login/registration bursts early instead of queueing until timeouts"""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Too many concurrent logins, please retry"},
+        headers={"Retry-After": "1"}
+    )
+
+@app.exception_handler(JobQueueFull)
+async def job_queue_full_handler(request: Request, exc: JobQueueFull):
+    """Refuse new background work while the job queue is at JOB_MAX_QUEUE"""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Too many queued jobs, please retry"},
+        headers={"Retry-After": "5"}
+    )
+
 # Include user and product routers
 app.include_router(users.router, prefix="/api/v1", tags=["Authentication"])
 app.include_router(products.router, prefix="/api/v1", tags=["Products"])
+app.include_router(inventory.router, prefix="/api/v1", tags=["Inventory"])
+app.include_router(warehouses.router, prefix="/api/v1", tags=["Warehouses"])
+app.include_router(images.router, prefix="/api/v1", tags=["Images"])
+app.include_router(jobs.router, prefix="/api/v1", tags=["Jobs"])
 
 @app.get("/")
 def read_root():
@@ -38,5 +136,32 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    """Health check endpoint for monitoring"""
-    return {"status": "healthy"} 
\ No newline at end of file
+    """Health check endpoint for monitoring, with pool and cache statistics"""
+    return {
+        "status": "healthy",
+        "database": mongo.stats(),
+        "token_cache": token_cache.stats(),
+        "response_cache": product_cache.stats(),
+        "product_events": product_events.stats(),
+        "admission": admission.stats(),
+        "images": image_pipeline.stats(),
+        "jobs": job_runner.stats(),
+        "password_hashing": password_hasher.stats()
+    } 
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Request latency histograms and pool/cache statistics in Prometheus text format"""
+    return PlainTextResponse(
+        metrics.render({
+            "mongodb_pool": mongo.stats()["pool"],
+            "token_cache": token_cache.stats(),
+            "response_cache": product_cache.stats(),
+            "product_events": product_events.stats(),
+            "admission": admission.stats(),
+            "images": image_pipeline.stats(),
+            "jobs": job_runner.stats(),
+            "password_hashing": password_hasher.stats()
+        }),
+        media_type="text/plain; version=0.0.4"
+    )
@@ -0,0 +1,302 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from app.auth.auth import decode_access_token
+from app.cache.backends import REDIS_KEY_PREFIX, REDIS_URL, create_redis_client
+from app.middlewares.middleware import metrics
+
+ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "True").lower() == "true"
+# Token buckets live in this process ("memory") or are shared by all workers ("redis")
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+# name:METHODS:path-prefix:requests/seconds:key, comma separated. Every
+# matching rule is enforced; key is ip, user (token subject, else ip) or route.
+RATE_LIMIT_RULES = os.getenv(
+    "RATE_LIMIT_RULES",
+    "login:POST:/api/v1/login:10/60:ip,"
+    "register:POST:/api/v1/register:5/60:ip,"
+    "writes:POST|PUT:/api/v1/products:50/1:user,"
+    "reads:GET:/api/v1:200/1:user"
+)
+# name:METHODS:path-prefix:max-in-flight, comma separated (per worker process)
+CONCURRENCY_LIMITS = os.getenv(
+    "CONCURRENCY_LIMITS",
+    "login:POST:/api/v1/login|/api/v1/register:32,"
+    "api:*:/api/v1:512"
+)
+# Long-lived responses that must not hold a concurrency slot
+CONCURRENCY_EXEMPT_PATHS = tuple(p for p in os.getenv(
+    "CONCURRENCY_EXEMPT_PATHS", "/api/v1/products/stream,/api/v1/products/export").split(",") if p)
+# How long a request may wait for a free slot before a 503 (0 = reject at once)
+ADMISSION_QUEUE_TIMEOUT_MS = int(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", 0))
+# Requests allowed to wait per concurrency limit
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 64))
+# Use the first X-Forwarded-For address as the client IP (only behind a trusted proxy)
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "False").lower() == "true"
+# Buckets remembered by the memory backend; idle ones are evicted first
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100000))
+
+
+def _match(methods, prefixes, method, path):
+    return ("*" in methods or method in methods) and any(path.startswith(p) for p in prefixes)
+
+
+class RateRule:
+    def __init__(self, name, methods, prefixes, limit, seconds, key):
+        self.name = name
+        self.methods = methods
+        self.prefixes = prefixes
+        self.capacity = limit
+        self.refill_per_second = limit / seconds
+        self.key = key
+
+    def matches(self, method, path):
+        return _match(self.methods, self.prefixes, method, path)
+
+
+def parse_rate_rules(spec: str):
+    rules = []
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, methods, prefixes, rate, key = entry.split(":")
+        limit, _, seconds = rate.partition("/")
+        if key not in ("ip", "user", "route"):
+            raise ValueError(f"Rate limit rule {name!r}: key must be ip, user or route")
+        rules.append(RateRule(name, set(methods.upper().split("|")), tuple(prefixes.split("|")),
+                              int(limit), float(seconds or 1), key))
+    return rules
+
+
+class MemoryBuckets:
+    """Token buckets in this process, LRU-bounded by RATE_LIMIT_MAX_KEYS"""
+
+    name = "memory"
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def take(self, key, capacity, refill_per_second):
+        """Spend one token; returns ``(allowed, seconds until the next token)``"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_per_second)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (1 - tokens) / refill_per_second
+
+
+# Atomic token bucket: KEYS[1] = bucket; ARGV = capacity, refill/s, now (s)
+_TAKE_SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisBuckets:
+    """Token buckets shared by every worker, updated atomically by a Lua script"""
+
+    name = "redis"
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = REDIS_KEY_PREFIX):
+        self.prefix = prefix + "ratelimit:"
+        self.client = create_redis_client(url)
+        self._take = self.client.register_script(_TAKE_SCRIPT)
+
+    async def take(self, key, capacity, refill_per_second):
+        allowed, tokens = await self._take(keys=[self.prefix + key],
+                                           args=[capacity, refill_per_second, time.time()])
+        tokens = float(tokens)
+        return bool(allowed), 0.0 if allowed else (1 - tokens) / refill_per_second
+
+
+class ConcurrencyLimit:
+    """Caps in-flight requests for a group of routes, with a short optional wait"""
+
+    def __init__(self, name, methods, prefixes, limit):
+        self.name = name
+        self.methods = methods
+        self.prefixes = prefixes
+        self.limit = limit
+        self.in_flight = 0
+        self.waiting = 0
+        self._released = asyncio.Condition()
+
+    def matches(self, method, path):
+        return _match(self.methods, self.prefixes, method, path)
+
+    async def acquire(self, timeout: float, max_queue: int):
+        """Take a slot; returns "admitted", "queued" (admitted after waiting) or None"""
+        if self.in_flight < self.limit:
+            self.in_flight += 1
+            return "admitted"
+        if timeout <= 0 or self.waiting >= max_queue:
+            return None
+        self.waiting += 1
+        try:
+            async with self._released:
+                await asyncio.wait_for(self._released.wait_for(lambda: self.in_flight < self.limit), timeout)
+                self.in_flight += 1
+                return "queued"
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self.waiting -= 1
+
+    async def release(self):
+        self.in_flight -= 1
+        if self.waiting:
+            async with self._released:
+                self._released.notify()
+
+
+def parse_concurrency_limits(spec: str):
+    limits = []
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, methods, prefixes, limit = entry.split(":")
+        limits.append(ConcurrencyLimit(name, set(methods.upper().split("|")), tuple(prefixes.split("|")), int(limit)))
+    return limits
+
+
+def _header(scope, name: bytes):
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def _reject(send, status, detail, retry_after):
+    body = ('{"detail":"%s"}' % detail).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+_active = []
+
+
+def stats():
+    """In-flight and waiting requests across the app's admission controllers"""
+    return {
+        "in_flight": sum(limit.in_flight for controller in _active for limit in controller.limits),
+        "waiting": sum(limit.waiting for controller in _active for limit in controller.limits),
+    }
+
+
+class AdmissionControlMiddleware:
+    """Rejects excess load before it reaches routes, bcrypt or MongoDB.
+
+    Rate limits (token buckets) answer 429 with Retry-After; concurrency
+    caps answer 503 once a route group's in-flight limit and wait queue
+    are full. Every decision is counted on /metrics under
+    ``admission_requests_total{rule, outcome}``. If the shared bucket store
+    is unreachable, requests are admitted (fail open) and counted as errors.
+    """
+
+    def __init__(self, app, rate_rules: str = RATE_LIMIT_RULES, concurrency_limits: str = CONCURRENCY_LIMITS,
+                 backend: str = RATE_LIMIT_BACKEND):
+        self.app = app
+        self.rules = parse_rate_rules(rate_rules)
+        self.limits = parse_concurrency_limits(concurrency_limits)
+        self.buckets = RedisBuckets() if backend == "redis" else MemoryBuckets()
+        _active.append(self)
+
+    def _client_ip(self, scope):
+        if TRUST_FORWARDED_FOR:
+            forwarded = _header(scope, b"x-forwarded-for")
+            if forwarded:
+                return forwarded.split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    def _subject(self, scope, ip):
+        authorization = _header(scope, b"authorization")
+        if authorization and authorization.lower().startswith("bearer "):
+            payload = decode_access_token(authorization[7:])
+            if payload and payload.get("sub"):
+                return f"user:{payload['sub']}"
+        return f"ip:{ip}"
+
+    async def _rate_limited(self, scope, method, path):
+        """Name and retry delay of the first rule that rejects, else None"""
+        ip = subject = None
+        for rule in self.rules:
+            if not rule.matches(method, path):
+                continue
+            if rule.key == "route":
+                identity = "route"
+            else:
+                ip = ip or self._client_ip(scope)
+                if rule.key == "ip":
+                    identity = f"ip:{ip}"
+                else:
+                    subject = subject or self._subject(scope, ip)
+                    identity = subject
+            try:
+                allowed, retry_after = await self.buckets.take(
+                    f"{rule.name}:{identity}", rule.capacity, rule.refill_per_second)
+            except Exception:
+                metrics.increment("admission_requests_total", {"rule": rule.name, "outcome": "backend_error"})
+                continue
+            if not allowed:
+                return rule.name, retry_after
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMISSION_CONTROL_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        method, path = scope["method"], scope["path"]
+        if method == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        limited = await self._rate_limited(scope, method, path)
+        if limited is not None:
+            rule, retry_after = limited
+            metrics.increment("admission_requests_total", {"rule": rule, "outcome": "rate_limited"})
+            await _reject(send, 429, "Too many requests, please retry later", retry_after)
+            return
+
+        limit = None
+        if not path.startswith(CONCURRENCY_EXEMPT_PATHS):
+            limit = next((candidate for candidate in self.limits if candidate.matches(method, path)), None)
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        outcome = await limit.acquire(ADMISSION_QUEUE_TIMEOUT_MS / 1000, ADMISSION_MAX_QUEUE)
+        metrics.increment("admission_requests_total", {"rule": limit.name, "outcome": outcome or "overloaded"})
+        if outcome is None:
+            await _reject(send, 503, "Server busy, please retry", 1)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            await limit.release()
@@ -1 +1,239 @@
- 
\ No newline at end of file
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from fastapi.responses import ORJSONResponse
+from pymongo import monitoring
+
+# Record request timings and serve them on /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True").lower() == "true"
+# Add a Server-Timing header (auth/mongo/hash/serialize/total) to every response
+SERVER_TIMING = os.getenv("SERVER_TIMING", "False").lower() == "true"
+# Histogram bucket upper bounds, in seconds
+METRICS_BUCKETS = tuple(float(b) for b in os.getenv(
+    "METRICS_BUCKETS", "0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10").split(","))
+
+# Phase name -> seconds spent in it, for the request being handled.
+# Mutated in place, so updates made in Motor's executor threads and in
+# run_in_threadpool (both copy the context) are visible to the middleware.
+_phases: ContextVar[dict] = ContextVar("request_phases", default=None)
+
+
+@contextmanager
+def timed(phase: str):
+    """Add the time spent in the block to ``phase`` of the current request"""
+    phases = _phases.get()
+    if phases is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases[phase] = phases.get(phase, 0.0) + time.perf_counter() - started
+
+
+def add_time(phase: str, seconds: float):
+    phases = _phases.get()
+    if phases is not None:
+        phases[phase] = phases.get(phase, 0.0) + seconds
+
+
+class TimedORJSONResponse(ORJSONResponse):
+    """ORJSONResponse that charges rendering to the ``serialize`` phase"""
+
+    def render(self, content) -> bytes:
+        with timed("serialize"):
+            return super().render(content)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus layout"""
+
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            yield f"{name}_bucket{_labels({**labels, 'le': le})} {cumulative}"
+        yield f"{name}_sum{_labels(labels)} {self.sum:.6f}"
+        yield f"{name}_count{_labels(labels)} {self.count}"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+class Metrics(monitoring.CommandListener):
+    """Request and MongoDB command metrics for this process.
+
+    Also a pymongo command listener: every command's server round trip is
+    recorded per command name and charged to the ``mongo`` phase of the
+    request that issued it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.in_flight = 0
+            self.requests = {}
+            self.durations = {}
+            self.phases = {}
+            self.commands = {}
+            self.command_failures = {}
+            self.counters = {}
+            self.histograms = {}
+
+    def increment(self, name, labels, amount=1):
+        """Bump a labelled counter, rendered on /metrics as ``name{labels}``"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, labels, seconds):
+        """Record a duration in a labelled histogram, rendered on /metrics as ``name_bucket{labels}``"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.histograms.setdefault(key, Histogram()).observe(seconds)
+
+    def observe_request(self, method, route, status, seconds, phases):
+        with self._lock:
+            key = (method, route, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.durations.setdefault((method, route), Histogram()).observe(seconds)
+            for phase, spent in phases.items():
+                self.phases.setdefault((method, route, phase), Histogram()).observe(spent)
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        seconds = event.duration_micros / 1_000_000
+        add_time("mongo", seconds)
+        with self._lock:
+            self.commands.setdefault(event.command_name, Histogram()).observe(seconds)
+
+    def failed(self, event):
+        seconds = event.duration_micros / 1_000_000
+        add_time("mongo", seconds)
+        with self._lock:
+            self.commands.setdefault(event.command_name, Histogram()).observe(seconds)
+            self.command_failures[event.command_name] = self.command_failures.get(event.command_name, 0) + 1
+
+    def render(self, gauges=None):
+        """Prometheus text exposition; ``gauges`` maps a prefix to a stats dict"""
+        lines = [
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+            "# TYPE http_requests_total counter",
+        ]
+        with self._lock:
+            for (method, route, status), count in sorted(self.requests.items()):
+                lines.append(f"http_requests_total{_labels({'method': method, 'route': route, 'status': status})} {count}")
+            lines.append("# TYPE http_request_duration_seconds histogram")
+            for (method, route), histogram in sorted(self.durations.items()):
+                lines.extend(histogram.samples("http_request_duration_seconds", {"method": method, "route": route}))
+            lines.append("# TYPE http_request_phase_seconds histogram")
+            for (method, route, phase), histogram in sorted(self.phases.items()):
+                lines.extend(histogram.samples("http_request_phase_seconds",
+                                               {"method": method, "route": route, "phase": phase}))
+            lines.append("# TYPE mongodb_command_duration_seconds histogram")
+            for command, histogram in sorted(self.commands.items()):
+                lines.extend(histogram.samples("mongodb_command_duration_seconds", {"command": command}))
+            lines.append("# TYPE mongodb_command_failures_total counter")
+            for command, count in sorted(self.command_failures.items()):
+                lines.append(f"mongodb_command_failures_total{_labels({'command': command})} {count}")
+            declared = set()
+            for (name, labels), count in sorted(self.counters.items()):
+                if name not in declared:
+                    declared.add(name)
+                    lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name}{_labels(dict(labels))} {count}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in declared:
+                    declared.add(name)
+                    lines.append(f"# TYPE {name} histogram")
+                lines.extend(histogram.samples(name, dict(labels)))
+        for prefix, stats in (gauges or {}).items():
+            for key, value in stats.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                lines.append(f"# TYPE {prefix}_{key} gauge")
+                lines.append(f"{prefix}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class TimingMiddleware:
+    """ASGI middleware recording latency per route template and per phase.
+
+    Routes are labelled by their path template (``/api/v1/products/{id}``),
+    never the raw path, so the number of series stays bounded.
+    """
+
+    def __init__(self, app, server_timing: bool = SERVER_TIMING):
+        self.app = app
+        self.server_timing = server_timing
+        self._templates = {}
+
+    def _route(self, scope):
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if endpoint not in self._templates:
+            self._templates[endpoint] = next(
+                (route.path for route in scope["app"].routes if getattr(route, "endpoint", None) is endpoint),
+                "unmatched")
+        return self._templates[endpoint]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        phases = {}
+        token = _phases.set(phases)
+        started = time.perf_counter()
+        status = 500
+        metrics.in_flight += 1
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    total = time.perf_counter() - started
+                    header = ", ".join(
+                        [f"{phase};dur={spent * 1000:.2f}" for phase, spent in phases.items()]
+                        + [f"total;dur={total * 1000:.2f}"])
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            metrics.in_flight -= 1
+            _phases.reset(token)
+            metrics.observe_request(scope["method"], self._route(scope), status,
+                                    time.perf_counter() - started, phases)
@@ -1,10 +1,11 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 
 class User(BaseModel):
     id: Optional[str] = Field(None, alias="_id")
     username: str
     password: str
+    roles: List[str] = Field(default_factory=lambda: ["user"])
 
 class Product(BaseModel):
     id: Optional[str] = Field(None, alias="_id")
@@ -0,0 +1,46 @@
+from fastapi import APIRouter, HTTPException, Query, status
+from fastapi.responses import FileResponse
+from app.images.images import (
+    IMAGE_PIPELINE_ENABLED, IMAGE_VARIANTS, ImageNotFound, ImagePipelineBusy, ImageSourceBlocked, ImageSourceError,
+    ImageUnreadable, cache_control, classify_source, image_pipeline, verify
+)
+
+router = APIRouter()
+
+@router.get("/images/{variant}/{signature}")
+async def get_image(variant: str, signature: str, src: str = Query(..., description="Original image_url")):
+    """Serve a resized product image from the disk cache, generating it on first request.
+
+    Public (for ``<img>`` tags) but only for URLs the API handed out: the
+    signature covers ``src``, so it cannot be used as an open proxy.
+    """
+    if not IMAGE_PIPELINE_ENABLED or variant not in IMAGE_VARIANTS or not verify(src, signature) \
+            or classify_source(src)[0] is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Image not found"
+        )
+    try:
+        path, media_type = await image_pipeline.variant(src, variant)
+    except ImagePipelineBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Image processing is busy, please retry",
+            headers={"Retry-After": "1"}
+        )
+    except (ImageNotFound, ImageSourceBlocked) as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except ImageUnreadable as e:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=str(e)
+        )
+    except ImageSourceError as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=str(e)
+        )
+    return FileResponse(path, media_type=media_type, headers={"Cache-Control": cache_control(src)})
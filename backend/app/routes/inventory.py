@@ -0,0 +1,146 @@
+from datetime import datetime, timezone
+from typing import Optional
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from app.schemas import schema
+from app.crud import crud
+from app.ledger import ledger
+from app.jobs.jobs import job_runner
+from app.cache.responses import product_cache, dump_json
+from app.auth.dependencies import get_current_user
+
+router = APIRouter()
+
+@router.get("/inventory/summary", response_model=schema.InventorySummaryResponse)
+async def get_inventory_summary(
+    request: Request,
+    low_stock_limit: int = Query(crud.INVENTORY_LOW_STOCK_LIMIT, ge=0, le=1000),
+    user=Depends(get_current_user)
+):
+    """Inventory value and units per type plus the low-stock list, from precomputed totals"""
+    cache_key, cached = await product_cache.lookup(request)
+    if cached is not None:
+        return cached
+    try:
+        summary = await crud.get_inventory_summary(low_stock_limit)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to load inventory summary"
+        )
+    return await product_cache.store(request, cache_key, dump_json(summary))
+
+@router.post("/inventory/summary/reconcile", response_model=schema.InventoryReconcileResponse,
+             responses={202: {"model": schema.JobAccepted}})
+async def reconcile_inventory_summary(
+    request: Request,
+    fix: bool = Query(False, description="Rewrite the summary when drift is found"),
+    background: bool = Query(False, description="Run as a background job and answer 202 with its status URL"),
+    user=Depends(get_current_user)
+):
+    """Recompute the summary from the products collection (full scan) and report drift"""
+    if background:
+        return await job_runner.accept(request, "inventory.reconcile", {"fix": fix}, user)
+    try:
+        return await crud.reconcile_inventory_summary(fix=fix)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to reconcile inventory summary"
+        )
+
+def _point_in_time(at: Optional[datetime]):
+    """Query times are UTC unless they carry an offset; the default is now"""
+    if at is None:
+        return datetime.now(timezone.utc)
+    return at.replace(tzinfo=timezone.utc) if at.tzinfo is None else at
+
+def _product_id(id: str):
+    try:
+        ObjectId(id)
+    except (InvalidId, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found"
+        )
+    return id
+
+@router.get("/inventory/stock", response_model=schema.CatalogStockAt)
+async def get_catalog_stock(
+    at: Optional[datetime] = Query(None, description="Point in time (ISO 8601, UTC by default); defaults to now"),
+    user=Depends(get_current_user)
+):
+    """Catalog-wide units and product count at a point in time (latest snapshot + replay)"""
+    try:
+        return await ledger.get_catalog_stock_at(_point_in_time(at))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to compute catalog stock"
+        )
+
+@router.get("/inventory/stock/{id}", response_model=schema.ProductStockAt)
+async def get_product_stock(
+    id: str,
+    at: Optional[datetime] = Query(None, description="Point in time (ISO 8601, UTC by default); defaults to now"),
+    user=Depends(get_current_user)
+):
+    """One product's quantity at a point in time; ``quantity`` is null if it did not exist yet"""
+    try:
+        return await ledger.get_stock_at(_product_id(id), _point_in_time(at))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to compute product stock"
+        )
+
+@router.get("/inventory/movements/{id}", response_model=schema.StockMovementsResponse)
+async def get_product_movements(
+    id: str,
+    before: Optional[datetime] = Query(None, description="Only movements before this time"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(100, ge=1, le=1000),
+    user=Depends(get_current_user)
+):
+    """A product's stock movements, newest first, for audits"""
+    try:
+        movements, next_cursor = await ledger.get_movements(_product_id(id), before and _point_in_time(before),
+                                                            cursor, limit)
+    except ledger.InvalidMovementCursor as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to load stock movements"
+        )
+    return {
+        "product_id": id,
+        "movements": movements,
+        "next_cursor": next_cursor,
+    }
+
+@router.post("/inventory/snapshots", response_model=schema.StockSnapshot, status_code=201,
+             responses={202: {"model": schema.JobAccepted}})
+async def take_stock_snapshot(
+    request: Request,
+    background: bool = Query(False, description="Run as a background job and answer 202 with its status URL"),
+    user=Depends(get_current_user)
+):
+    """Materialize current stock now, so point-in-time queries replay less"""
+    if background:
+        return await job_runner.accept(request, "stock.snapshot", user=user)
+    try:
+        return await ledger.take_snapshot()
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to take stock snapshot"
+        )
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from app.schemas import schema
+from app.jobs.jobs import job_runner
+from app.auth.dependencies import get_current_user
+
+router = APIRouter()
+
+@router.get("/jobs/{id}", response_model=schema.JobOut)
+async def get_job(id: str, user=Depends(get_current_user)):
+    """Status of a background job (state, attempts, timing and its result once finished)"""
+    try:
+        job = await job_runner.get(id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to load job"
+        )
+    # Jobs are visible to the user who submitted them
+    if job is None or job["submitted_by"] != user["username"]:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return job
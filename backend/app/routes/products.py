@@ -1,53 +1,373 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+import math
+import os
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional, Union
+from pymongo.errors import DuplicateKeyError
 from app.schemas import schema
 from app.crud import crud
-from app.auth.dependencies import get_current_user
+from app.ingest import ingest
+from app.export import export
+from app.idempotency.idempotency import run_once
+from app.images import images
+from app.cache.responses import product_cache, dump_json
+from app.database.database import CONSISTENCY_HEADER, consistency_token, mongo
+from app.auth.dependencies import get_current_user, get_stream_user
+from app.events.events import STREAM_HEARTBEAT_SECONDS, StreamFull, format_sse, product_events
 
 router = APIRouter()
 
+QUANTITY_BATCH_MAX_OPERATIONS = int(os.getenv("QUANTITY_BATCH_MAX_OPERATIONS", 5000))
+
 @router.post("/products", response_model=dict, status_code=201)
-def add_product(product: schema.ProductCreate, user=Depends(get_current_user)):
-    """Add a new product to inventory"""
+async def add_product(product: schema.ProductCreate, request: Request, user=Depends(get_current_user)):
+    """Add a new product to inventory.
+
+    Send an ``Idempotency-Key`` header to make retries safe: a repeat
+    replays the first response instead of creating another product.
+    """
+    async def create():
+        try:
+            db_product = await crud.create_product(product)
+            return {
+                "product_id": db_product["_id"], 
+                "message": "Product added successfully"
+            }
+        except DuplicateKeyError:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A product with this SKU already exists"
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to create product"
+            )
+    return await run_once(request, user, product, create, status_code=201)
+
+@router.post("/products/bulk", response_model=schema.BulkIngestResponse)
+async def bulk_ingest_products(
+    request: Request,
+    response: Response,
+    format: Optional[str] = Query(None, description="ndjson or csv; defaults to the Content-Type"),
+    chunk_size: int = Query(ingest.BULK_INGEST_CHUNK_SIZE, ge=1, le=ingest.BULK_INGEST_MAX_CHUNK_SIZE),
+    user=Depends(get_current_user)
+):
+    """Bulk-load products from a streamed NDJSON or CSV request body.
+
+    Rows are validated as ``ProductCreate`` and inserted unordered in
+    ``chunk_size`` batches; invalid rows and write failures are reported
+    per row without aborting the upload. A body that becomes unreadable
+    part way stops there with 207 and the partial stats (``aborted``).
+    """
+    upload_format = ingest.resolve_format(format, request.headers.get("content-type"))
+    if upload_format is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Upload must be NDJSON (application/x-ndjson) or CSV (text/csv)"
+        )
+    result = await ingest.ingest_products(request.stream(), upload_format, chunk_size=chunk_size)
+    if result.aborted:
+        response.status_code = status.HTTP_207_MULTI_STATUS
+    return result
+
+@router.post("/products/quantities:batch", response_model=schema.QuantityBatchResponse)
+async def batch_update_quantities(payload: schema.QuantityBatchRequest, user=Depends(get_current_user)):
+    """Apply many stock movements (``delta`` or absolute ``set``) in one round trip"""
+    if len(payload.operations) > QUANTITY_BATCH_MAX_OPERATIONS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {QUANTITY_BATCH_MAX_OPERATIONS} operations per batch"
+        )
     try:
-        db_product = crud.create_product(product)
-        return {
-            "product_id": db_product["_id"], 
-            "message": "Product added successfully"
-        }
+        outcomes = await crud.apply_quantity_operations(payload.operations, payload.allow_negative)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to create product"
+            detail="Failed to apply quantity operations"
         )
+    results = [
+        schema.QuantityOperationResult(index=index, status=outcome, product=product)
+        for index, (outcome, product) in enumerate(outcomes)
+    ]
+    applied = sum(1 for r in results if r.status == "applied")
+    return schema.QuantityBatchResponse(applied=applied, failed=len(results) - applied, results=results)
 
 @router.put("/products/{id}/quantity", response_model=schema.ProductOut)
-def update_quantity(id: str, payload: schema.ProductUpdate, user=Depends(get_current_user)):
-    """Update product quantity"""
-    try:
-        updated_product = crud.update_product_quantity(id, payload.quantity)
-        if not updated_product:
+async def update_quantity(
+    id: str,
+    payload: schema.ProductUpdate,
+    request: Request,
+    response: Response,
+    user=Depends(get_current_user)
+):
+    """Update product quantity (``Idempotency-Key`` supported, as for POST /products).
+
+    On a replica set the response carries an ``X-Consistency-Token``; send it
+    back on listing requests to be sure they include this change.
+    """
+    headers = {}
+
+    async def update():
+        try:
+            async with mongo.causal_session() as session:
+                updated_product = await crud.update_product_quantity(id, payload.quantity, session=session)
+            token = consistency_token(session)
+            if token:
+                headers[CONSISTENCY_HEADER] = token
+            if not updated_product:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND, 
+                    detail="Product not found"
+                )
+            return updated_product
+        except HTTPException:
+            raise
+        except Exception as e:
             raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, 
-                detail="Product not found"
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to update product quantity"
             )
-        return updated_product
-    except HTTPException:
-        raise
+    result = await run_once(request, user, payload, update, headers=headers)
+    if not isinstance(result, Response):
+        response.headers.update(headers)
+    return result
+
+@router.put("/products/{id}/image", response_model=schema.ProductOut)
+async def upload_product_image(id: str, request: Request, user=Depends(get_current_user)):
+    """Upload a product image as the raw request body (JPEG, PNG, WebP or GIF).
+
+    The original is stored once; resized variants are generated in the
+    background and ``image_url`` is returned pointing at one of them.
+    """
+    content_type = (request.headers.get("content-type") or "").split(";")[0].strip().lower()
+    if content_type not in images.UPLOAD_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Upload must be one of {', '.join(images.UPLOAD_TYPES)}"
+        )
+    limit = int(images.IMAGE_MAX_SOURCE_MB * 2**20)
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > limit:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Images are limited to {images.IMAGE_MAX_SOURCE_MB:g} MB"
+            )
+    if not body:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Empty image upload"
+        )
+    try:
+        source = await run_in_threadpool(images.store_upload, bytes(body), content_type)
+        product = await crud.update_product_image(id, source)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to store product image"
+        )
+    if product is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found"
+        )
+    return product
+
+async def listing_session(request: Request):
+    """Causal session for a listing read sent with an ``X-Consistency-Token``, else None"""
+    token = request.headers.get(CONSISTENCY_HEADER)
+    if not token:
+        yield None
+        return
+    async with mongo.causal_session(token) as session:
+        yield session
+
+def product_filters(
+    type: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    min_quantity: Optional[int] = None,
+    max_quantity: Optional[int] = None,
+    low_stock: bool = Query(False, description="Only products below LOW_STOCK_THRESHOLD"),
+    sku_prefix: Optional[str] = None,
+    q: Optional[str] = Query(None, description="Full-text search over name and description")
+):
+    """Shared listing filters, translated once into a MongoDB query"""
+    return crud.build_product_query(
+        type=type, min_price=min_price, max_price=max_price,
+        min_quantity=min_quantity, max_quantity=max_quantity,
+        low_stock=low_stock, sku_prefix=sku_prefix, q=q
+    )
+
+@router.get("/products/facets", response_model=schema.ProductFacetsResponse)
+async def get_product_facets(
+    request: Request,
+    query: dict = Depends(product_filters),
+    session=Depends(listing_session),
+    user=Depends(get_current_user)
+):
+    """Counts per type and low-stock count for the filtered catalog, in one aggregation"""
+    # Reads with a consistency token bypass the cache, which may predate the client's write
+    cache_key, cached = await product_cache.lookup(request) if session is None else (None, None)
+    if cached is not None:
+        return cached
+    try:
+        # Cache fills read the primary so a lagging secondary is never cached
+        facets = await crud.get_product_facets(query, session=session, primary=cache_key is not None)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to update product quantity"
+            detail="Failed to compute product facets"
+        )
+    return await product_cache.store(request, cache_key, dump_json(facets))
+
+@router.get("/products/export")
+async def export_products(
+    format: str = Query("csv", description="csv, ndjson or parquet (needs pyarrow)"),
+    batch_size: int = Query(export.EXPORT_BATCH_SIZE, ge=1, le=export.EXPORT_MAX_BATCH_SIZE),
+    query: dict = Depends(product_filters),
+    user=Depends(get_current_user)
+):
+    """Stream the (filtered) catalog as a file download in constant memory.
+
+    Documents come from a server-side cursor ``batch_size`` at a time and
+    are encoded and sent batch by batch; accepts the same filters as
+    GET /products.
+    """
+    format = format.lower()
+    try:
+        export.check_format(format)
+    except export.ExportError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
         )
+    media_type, extension = export.FORMATS[format]
+    cursor = crud.iter_products(query, batch_size)
+    return StreamingResponse(
+        export.stream_products(cursor, format, batch_size),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="products.{extension}"'}
+    )
+
+@router.get("/products/stream")
+async def stream_products(
+    type: Optional[str] = Query(None, description="Comma separated product types to follow"),
+    sku: Optional[str] = Query(None, description="Comma separated SKUs to follow"),
+    user=Depends(get_stream_user)
+):
+    """Server-Sent Events feed of product creations and stock changes.
 
-@router.get("/products", response_model=List[schema.ProductOut])
-def get_products(skip: int = 0, limit: int = 10, user=Depends(get_current_user)):
-    """Get list of products with pagination"""
+    Replaces polling GET /products: each event carries the changed product.
+    A ``stream.lagged`` event means this client fell behind and missed
+    events, so it should refetch what it shows.
+    """
+    split = lambda value: [part.strip() for part in value.split(",") if part.strip()] if value else None
     try:
-        products = crud.get_products(skip=skip, limit=limit)
-        return products
+        subscription = product_events.subscribe(types=split(type), skus=split(sku))
+    except StreamFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many open streams, please retry",
+            headers={"Retry-After": "5"}
+        )
+
+    async def events():
+        try:
+            yield b"retry: 3000\n\n"
+            while not subscription.closed:
+                event = await subscription.next(timeout=STREAM_HEARTBEAT_SECONDS)
+                # Comment lines keep proxies from timing out idle streams
+                yield format_sse(event) if event is not None else b": keepalive\n\n"
+        finally:
+            product_events.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/products", response_model=Union[List[schema.ProductOut], schema.ProductListResponse])
+async def get_products(
+    request: Request,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    sort: str = "_id",
+    query: dict = Depends(product_filters),
+    session=Depends(listing_session),
+    user=Depends(get_current_user)
+):
+    """Get list of products with pagination and optional server-side filters.
+
+    Without ``cursor`` this is the legacy skip/limit listing returning a plain
+    list. Passing ``cursor`` (empty for the first page) switches to keyset
+    pagination and returns a ``ProductListResponse`` whose
+    ``pagination.next_cursor`` fetches the following page.
+
+    Responses are cached until the next product write and carry an ETag;
+    a matching ``If-None-Match`` gets an empty 304.
+
+    Reads may be served by a secondary. Send the ``X-Consistency-Token`` of
+    a previous write to read your own writes (such requests skip the cache).
+    """
+    cache_key, cached = await product_cache.lookup(request) if session is None else (None, None)
+    if cached is not None:
+        return cached
+    # Cache fills read the primary so a lagging secondary is never cached
+    primary = cache_key is not None
+    try:
+        if cursor is None:
+            products = await crud.get_products(skip=skip, limit=limit, query=query, session=session, primary=primary)
+            body = dump_json(products)
+            return await product_cache.store(request, cache_key, body)
+        products, next_cursor, page = await crud.get_products_page(cursor=cursor, limit=limit, sort=sort, query=query,
+                                                                   session=session, primary=primary)
+        total = await crud.get_total_products_count(query, session=session, primary=primary)
+        pagination = schema.PaginationInfo(
+            total=total,
+            page=page,
+            per_page=limit,
+            total_pages=math.ceil(total / limit) if limit else 0,
+            has_next=next_cursor is not None,
+            has_prev=page > 1,
+            next_page=page + 1 if next_cursor else None,
+            prev_page=page - 1 if page > 1 else None,
+            next_cursor=next_cursor
+        )
+        body = dump_json({"products": products, "pagination": pagination.model_dump()})
+        return await product_cache.store(request, cache_key, body)
+    except crud.InvalidPagination as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to retrieve products"
-        ) 
\ No newline at end of file
+        )
+
+@router.get("/products/{id}", response_model=schema.ProductOut)
+async def get_product(id: str, request: Request, user=Depends(get_current_user)):
+    """Get a single product (cached, with ETag support)"""
+    cache_key, cached = await product_cache.lookup(request)
+    if cached is not None:
+        return cached
+    try:
+        product = await crud.get_product(id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve product"
+        )
+    if product is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found"
+        )
+    return await product_cache.store(request, cache_key, dump_json(product))
@@ -1,46 +1,58 @@
 from fastapi import APIRouter, HTTPException, status
+from pymongo.errors import DuplicateKeyError
 from app.schemas import schema
 from app.crud import crud
-from app.auth.auth import create_access_token, verify_password, get_password_hash
+from app.auth.auth import create_user_token, password_hasher
 from app.models import model
 
 router = APIRouter()
 
 @router.post("/register", response_model=schema.UserOut, status_code=201)
-def register(user: schema.UserCreate):
+async def register(user: schema.UserCreate):
     """Register a new user"""
     # Check if user already exists
-    db_user = crud.get_user_by_username(user.username)
+    db_user = await crud.get_user_by_username(user.username)
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT, 
             detail="Username already registered"
         )
     
-    # Hash password and create user
+    # Hash password (in the bcrypt process pool) and create user
     user_dict = user.dict()
-    user_dict["password"] = get_password_hash(user_dict["password"])
-    new_user = crud.create_user(model.User(**user_dict))
+    user_dict["password"] = await password_hasher.hash(user_dict["password"])
+    try:
+        new_user = await crud.create_user(model.User(**user_dict))
+    except DuplicateKeyError:
+        # Lost a race with a concurrent registration (unique username index)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Username already registered"
+        )
     
     return schema.UserOut(**new_user)
 
 @router.post("/login", response_model=schema.Token)
-def login(user: schema.UserCreate):
+async def login(user: schema.UserCreate):
     """Authenticate user and return JWT token"""
     # Verify user credentials
-    db_user = crud.get_user_by_username(user.username)
+    db_user = await crud.get_user_by_username(user.username)
     if not db_user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, 
             detail="User not found"
         )
     
-    if not verify_password(user.password, db_user["password"]):
+    valid, new_hash = await password_hasher.verify_and_update(user.password, db_user["password"])
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, 
             detail="Incorrect password"
         )
+    if new_hash:
+        # Stored hash used an outdated bcrypt cost; upgrade it transparently
+        await crud.update_user_password(db_user["username"], new_hash)
     
     # Generate access token
-    access_token = create_access_token(data={"sub": db_user["username"]})
+    access_token = create_user_token(db_user)
     return {"access_token": access_token, "token_type": "bearer"} 
\ No newline at end of file
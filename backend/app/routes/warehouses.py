@@ -0,0 +1,89 @@
+from fastapi import APIRouter, Depends, HTTPException, Path, Request, status
+from app.schemas import schema
+from app.warehouses import warehouses
+from app.idempotency.idempotency import run_once
+from app.auth.dependencies import get_current_user
+
+router = APIRouter()
+
+WarehouseId = Path(..., pattern=schema.WAREHOUSE_ID_PATTERN)
+
+def _not_found():
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="Product not found"
+    )
+
+@router.post("/stock/transfers", response_model=schema.StockTransferResponse)
+async def transfer_stock(payload: schema.StockTransferRequest, request: Request, user=Depends(get_current_user)):
+    """Move units of a SKU between two warehouses atomically (``Idempotency-Key`` supported).
+
+    The source must hold at least ``quantity``; otherwise nothing moves and
+    the response is 409. The product's total is unchanged.
+    """
+    async def transfer():
+        try:
+            moved = await warehouses.transfer_stock(payload.sku, payload.from_warehouse, payload.to_warehouse,
+                                                    payload.quantity)
+        except warehouses.InsufficientStock as e:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=str(e)
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to transfer stock"
+            )
+        if moved is None:
+            raise _not_found()
+        source, destination, transactional = moved
+        return {"source": source, "destination": destination, "transactional": transactional}
+    return await run_once(request, user, payload, transfer)
+
+@router.get("/stock/{sku}", response_model=schema.ProductStock)
+async def get_stock(sku: str, user=Depends(get_current_user)):
+    """A SKU's total stock and its quantity in every warehouse (one index-only read)"""
+    try:
+        stock = await warehouses.get_stock(sku)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to load stock"
+        )
+    if stock is None:
+        raise _not_found()
+    return stock
+
+@router.get("/stock/{sku}/{warehouse_id}", response_model=schema.LocationStock)
+async def get_location_stock(sku: str, warehouse_id: str = WarehouseId, user=Depends(get_current_user)):
+    """A SKU's quantity in one warehouse"""
+    try:
+        stock = await warehouses.get_location_stock(sku, warehouse_id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to load stock"
+        )
+    if stock is None:
+        raise _not_found()
+    return stock
+
+@router.put("/stock/{sku}/{warehouse_id}", response_model=schema.ProductStock)
+async def set_location_stock(
+    sku: str,
+    payload: schema.LocationStockUpdate,
+    warehouse_id: str = WarehouseId,
+    user=Depends(get_current_user)
+):
+    """Set a SKU's quantity in one warehouse; the product total moves by the difference"""
+    try:
+        stock = await warehouses.set_location_stock(sku, warehouse_id, payload.quantity)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to update stock"
+        )
+    if stock is None:
+        raise _not_found()
+    return stock
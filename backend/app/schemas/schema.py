@@ -1,4 +1,5 @@
-from pydantic import BaseModel, Field
+from datetime import datetime
+from pydantic import BaseModel, Field, model_validator
 from typing import Optional, List
 
 class User(BaseModel):
@@ -50,6 +51,35 @@ class ProductOut(BaseModel):
 class ProductUpdate(BaseModel):
     quantity: int
 
+# Batch stock movement schemas
+class QuantityOperation(BaseModel):
+    id: Optional[str] = None
+    sku: Optional[str] = None
+    delta: Optional[int] = None
+    set: Optional[int] = None
+
+    @model_validator(mode="after")
+    def check_target_and_change(self):
+        if (self.id is None) == (self.sku is None):
+            raise ValueError("Provide exactly one of 'id' or 'sku'")
+        if (self.delta is None) == (self.set is None):
+            raise ValueError("Provide exactly one of 'delta' or 'set'")
+        return self
+
+class QuantityBatchRequest(BaseModel):
+    operations: List[QuantityOperation] = Field(..., min_length=1)
+    allow_negative: bool = False
+
+class QuantityOperationResult(BaseModel):
+    index: int
+    status: str
+    product: Optional[ProductOut] = None
+
+class QuantityBatchResponse(BaseModel):
+    applied: int
+    failed: int
+    results: List[QuantityOperationResult]
+
 # Pagination schemas
 class PaginationInfo(BaseModel):
     total: int
@@ -60,7 +90,171 @@ class PaginationInfo(BaseModel):
     has_prev: bool
     next_page: Optional[int] = None
     prev_page: Optional[int] = None
+    next_cursor: Optional[str] = None
 
 class ProductListResponse(BaseModel):
     products: List[ProductOut]
-    pagination: PaginationInfo 
\ No newline at end of file
+    pagination: PaginationInfo
+
+# Facet schemas
+class FacetCount(BaseModel):
+    value: Optional[str] = None
+    count: int
+
+class ProductFacetsResponse(BaseModel):
+    total: int
+    low_stock: int
+    low_stock_threshold: int
+    types: List[FacetCount]
+
+# Inventory summary schemas
+class InventoryTotals(BaseModel):
+    products: int
+    units: int
+    value: float
+    low_stock: int
+
+class InventoryTypeSummary(InventoryTotals):
+    type: Optional[str] = None
+
+class LowStockItem(BaseModel):
+    id: str = Field(..., alias="_id")
+    name: Optional[str] = None
+    sku: Optional[str] = None
+    type: Optional[str] = None
+    quantity: int
+    price: Optional[float] = None
+
+class InventorySummaryResponse(BaseModel):
+    # "building" until reconcile-inventory --fix has built the summary once
+    status: str = "built"
+    totals: InventoryTotals
+    types: List[InventoryTypeSummary]
+    low_stock_threshold: int
+    low_stock_items: List[LowStockItem]
+    low_stock_truncated: bool
+
+class InventoryDrift(BaseModel):
+    type: Optional[str] = None
+    field: str
+    expected: float
+    stored: float
+
+class InventoryReconcileResponse(BaseModel):
+    products: int
+    drift: List[InventoryDrift]
+    low_stock_missing: int
+    low_stock_stale: int
+    fixed: bool
+    elapsed_seconds: float
+
+class StockMovement(BaseModel):
+    at: datetime
+    quantity: int
+    change: int
+    kind: str
+
+class StockMovementsResponse(BaseModel):
+    product_id: str
+    movements: List[StockMovement]
+    next_cursor: Optional[str] = None
+
+class ProductStockAt(BaseModel):
+    product_id: str
+    at: datetime
+    quantity: Optional[int] = None
+    source: Optional[str] = None
+    as_of: Optional[datetime] = None
+
+class CatalogStockAt(BaseModel):
+    at: datetime
+    products: int
+    units: int
+    snapshot_at: Optional[datetime] = None
+    replayed_products: int
+    elapsed_seconds: float
+
+class StockSnapshot(BaseModel):
+    snapshot_id: str
+    started_at: datetime
+    completed_at: datetime
+    products: int
+    units: int
+
+# Warehouse stock schemas
+WAREHOUSE_ID_PATTERN = r"^[A-Za-z0-9_.-]{1,64}$"
+
+class LocationStock(BaseModel):
+    sku: str
+    warehouse_id: str
+    quantity: int
+
+class WarehouseQuantity(BaseModel):
+    warehouse_id: str
+    quantity: int
+
+class ProductStock(BaseModel):
+    product_id: str
+    sku: str
+    total: int
+    allocated: int
+    unassigned: int
+    locations: List[WarehouseQuantity]
+
+class LocationStockUpdate(BaseModel):
+    quantity: int = Field(..., ge=0)
+
+class StockTransferRequest(BaseModel):
+    sku: str
+    from_warehouse: str = Field(..., pattern=WAREHOUSE_ID_PATTERN)
+    to_warehouse: str = Field(..., pattern=WAREHOUSE_ID_PATTERN)
+    quantity: int = Field(..., gt=0)
+
+    @model_validator(mode="after")
+    def check_locations(self):
+        if self.from_warehouse == self.to_warehouse:
+            raise ValueError("'from_warehouse' and 'to_warehouse' must differ")
+        return self
+
+class StockTransferResponse(BaseModel):
+    source: LocationStock
+    destination: LocationStock
+    transactional: bool
+
+# Background job schemas
+class JobAccepted(BaseModel):
+    job_id: str
+    state: str
+    status_url: str
+
+class JobOut(BaseModel):
+    id: str = Field(..., alias="_id")
+    type: str
+    state: str
+    attempts: int
+    max_attempts: int
+    created_at: datetime
+    run_after: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    duration_seconds: Optional[float] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+
+# Bulk ingest schemas
+class BulkIngestError(BaseModel):
+    row: int
+    sku: Optional[str] = None
+    error: str
+
+class BulkIngestResponse(BaseModel):
+    rows: int
+    inserted: int
+    failed: int
+    batches: int
+    elapsed_seconds: float
+    rows_per_second: float
+    errors: List[BulkIngestError]
+    errors_truncated: bool = False
+    # Set when the upload turned unreadable; rows after the last one counted were not read
+    aborted: Optional[str] = None
@@ -0,0 +1,233 @@
+import asyncio
+import os
+from datetime import datetime, timezone
+from pymongo import ReturnDocument
+from app.cache.responses import product_cache
+from app.crud import crud
+from app.database.database import get_database, mongo
+from app.events.events import product_events
+from app.ledger import ledger
+
+# Use multi-document transactions for stock writes where the deployment
+# supports them (replica set / sharded cluster); otherwise writes are
+# ordered and compensated so a failed transfer never loses stock
+WAREHOUSE_TRANSACTIONS = os.getenv("WAREHOUSE_TRANSACTIONS", "True").lower() == "true"
+
+# One document per (product, warehouse):
+#   {_id: "<product id>:<warehouse id>", p: product id, w: warehouse id, sku, q: quantity, updated_at}
+# Shard on {sku: 1, w: 1}: the sku_w_q index has it as prefix, every write
+# filters on it, and "a SKU in all warehouses" reads one shard, index only.
+# products.quantity stays the product's total across warehouses.
+COLLECTION = "warehouse_stock"
+LOCATION_PROJECTION = {"_id": 0, "w": 1, "q": 1}
+
+
+class InsufficientStock(ValueError):
+    """Raised when a transfer's source location holds less than the quantity moved"""
+
+
+def location_id(product_id, warehouse_id: str) -> str:
+    return f"{product_id}:{warehouse_id}"
+
+
+async def _transactional():
+    return WAREHOUSE_TRANSACTIONS and await mongo.supports_transactions()
+
+
+async def _product(sku: str):
+    return await get_database().products.find_one({"sku": sku}, {"quantity": 1})
+
+
+async def get_stock(sku: str):
+    """A SKU's total plus its quantity per warehouse, or None for an unknown SKU.
+
+    ``allocated`` is what the warehouses hold between them; ``unassigned``
+    is stock set through the product-level quantity endpoints that has not
+    been placed in a warehouse.
+    """
+    db = get_database()
+    product, locations = await asyncio.gather(
+        _product(sku),
+        db[COLLECTION].find({"sku": sku}, LOCATION_PROJECTION).sort([("sku", 1), ("w", 1)]).to_list(length=None)
+    )
+    if product is None:
+        return None
+    total = product.get("quantity") or 0
+    allocated = sum(doc["q"] for doc in locations)
+    return {
+        "product_id": str(product["_id"]),
+        "sku": sku,
+        "total": total,
+        "allocated": allocated,
+        "unassigned": total - allocated,
+        "locations": [{"warehouse_id": doc["w"], "quantity": doc["q"]} for doc in locations],
+    }
+
+
+async def get_location_stock(sku: str, warehouse_id: str):
+    """One warehouse's quantity of a SKU (0 if it has never held any), or None for an unknown SKU"""
+    db = get_database()
+    product, location = await asyncio.gather(
+        _product(sku),
+        db[COLLECTION].find_one({"sku": sku, "w": warehouse_id}, LOCATION_PROJECTION)
+    )
+    if product is None:
+        return None
+    return {"sku": sku, "warehouse_id": warehouse_id, "quantity": location["q"] if location else 0}
+
+
+async def set_location_stock(sku: str, warehouse_id: str, quantity: int):
+    """Set one warehouse's quantity and move the product total by the difference.
+
+    Both writes share a transaction where available. Without one, the
+    location is written first and put back if the product total cannot be
+    moved, so the two never disagree. Returns the SKU's stock afterwards,
+    or None for an unknown SKU.
+    """
+    product = await _product(sku)
+    if product is None:
+        return None
+    db = get_database()
+    now = datetime.now(timezone.utc)
+
+    location_filter = {"_id": location_id(product["_id"], warehouse_id), "sku": sku, "w": warehouse_id}
+
+    async def write(session=None):
+        before = await db[COLLECTION].find_one_and_update(
+            location_filter,
+            {"$set": {"q": quantity, "updated_at": now}, "$setOnInsert": {"p": product["_id"]}},
+            upsert=True,
+            projection={"q": 1},
+            return_document=ReturnDocument.BEFORE,
+            session=session
+        )
+        change = quantity - (before["q"] if before else 0)
+        if change == 0:
+            return None
+        try:
+            product_before = await db.products.find_one_and_update(
+                {"_id": product["_id"]},
+                {"$inc": {"quantity": change, "v": 1}},
+                projection=crud.STOCK_WRITE_PROJECTION,
+                return_document=ReturnDocument.BEFORE,
+                session=session
+            )
+        except Exception:
+            if session is None:
+                # Undo the location write unless another writer has changed it since
+                undo = {**location_filter, "q": quantity}
+                if before is None:
+                    await db[COLLECTION].delete_one(undo)
+                else:
+                    await db[COLLECTION].update_one(undo, {"$set": {"q": before["q"]}})
+            raise
+        return product_before, {**product_before, "quantity": (product_before.get("quantity") or 0) + change}
+
+    changed = await (mongo.run_transaction(write) if await _transactional() else write())
+    if changed is not None:
+        await asyncio.gather(crud.record_inventory_changes([changed]), ledger.record_movements([changed], "updated"))
+        await product_cache.invalidate()
+        product_events.emit("quantity_updated", crud.product_out(changed[1]))
+    return await get_stock(sku)
+
+
+async def transfer_stock(sku: str, from_warehouse: str, to_warehouse: str, quantity: int):
+    """Move ``quantity`` units between two warehouses, all or nothing.
+
+    With transactions both locations change in one transaction. Without
+    them the source is decremented first (guarded, so it never goes
+    negative) and given back if the destination write fails. The product
+    total does not change. Returns ``(source, destination, transactional)``
+    or None for an unknown SKU; raises InsufficientStock.
+    """
+    product = await _product(sku)
+    if product is None:
+        return None
+    db = get_database()
+    now = datetime.now(timezone.utc)
+    source_filter = {"_id": location_id(product["_id"], from_warehouse), "sku": sku, "w": from_warehouse}
+    transactional = await _transactional()
+
+    async def write(session=None):
+        source = await db[COLLECTION].find_one_and_update(
+            {**source_filter, "q": {"$gte": quantity}},
+            {"$inc": {"q": -quantity}, "$set": {"updated_at": now}},
+            projection=LOCATION_PROJECTION,
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+        if source is None:
+            raise InsufficientStock(f"Warehouse {from_warehouse} holds less than {quantity} of {sku}")
+        try:
+            destination = await db[COLLECTION].find_one_and_update(
+                {"_id": location_id(product["_id"], to_warehouse), "sku": sku, "w": to_warehouse},
+                {"$inc": {"q": quantity}, "$set": {"updated_at": now}, "$setOnInsert": {"p": product["_id"]}},
+                upsert=True,
+                projection=LOCATION_PROJECTION,
+                return_document=ReturnDocument.AFTER,
+                session=session
+            )
+        except Exception:
+            if session is None:
+                await db[COLLECTION].update_one(source_filter, {"$inc": {"q": quantity}})
+            raise
+        return source, destination
+
+    source, destination = await (mongo.run_transaction(write) if transactional else write())
+    return (
+        {"sku": sku, "warehouse_id": from_warehouse, "quantity": source["q"]},
+        {"sku": sku, "warehouse_id": to_warehouse, "quantity": destination["q"]},
+        transactional,
+    )
+
+
+async def merge_duplicate_skus(fix: bool = False):
+    """Find products sharing a SKU and optionally fold each group into its oldest document.
+
+    Catalogs that kept one product document per location hold such
+    duplicates, and ``products.sku_unique`` cannot be built until they are
+    gone. A merge deletes each duplicate, adds its quantity to the kept
+    product (as unassigned stock, since the document does not say which
+    warehouse it was) and moves its warehouse rows over. Run it during a
+    quiet period; it finishes with a summary reconcile.
+    """
+    db = get_database()
+    groups = await db.products.aggregate([
+        {"$group": {"_id": "$sku", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$sort": {"_id": 1}},
+    ], allowDiskUse=True).to_list(length=None)
+    report = []
+    for group in groups:
+        keep, *duplicates = sorted(group["ids"])
+        entry = {"sku": group["_id"], "kept": str(keep), "duplicates": [str(_id) for _id in duplicates], "moved": 0}
+        report.append(entry)
+        if not fix:
+            continue
+        for duplicate in duplicates:
+            deleted = await db.products.find_one_and_delete({"_id": duplicate}, projection={"quantity": 1})
+            if deleted is None:
+                continue
+            quantity = deleted.get("quantity") or 0
+            before = await db.products.find_one_and_update(
+                {"_id": keep},
+                {"$inc": {"quantity": quantity, "v": 1}},
+                projection=crud.STOCK_WRITE_PROJECTION,
+                return_document=ReturnDocument.BEFORE
+            )
+            if before is not None:
+                await ledger.record_movements(
+                    [(before, {**before, "quantity": (before.get("quantity") or 0) + quantity})], "updated")
+            entry["moved"] += quantity
+            async for row in db[COLLECTION].find({"p": duplicate}):
+                await db[COLLECTION].update_one(
+                    {"_id": location_id(keep, row["w"]), "sku": row["sku"], "w": row["w"]},
+                    {"$inc": {"q": row["q"]}, "$set": {"updated_at": datetime.now(timezone.utc)},
+                     "$setOnInsert": {"p": keep}},
+                    upsert=True
+                )
+                await db[COLLECTION].delete_one({"_id": row["_id"]})
+    if fix and report:
+        # The summary has no removal path for a product; recount it instead
+        await crud.reconcile_inventory_summary(fix=True)
+    return report
@@ -0,0 +1,75 @@
+"""
+Compare the async (Motor) and sync (threadpool pymongo) request paths.
+
+Reports p50/p99 latency for GET /products and PUT /products/{id}/quantity at
+several client concurrencies. Usage (from ``backend/``)::
+
+    python -m benchmarks.bench_async_crud                      # mongomock stand-in
+    python -m benchmarks.bench_async_crud --mongodb-url mongodb://localhost:27017
+
+mongomock executes in-process, so its numbers mostly reflect framework and
+threadpool overhead; run against a local mongod for realistic I/O waits.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+
+from benchmarks import common
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongodb-url", help="benchmark against a real MongoDB instead of mongomock")
+    parser.add_argument("--clients", default="50,200,1000", help="comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=5000, help="requests per run")
+    parser.add_argument("--products", type=int, default=1000, help="catalog size to seed")
+    return parser.parse_args()
+
+
+async def run(args):
+    from app.main import app
+    if args.mongodb_url:
+        from app.database import database
+        database.mongo.db.products.drop()
+    else:
+        database = common.use_mongomock()
+
+    common.seed_products(database, args.products)
+    token = common.seed_user(database)
+    product_ids = [str(p["_id"]) for p in database.mongo.db.products.find({}, {"_id": 1}).limit(100)]
+
+    results = []
+    for mode in ("async", "sync"):
+        database.USE_ASYNC_DB = mode == "async"
+        async with common.make_client(app, token) as client:
+            for concurrency in [int(c) for c in args.clients.split(",")]:
+                scenarios = {
+                    "GET /products": lambda i: client.get("/api/v1/products", params={"skip": 0, "limit": 20}),
+                    "PUT /products/{id}/quantity": lambda i: client.put(
+                        f"/api/v1/products/{product_ids[i % len(product_ids)]}/quantity",
+                        json={"quantity": i},
+                    ),
+                }
+                for name, send in scenarios.items():
+                    latencies, errors, elapsed = await common.drive(concurrency, args.requests, send)
+                    row = {"mode": mode, "clients": concurrency, "endpoint": name,
+                           **common.summarize(latencies, elapsed, errors)}
+                    results.append(row)
+                    print(f"{mode:5} {concurrency:5} {name:30} p50={row['p50_ms']:8.2f}ms "
+                          f"p99={row['p99_ms']:8.2f}ms rps={row['rps']:8.1f} errors={errors}")
+    return results
+
+
+def main():
+    args = parse_args()
+    if args.mongodb_url:
+        os.environ["MONGODB_URL"] = args.mongodb_url
+        os.environ.setdefault("DATABASE_NAME", "fimoney_inventory_bench")
+    results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
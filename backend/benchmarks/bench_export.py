@@ -0,0 +1,152 @@
+"""
+Memory profile of the streaming catalog export.
+
+Drains ``export.stream_products`` for growing row counts and reports how
+much the process's resident memory grew (sampled from /proc every 10ms;
+tracemalloc's heap peak where /proc is unavailable) next to the bytes
+produced. A flat peak across 100k -> 10M rows is the constant-memory
+guarantee; ``--baseline`` adds the old approach (materialize the catalog,
+then encode it) for comparison, measured last because freed memory is not
+always returned to the OS. Usage (from ``backend/``)::
+
+    python -m benchmarks.bench_export --rows 100000,1000000,10000000 --formats ndjson,csv
+    python -m benchmarks.bench_export --rows 1000000 --mongodb-url mongodb://localhost:27017
+
+Without ``--mongodb-url`` documents come from a generator standing in for a
+server-side cursor, so 10M rows need no database (mongomock would hold the
+whole catalog in memory and measure itself instead of the export).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+import orjson
+from bson import ObjectId
+
+from benchmarks import common
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongodb-url", help="export from a real MongoDB (seeded with the largest row count)")
+    parser.add_argument("--rows", default="100000,1000000", help="comma separated row counts")
+    parser.add_argument("--formats", default="ndjson,csv", help="comma separated: ndjson, csv, parquet")
+    parser.add_argument("--batch-size", type=int, default=1000, help="cursor batch size")
+    parser.add_argument("--baseline", action="store_true", help="also measure list-then-encode (up to 1M rows)")
+    return parser.parse_args()
+
+
+async def synthetic_cursor(count, batch_size):
+    """Yields product documents like a server-side cursor, one batch per event-loop hop"""
+    types = ["Electronics", "Grocery", "Apparel", "Hardware", "Toys"]
+    for i in range(count):
+        if i % batch_size == 0:
+            await asyncio.sleep(0)
+        yield {
+            "_id": ObjectId(),
+            "name": f"Product {i}",
+            "type": types[i % len(types)],
+            "sku": f"SKU{i:08d}",
+            "image_url": None,
+            "description": f"Benchmark product {i}",
+            "quantity": i % 100,
+            "price": round(1 + (i % 1000) * 0.5, 2),
+        }
+
+
+def rss_bytes():
+    with open("/proc/self/statm") as handle:
+        return int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+async def measure(make_cursor, run):
+    """Run one export; returns bytes produced, peak memory growth and duration"""
+    if not os.path.exists("/proc/self/statm"):
+        tracemalloc.start()
+        started = time.perf_counter()
+        produced = await run(make_cursor())
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return {"bytes_out": produced, "peak_mb": round(peak / 2**20, 2), "seconds": round(elapsed, 2)}
+
+    baseline = peak = rss_bytes()
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not done.wait(0.01):
+            peak = max(peak, rss_bytes())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    started = time.perf_counter()
+    produced = await run(make_cursor())
+    elapsed = time.perf_counter() - started
+    done.set()
+    sampler.join()
+    peak = max(peak, rss_bytes())
+    return {"bytes_out": produced, "peak_mb": round((peak - baseline) / 2**20, 2), "seconds": round(elapsed, 2)}
+
+
+async def run(args):
+    from app.crud import crud
+    from app.export import export
+
+    row_counts = [int(r) for r in args.rows.split(",")]
+    if args.mongodb_url:
+        from app.database import database
+        database.mongo.db.products.drop()
+        common.seed_products(database, max(row_counts))
+
+    def cursor_factory(rows):
+        if args.mongodb_url:
+            return lambda: crud.iter_products({}, args.batch_size).limit(rows)
+        return lambda: synthetic_cursor(rows, args.batch_size)
+
+    results = []
+    for rows in row_counts:
+        make_cursor = cursor_factory(rows)
+
+        for fmt in args.formats.split(","):
+            async def streamed(cursor):
+                total = 0
+                async for chunk in export.stream_products(cursor, fmt, args.batch_size):
+                    total += len(chunk)
+                return total
+            row = {"rows": rows, "format": fmt, "mode": "streaming", **await measure(make_cursor, streamed)}
+            results.append(row)
+            print(f"{rows:>10} {fmt:8} streaming    peak=+{row['peak_mb']:8.2f}MB "
+                  f"out={row['bytes_out'] / 2**20:9.1f}MB {row['seconds']:7.2f}s")
+
+    for rows in row_counts if args.baseline else []:
+        if rows > 1_000_000:
+            continue
+        make_cursor = cursor_factory(rows)
+
+        async def materialized(cursor):
+            products = [crud.product_out(doc) async for doc in cursor]
+            return len(orjson.dumps(products))
+        row = {"rows": rows, "format": "json", "mode": "materialized", **await measure(make_cursor, materialized)}
+        results.append(row)
+        print(f"{rows:>10} json     materialized peak=+{row['peak_mb']:8.2f}MB "
+              f"out={row['bytes_out'] / 2**20:9.1f}MB {row['seconds']:7.2f}s")
+    return results
+
+
+def main():
+    args = parse_args()
+    if args.mongodb_url:
+        os.environ["MONGODB_URL"] = args.mongodb_url
+        os.environ.setdefault("DATABASE_NAME", "fimoney_inventory_bench")
+    results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Read latency while heavy requests run inline vs as background jobs.
+
+Measures GET /products p50/p99 for a steady set of readers, on its own and
+while a burst of ``--batch`` inventory reconciliations (a full catalog scan
+each) is submitted: once inline, where every reconcile request does the
+scan itself, and once with ``?background=true``, where requests answer 202
+and the job runner works through them ``--job-workers`` at a time. Also
+reports how long the reconcile requests themselves took and when the last
+job finished. Usage (from ``backend/``)::
+
+    python -m benchmarks.bench_jobs --catalog-size 20000 --batch 50
+    python -m benchmarks.bench_jobs --mongodb-url mongodb://localhost:27017 --catalog-size 1000000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from benchmarks import common
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongodb-url", help="benchmark against a real MongoDB instead of mongomock")
+    parser.add_argument("--catalog-size", type=int, default=20_000, help="products to seed")
+    parser.add_argument("--batch", type=int, default=50, help="reconcile requests in the burst")
+    parser.add_argument("--job-workers", type=int, default=2, help="jobs run at once (JOB_WORKERS)")
+    parser.add_argument("--readers", type=int, default=20, help="concurrent product readers")
+    parser.add_argument("--reads", type=int, default=2000, help="product requests per measurement")
+    return parser.parse_args()
+
+
+async def wait_for_jobs(runner, job_ids):
+    while True:
+        jobs = [await runner.get(job_id) for job_id in job_ids]
+        if all(job["state"] in ("succeeded", "failed") for job in jobs):
+            return jobs
+        await asyncio.sleep(0.05)
+
+
+async def run(args):
+    from app.main import app
+    from app.cache.responses import product_cache
+    from app.database import database
+    from app.jobs.jobs import job_runner
+
+    if not args.mongodb_url:
+        common.use_mongomock()
+    database.mongo.db.products.drop()
+    common.seed_products(database, args.catalog_size)
+    token = common.seed_user(database)
+    # Measure the request path itself, not the response cache
+    product_cache.backend = None
+    job_runner.workers = args.job_workers
+    job_runner.max_queue = max(job_runner.max_queue, args.batch)
+    await job_runner.start()
+
+    results = []
+    async with common.make_client(app, token) as client:
+        read = lambda i: client.get("/api/v1/products", params={"limit": 20})
+        latencies, errors, elapsed = await common.drive(args.readers, args.reads, read)
+        results.append({"mode": "-", "phase": "baseline", **common.summarize(latencies, elapsed, errors)})
+
+        for mode, background in (("inline", False), ("background", True)):
+            started = time.perf_counter()
+            reconcile = lambda i: client.post("/api/v1/inventory/summary/reconcile",
+                                              params={"background": str(background).lower()})
+            responses = []
+
+            async def submit(i):
+                response = await reconcile(i)
+                responses.append(response)
+                return response
+
+            burst = asyncio.ensure_future(common.drive(args.batch, args.batch, submit))
+            latencies, errors, elapsed = await common.drive(args.readers, args.reads, read)
+            results.append({"mode": mode, "phase": "reads-during-burst", **common.summarize(latencies, elapsed, errors)})
+            burst_latencies, burst_errors, burst_elapsed = await burst
+            row = {"mode": mode, "phase": "reconcile-requests",
+                   **common.summarize(burst_latencies, burst_elapsed, burst_errors)}
+            if background:
+                jobs = await wait_for_jobs(job_runner, [r.json()["job_id"] for r in responses if r.status_code == 202])
+                row["jobs_failed"] = sum(1 for job in jobs if job["state"] == "failed")
+            row["all_done_s"] = round(time.perf_counter() - started, 3)
+            results.append(row)
+    await job_runner.close()
+
+    for row in results:
+        print(f"{row['mode']:10} {row['phase']:20} p50={row['p50_ms']:9.2f}ms p99={row['p99_ms']:9.2f}ms "
+              f"rps={row['rps']:8.1f} errors={row['errors']}")
+    return results
+
+
+def main():
+    args = parse_args()
+    if args.mongodb_url:
+        os.environ["MONGODB_URL"] = args.mongodb_url
+        os.environ.setdefault("DATABASE_NAME", "fimoney_inventory_bench")
+    results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
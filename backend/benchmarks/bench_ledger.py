@@ -0,0 +1,169 @@
+"""
+Point-in-time stock queries over a large stock-movement ledger.
+
+Generates a synthetic history of ``--movements`` stock changes spread over
+``--days`` days for ``--products`` products, with a materialized snapshot
+every ``--snapshot-hours`` hours, exactly as the app writes them. Then
+measures:
+
+  * product stock at a random time (last movement via the (p, t) index)
+  * catalog stock at a random time (latest snapshot + bounded replay)
+  * the same catalog query replaying the whole log (no snapshots), with --baseline
+  * the cost of appending one movement on the write path
+
+Usage (from ``backend/``)::
+
+    python -m benchmarks.bench_ledger                                   # 200k movements, mongomock
+    python -m benchmarks.bench_ledger --mongodb-url mongodb://localhost:27017 \\
+        --movements 100000000 --products 100000 --baseline
+
+Seeding 100M movements takes a while (insert rate bound); the target
+database is dropped first. mongomock holds everything in memory and scans
+instead of using indexes, so use a real MongoDB for large runs.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+
+from benchmarks import common
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongodb-url", help="benchmark against a real MongoDB instead of mongomock")
+    parser.add_argument("--movements", type=int, default=200_000, help="movements to generate")
+    parser.add_argument("--products", type=int, default=10_000, help="products in the catalog")
+    parser.add_argument("--days", type=int, default=90, help="history length")
+    parser.add_argument("--snapshot-hours", type=float, default=24, help="snapshot interval")
+    parser.add_argument("--queries", type=int, default=200, help="queries per measurement")
+    parser.add_argument("--baseline", action="store_true", help="also time full-log catalog replays")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+def write_snapshot(db, ledger, at, product_ids, quantities):
+    snapshot_id = f"bench:{at.isoformat()}"
+    chunk = ledger.LEDGER_SNAPSHOT_CHUNK
+    items = [{"s": snapshot_id, "i": n, "p": product_ids[start:start + chunk], "q": quantities[start:start + chunk]}
+             for n, start in enumerate(range(0, len(product_ids), chunk))]
+    db.stock_snapshot_items.insert_many(items)
+    db.stock_snapshots.insert_one({"_id": snapshot_id, "started_at": at, "completed_at": at, "complete": True,
+                                   "products": len(product_ids), "units": sum(quantities)})
+
+
+def seed_history(db, ledger, args, rng, batch=10_000):
+    """Chronological synthetic ledger; returns the history's time span"""
+    for name in ("stock_movements", "stock_snapshots", "stock_snapshot_items"):
+        db[name].drop()
+    from app.database.indexes import INDEXES
+    for name in ("stock_movements", "stock_snapshots", "stock_snapshot_items"):
+        db[name].create_indexes(INDEXES[name])
+
+    product_ids = [ObjectId() for _ in range(args.products)]
+    quantities = [rng.randrange(100) for _ in range(args.products)]
+    versions = [0] * args.products
+    start = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(days=args.days)
+    end = start + timedelta(days=args.days)
+    step = (end - start) / max(1, args.movements)
+    snapshot_every = timedelta(hours=args.snapshot_hours)
+    next_snapshot = start
+    pending = []
+    for i in range(args.movements):
+        at = start + step * i
+        while at >= next_snapshot:
+            if pending:
+                db.stock_movements.insert_many(pending, ordered=False)
+                pending = []
+            write_snapshot(db, ledger, next_snapshot, product_ids, quantities)
+            next_snapshot += snapshot_every
+        n = rng.randrange(args.products)
+        change = rng.randint(-5, 5) or 1
+        quantities[n] = max(0, quantities[n] + change)
+        versions[n] += 1
+        pending.append({"p": product_ids[n], "v": versions[n], "t": at, "q": quantities[n], "d": change, "k": "b"})
+        if len(pending) >= batch:
+            db.stock_movements.insert_many(pending, ordered=False)
+            pending = []
+        if i and i % 1_000_000 == 0:
+            print(f"  {i:,} movements")
+    if pending:
+        db.stock_movements.insert_many(pending, ordered=False)
+    return product_ids, start, end
+
+
+def storage(db, name):
+    try:
+        stats = db.command("collStats", name)
+        return {"count": stats["count"], "avg_doc_bytes": stats.get("avgObjSize"),
+                "data_mb": round(stats["size"] / 2**20, 1), "index_mb": round(stats["totalIndexSize"] / 2**20, 1)}
+    except Exception:
+        return {"count": db[name].estimated_document_count()}
+
+
+async def timed_queries(count, query):
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(count):
+        began = time.perf_counter()
+        await query()
+        latencies.append(time.perf_counter() - began)
+    return common.summarize(latencies, time.perf_counter() - started)
+
+
+async def full_replay(database, at):
+    """Catalog stock at ``at`` from the whole log, as if there were no snapshots"""
+    pipeline = [{"$match": {"t": {"$lte": at}}}, {"$sort": {"p": 1, "v": 1, "_id": 1}},
+                {"$group": {"_id": "$p", "q": {"$last": "$q"}}}]
+    docs = await database.get_database().stock_movements.aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+    return sum(doc["q"] for doc in docs)
+
+
+async def run(args):
+    from app.database import database
+    from app.ledger import ledger
+
+    if not args.mongodb_url:
+        common.use_mongomock()
+    db = database.mongo.db
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    product_ids, start, end = seed_history(db, ledger, args, rng)
+    print(f"Seeded {args.movements:,} movements in {time.perf_counter() - started:.1f}s")
+    span = (end - start).total_seconds()
+    random_time = lambda: start + timedelta(seconds=rng.uniform(0, span))
+
+    results = {
+        "movements": args.movements,
+        "products": args.products,
+        "snapshot_hours": args.snapshot_hours,
+        "storage": {name: storage(db, name) for name in ("stock_movements", "stock_snapshot_items")},
+        "product_stock_at": await timed_queries(
+            args.queries, lambda: ledger.get_stock_at(str(rng.choice(product_ids)), random_time())),
+        "catalog_stock_at": await timed_queries(
+            max(1, args.queries // 10), lambda: ledger.get_catalog_stock_at(random_time())),
+    }
+    if args.baseline:
+        results["catalog_full_replay"] = await timed_queries(3, lambda: full_replay(database, random_time()))
+    # Write-path cost of one movement
+    results["append_movement"] = await timed_queries(args.queries, lambda: ledger.record_movements(
+        [({"quantity": 1}, {"_id": rng.choice(product_ids), "quantity": 2})], "updated"))
+    return results
+
+
+def main():
+    args = parse_args()
+    if args.mongodb_url:
+        os.environ["MONGODB_URL"] = args.mongodb_url
+        os.environ.setdefault("DATABASE_NAME", "fimoney_inventory_bench")
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Product-endpoint latency during a login storm.
+
+Measures GET /products p50/p99 for a steady set of readers, first on its own
+and then while N concurrent logins run. This is done once with bcrypt in the
+dedicated process pool and once on the shared threadpool
+(PASSWORD_HASH_WORKERS=0). Usage (from ``backend/``)::
+
+    python -m benchmarks.bench_login_storm --logins 500 --rounds 12
+"""
+
+import argparse
+import asyncio
+import json
+import os
+
+from benchmarks import common
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongodb-url", help="benchmark against a real MongoDB instead of mongomock")
+    parser.add_argument("--logins", type=int, default=500, help="concurrent logins in the storm")
+    parser.add_argument("--readers", type=int, default=20, help="concurrent product readers")
+    parser.add_argument("--reads", type=int, default=2000, help="product requests per measurement")
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost factor")
+    parser.add_argument("--workers", type=int, default=None, help="hashing processes (default: PASSWORD_HASH_WORKERS)")
+    return parser.parse_args()
+
+
+async def run(args):
+    from app.main import app
+    from app.auth import auth
+    from app.cache.responses import product_cache
+    from app.database import database
+
+    if not args.mongodb_url:
+        common.use_mongomock()
+    common.seed_products(database, 1000)
+    token = common.seed_user(database)
+    # Measure the request path itself, not the response cache
+    product_cache.backend = None
+
+    hasher = auth.password_hasher
+    hasher.max_queue = args.logins
+    pool_workers = args.workers if args.workers is not None else max(1, hasher.workers)
+
+    results = []
+    for mode, workers in (("process-pool", pool_workers), ("threadpool", 0)):
+        hasher.shutdown()
+        hasher.workers = workers
+        async with common.make_client(app, token) as client:
+            read = lambda i: client.get("/api/v1/products", params={"limit": 20})
+            login = lambda i: client.post("/api/v1/login", json={"username": "bench", "password": "bench-password"})
+            # Warm the pool so process start-up is not part of the storm
+            await login(0)
+
+            latencies, errors, elapsed = await common.drive(args.readers, args.reads, read)
+            results.append({"mode": mode, "phase": "baseline", **common.summarize(latencies, elapsed, errors)})
+
+            storm = asyncio.ensure_future(common.drive(args.logins, args.logins, login))
+            latencies, errors, elapsed = await common.drive(args.readers, args.reads, read)
+            results.append({"mode": mode, "phase": "during-login-storm", **common.summarize(latencies, elapsed, errors)})
+            login_latencies, login_errors, login_elapsed = await storm
+            results.append({"mode": mode, "phase": "logins",
+                            **common.summarize(login_latencies, login_elapsed, login_errors)})
+        for row in results[-3:]:
+            print(f"{row['mode']:12} {row['phase']:20} p50={row['p50_ms']:9.2f}ms p99={row['p99_ms']:9.2f}ms "
+                  f"rps={row['rps']:8.1f} errors={row['errors']}")
+    hasher.shutdown()
+    return results
+
+
+def main():
+    args = parse_args()
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    if args.mongodb_url:
+        os.environ["MONGODB_URL"] = args.mongodb_url
+        os.environ.setdefault("DATABASE_NAME", "fimoney_inventory_bench")
+    results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
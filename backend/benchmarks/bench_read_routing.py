@@ -0,0 +1,158 @@
+"""
+Primary load with listing reads on the primary vs routed to secondaries.
+
+Drives ``--readers`` concurrent listing requests (filtered keyset pages,
+counts and facets; response cache off) next to ``--writers`` concurrent
+quantity updates, once with MONGO_LISTING_READ_PREFERENCE=primary and once
+with ``--read-preference`` (secondaryPreferred by default). Reports
+latency for both request kinds plus the CPU each replica set member spent.
+
+Against a real replica set (``--mongodb-url`` with every member reachable
+from here) member CPU comes from serverStatus (Linux ``extra_info``).
+Without it a mongomock replica set stand-in is used: all members share one
+store and the CPU figure is busy time charged to the member each operation
+was routed to. Usage (from ``backend/``)::
+
+    python -m benchmarks.bench_read_routing --catalog-size 5000
+    python -m benchmarks.bench_read_routing --catalog-size 1000000 \\
+        --mongodb-url "mongodb://localhost:27017,localhost:27018,localhost:27019/?replicaSet=rs0"
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+
+from benchmarks import common
+
+TYPES = ["Electronics", "Grocery", "Apparel", "Hardware", "Toys"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongodb-url", help="replica set to benchmark instead of the mongomock stand-in")
+    parser.add_argument("--catalog-size", type=int, default=5_000, help="products to seed")
+    parser.add_argument("--read-preference", default="secondaryPreferred", help="routed listing read preference")
+    parser.add_argument("--max-staleness", type=int, default=90, help="maxStalenessSeconds for routed reads")
+    parser.add_argument("--readers", type=int, default=20, help="concurrent listing clients")
+    parser.add_argument("--reads", type=int, default=1000, help="listing requests per mode")
+    parser.add_argument("--writers", type=int, default=5, help="concurrent quantity writers")
+    parser.add_argument("--writes", type=int, default=500, help="quantity updates per mode")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the request sequence")
+    return parser.parse_args()
+
+
+class ServerStatusCpu:
+    """Member CPU seconds from serverStatus on a real replica set"""
+
+    def __init__(self, client):
+        from pymongo import MongoClient
+
+        hello = client.admin.command("hello")
+        self.primary = hello.get("primary")
+        self.clients = {host: MongoClient(host, directConnection=True) for host in hello.get("hosts", [])}
+
+    def sample(self):
+        usage = {}
+        for host, client in self.clients.items():
+            info = client.admin.command("serverStatus").get("extra_info", {})
+            if "user_time_us" in info:
+                usage[host] = (info["user_time_us"] + info.get("system_time_us", 0)) / 1e6
+        return usage
+
+    def role(self, host):
+        return "primary" if host == self.primary else "secondary"
+
+
+class StandInCpu:
+    """Busy seconds charged to each member of the replica set stand-in"""
+
+    def __init__(self, standin):
+        self.members = standin.members
+
+    def sample(self):
+        return {member: stats["busy_s"] for member, stats in self.members.stats().items()}
+
+    def role(self, member):
+        return "primary" if member == "primary" else "secondary"
+
+
+async def run(args):
+    from app.main import app
+    from app.cache.responses import product_cache
+    from app.database import database
+    from benchmarks.replica_set import use_replica_set_standin
+
+    if args.mongodb_url:
+        cpu = ServerStatusCpu(database.mongo.client)
+    else:
+        cpu = StandInCpu(use_replica_set_standin())
+    database.mongo.db.products.drop()
+    common.seed_products(database, args.catalog_size)
+    token = common.seed_user(database)
+    product_ids = [str(doc["_id"]) for doc in database.mongo.db.products.find({}, {"_id": 1})]
+    # Measure where the reads go, not the response cache
+    product_cache.backend = None
+
+    results = []
+    async with common.make_client(app, token) as client:
+        rng = random.Random(args.seed)
+
+        def listing(i):
+            kind = i % 3
+            if kind == 0:
+                return client.get("/api/v1/products", params={"cursor": "", "limit": 20, "type": rng.choice(TYPES)})
+            if kind == 1:
+                return client.get("/api/v1/products", params={"cursor": "", "limit": 20, "sort": "price",
+                                                              "min_price": rng.randint(1, 400)})
+            return client.get("/api/v1/products/facets", params={"low_stock": "true"})
+
+        def write(i):
+            return client.put(f"/api/v1/products/{rng.choice(product_ids)}/quantity",
+                              json={"quantity": rng.randint(0, 500)})
+
+        modes = (("primary", "primary"), ("routed", args.read_preference))
+        for mode, preference in modes:
+            database.LISTING_READ_PREFERENCE = database.listing_read_preference(preference, args.max_staleness)
+            before = cpu.sample()
+            (read_latencies, read_errors, read_elapsed), (write_latencies, write_errors, write_elapsed) = \
+                await asyncio.gather(common.drive(args.readers, args.reads, listing),
+                                     common.drive(args.writers, args.writes, write))
+            after = cpu.sample()
+            used = {member: round(after[member] - before.get(member, 0.0), 3) for member in after}
+            primary_cpu = sum(s for member, s in used.items() if cpu.role(member) == "primary")
+            secondary_cpu = sum(s for member, s in used.items() if cpu.role(member) == "secondary")
+            requests = len(read_latencies) + len(write_latencies)
+            results.append({
+                "mode": mode,
+                "read_preference": database.LISTING_READ_PREFERENCE.document,
+                "listings": common.summarize(read_latencies, read_elapsed, read_errors),
+                "writes": common.summarize(write_latencies, write_elapsed, write_errors),
+                "member_cpu_s": used,
+                "primary_cpu_s": round(primary_cpu, 3),
+                "secondary_cpu_s": round(secondary_cpu, 3),
+                "primary_cpu_ms_per_request": round(primary_cpu * 1000 / requests, 3) if requests else 0.0,
+            })
+
+    for row in results:
+        print(f"{row['mode']:8} listings p50={row['listings']['p50_ms']:8.2f}ms p99={row['listings']['p99_ms']:8.2f}ms "
+              f"writes p50={row['writes']['p50_ms']:8.2f}ms p99={row['writes']['p99_ms']:8.2f}ms "
+              f"primary_cpu={row['primary_cpu_s']:7.3f}s secondary_cpu={row['secondary_cpu_s']:7.3f}s")
+    if len(results) == 2 and results[0]["primary_cpu_s"]:
+        relief = 1 - results[1]["primary_cpu_s"] / results[0]["primary_cpu_s"]
+        print(f"primary CPU relief with {args.read_preference}: {relief:.0%}")
+    return results
+
+
+def main():
+    args = parse_args()
+    if args.mongodb_url:
+        os.environ["MONGODB_URL"] = args.mongodb_url
+        os.environ.setdefault("DATABASE_NAME", "fimoney_inventory_bench")
+    results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Serialization cost of a /products page, per 1k documents.
+
+"before" is FastAPI's default path for ``response_model=List[ProductOut]``:
+full documents, an ``_id`` fix-up loop, per-item Pydantic validation,
+``jsonable_encoder`` and ``json.dumps``. "after" is the fast path: projected
+documents shaped once by ``crud.product_out`` and encoded with orjson.
+Usage (from ``backend/``)::
+
+    python -m benchmarks.bench_serialization --docs 1000 --repeat 200
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import List
+
+from bson import ObjectId
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from starlette.responses import JSONResponse
+
+from app.cache.responses import dump_json
+from app.crud import crud
+from app.schemas import schema
+
+
+def make_docs(count):
+    return [
+        {
+            "_id": ObjectId(),
+            "name": f"Product {i}",
+            "type": "Electronics",
+            "sku": f"SKU{i:08d}",
+            "image_url": f"https://example.com/{i}.jpg",
+            "description": f"Benchmark product {i} " * 4,
+            "quantity": i % 100,
+            "price": 1 + (i % 1000) * 0.5,
+        }
+        for i in range(count)
+    ]
+
+
+async def before(docs, field):
+    for p in docs:
+        p["_id"] = str(p["_id"])
+    content = await serialize_response(field=field, response_content=docs, is_coroutine=True)
+    return JSONResponse(content).body
+
+
+def after(docs):
+    # Serialization only: image URL rewriting is not part of what is compared
+    return dump_json([crud.product_out(p, rewrite_images=False) for p in docs])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    field = create_response_field(name="response", type_=List[schema.ProductOut])
+    template = make_docs(args.docs)
+    projected = [{k: v for k, v in d.items() if k == "_id" or k in crud.PRODUCT_PROJECTION} for d in template]
+
+    # Both paths must produce the same JSON document
+    assert json.loads(asyncio.run(before([dict(d) for d in template], field))) == json.loads(after(projected))
+
+    async def time_before():
+        copies = [[dict(d) for d in template] for _ in range(args.repeat)]
+        started = time.perf_counter()
+        for docs in copies:
+            await before(docs, field)
+        return time.perf_counter() - started
+
+    before_us = asyncio.run(time_before()) / args.repeat / args.docs * 1000 * 1e6
+
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        after(projected)
+    after_us = (time.perf_counter() - started) / args.repeat / args.docs * 1000 * 1e6
+
+    result = {
+        "docs_per_page": args.docs,
+        "before_us_per_1k_docs": round(before_us, 1),
+        "after_us_per_1k_docs": round(after_us, 1),
+        "speedup": round(before_us / after_us, 2),
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Throughput scaling of the production server from 1 to N worker processes.
+
+For each worker count, starts ``main.serve()`` as a real server on a local
+port, drives it for ``--duration`` seconds with keep-alive HTTP/1.1
+connections from several load-generator processes, and reports RPS,
+p50/p99 and scaling efficiency (RPS / (workers x single-worker RPS)).
+Usage (from ``backend/``)::
+
+    python -m benchmarks.bench_workers                          # 1,2,4,... up to the CPU count
+    python -m benchmarks.bench_workers --workers 1,4,8,16 --load-processes 8
+    python -m benchmarks.bench_workers --mongodb-url mongodb://localhost:27017
+
+Without ``--mongodb-url`` every worker seeds its own in-memory mongomock
+catalog, which isolates the scaling of the server itself. The load
+generator shares the machine with the server: on an N-core host, scaling
+is only meaningful up to roughly N minus the load processes, so give it
+its own host (or cores, via ``taskset``) for the largest worker counts.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import re
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks import common
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_CONTENT_LENGTH = re.compile(rb"(?i)\r\ncontent-length: *(\d+)")
+
+
+def __getattr__(name):
+    """``benchmarks.bench_workers:app``: the API over a seeded mongomock catalog, built per worker"""
+    if name != "app":
+        raise AttributeError(name)
+    database = common.use_mongomock()
+    common.seed_products(database, int(os.getenv("BENCH_CATALOG_SIZE", 1000)))
+    from app.main import app
+    return app
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongodb-url", help="benchmark against a real MongoDB instead of mongomock")
+    parser.add_argument("--workers", help="comma separated worker counts (default: powers of two up to the CPU count)")
+    parser.add_argument("--load-processes", type=int, default=max(1, os.cpu_count() // 2),
+                        help="load generator processes")
+    parser.add_argument("--connections", type=int, default=64, help="keep-alive connections in total")
+    parser.add_argument("--duration", type=float, default=10, help="measured seconds per worker count")
+    parser.add_argument("--warmup", type=float, default=5, help="unmeasured seconds before each run")
+    parser.add_argument("--path", default="/api/v1/products?limit=20", help="request path")
+    parser.add_argument("--catalog-size", type=int, default=1000, help="products to seed")
+    parser.add_argument("--port", type=int, default=8765)
+    return parser.parse_args()
+
+
+def default_worker_counts():
+    from main import available_cpus
+
+    counts, n = [], 1
+    while n < available_cpus():
+        counts.append(n)
+        n *= 2
+    return counts + [available_cpus()]
+
+
+async def _connection(port, request, deadline, measured_from, latencies, counters):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            writer.write(request)
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = _CONTENT_LENGTH.search(head)
+            await reader.readexactly(int(length.group(1)) if length else 0)
+            if started >= measured_from:
+                latencies.append(time.perf_counter() - started)
+                if not head.startswith(b"HTTP/1.1 2"):
+                    counters["errors"] += 1
+    finally:
+        writer.close()
+
+
+def _load_process(port, request, connections, warmup, duration):
+    """One load generator: ``connections`` keep-alive clients on one event loop"""
+    latencies, counters = [], {"errors": 0}
+
+    async def run():
+        measured_from = time.perf_counter() + warmup
+        deadline = measured_from + duration
+        results = await asyncio.gather(
+            *(_connection(port, request, deadline, measured_from, latencies, counters) for _ in range(connections)),
+            return_exceptions=True)
+        counters["errors"] += sum(1 for result in results if isinstance(result, Exception))
+
+    asyncio.run(run())
+    return latencies, counters["errors"]
+
+
+def wait_until_ready(port, process, timeout=120):
+    """Wait for the app to answer; gunicorn listens before its workers have started"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Server exited with code {process.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit("Server did not become ready")
+
+
+def start_server(args, workers, app):
+    env = {**os.environ, "PORT": str(args.port), "HOST": "127.0.0.1", "DEBUG": "False",
+           "BENCH_CATALOG_SIZE": str(args.catalog_size), "PYTHONPATH": BACKEND_DIR}
+    return subprocess.Popen(
+        [sys.executable, "-c", f"import main; main.serve(workers={workers}, app={app!r})"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL)
+
+
+def measure(args, workers, app, request):
+    server = start_server(args, workers, app)
+    try:
+        wait_until_ready(args.port, server)
+        per_process = max(1, args.connections // args.load_processes)
+        with multiprocessing.get_context("spawn").Pool(args.load_processes) as pool:
+            results = pool.starmap(_load_process, [(args.port, request, per_process, args.warmup, args.duration)]
+                                   * args.load_processes)
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+    latencies = [value for values, _ in results for value in values]
+    return common.summarize(latencies, args.duration, sum(errors for _, errors in results))
+
+
+def main():
+    args = parse_args()
+    os.environ.setdefault("ADMISSION_CONTROL_ENABLED", "False")
+    if args.mongodb_url:
+        os.environ["MONGODB_URL"] = args.mongodb_url
+        os.environ.setdefault("DATABASE_NAME", "fimoney_inventory_bench")
+        from app.database import database
+
+        database.mongo.db.products.drop()
+        common.seed_products(database, args.catalog_size)
+        app = "app.main:app"
+    else:
+        app = "benchmarks.bench_workers:app"
+
+    from app.auth.auth import create_user_token
+
+    token = create_user_token({"_id": "000000000000000000000001", "username": "bench"})
+    request = (f"GET {args.path} HTTP/1.1\r\nHost: bench\r\nAuthorization: Bearer {token}\r\n\r\n").encode()
+    counts = [int(n) for n in args.workers.split(",")] if args.workers else default_worker_counts()
+
+    runs = []
+    for workers in counts:
+        result = measure(args, workers, app, request)
+        baseline = runs[0]["rps"] / runs[0]["workers"] if runs else result["rps"] / workers
+        result = {"workers": workers, **result,
+                  "efficiency": round(result["rps"] / (workers * baseline), 3) if baseline else 0.0}
+        runs.append(result)
+        print(f"{workers:3} workers: rps={result['rps']:9.1f} p50={result['p50_ms']:7.2f}ms "
+              f"p99={result['p99_ms']:7.2f}ms errors={result['errors']} efficiency={result['efficiency']:.0%}")
+    print(json.dumps({"cpus": os.cpu_count(), "path": args.path, "connections": args.connections,
+                      "load_processes": args.load_processes, "runs": runs}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Shared helpers for the backend benchmark scripts.
+
+Benchmarks drive ``app.main:app`` in-process through httpx's ASGI transport,
+against either a real MongoDB (``--mongodb-url``) or a mongomock stand-in.
+"""
+
+import asyncio
+import math
+import os
+import time
+
+import httpx
+
+# Benchmarks measure the API itself, so rate limits and concurrency caps
+# stay off unless a run opts in (ADMISSION_CONTROL_ENABLED=True)
+os.environ.setdefault("ADMISSION_CONTROL_ENABLED", "False")
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of latencies"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(latencies, elapsed, errors=0):
+    """Build the standard result record for one benchmark run"""
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies, default=0) * 1000, 2),
+    }
+
+
+def use_mongomock():
+    """Point the database module at in-memory mongomock clients"""
+    import mongomock
+    from mongomock_motor import AsyncMongoMockClient
+    from app.database import database
+
+    # Both drivers share one in-memory store
+    client = mongomock.MongoClient()
+    database.mongo.attach(client, AsyncMongoMockClient(mock_mongo_client=client))
+    return database
+
+
+def seed_products(database, count, batch=10_000):
+    """Insert ``count`` synthetic products through the sync driver"""
+    types = ["Electronics", "Grocery", "Apparel", "Hardware", "Toys"]
+    for start in range(0, count, batch):
+        database.mongo.db.products.insert_many([
+            {
+                "name": f"Product {i}",
+                "type": types[i % len(types)],
+                "sku": f"SKU{i:08d}",
+                "image_url": None,
+                "description": f"Benchmark product {i}",
+                "quantity": i % 100,
+                "price": round(1 + (i % 1000) * 0.5, 2),
+            }
+            for i in range(start, min(start + batch, count))
+        ])
+
+
+def seed_user(database, username="bench"):
+    """Create a benchmark user and return a bearer token for it"""
+    from app.auth.auth import create_user_token, get_password_hash
+
+    database.mongo.db.users.update_one(
+        {"username": username},
+        {"$setOnInsert": {"username": username, "password": get_password_hash("bench-password"), "roles": ["user"]}},
+        upsert=True,
+    )
+    return create_user_token(database.mongo.db.users.find_one({"username": username}))
+
+
+def make_client(app, token=None):
+    """In-process async client for the FastAPI app"""
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app),
+        base_url="http://bench",
+        headers=headers,
+        limits=limits,
+        timeout=None,
+    )
+
+
+async def drive(concurrency, total, send):
+    """Run ``total`` calls of ``send(i)`` with ``concurrency`` workers.
+
+    ``send`` is an async callable returning an httpx response. Returns
+    ``(latencies, errors, elapsed)``.
+    """
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                response = await send(i)
+                if response.status_code >= 400:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
@@ -0,0 +1,214 @@
+"""
+Replica set stand-in for exercising read routing without running MongoDB.
+
+Wraps a mongomock client so the app sees a three-member replica set: the
+``hello`` command reports a set name, sessions exist (with a logical clock
+for operation and cluster times), and every operation is charged to the
+member its read preference would send it to. Data lives in one store, so
+there is no replication lag; what the stand-in measures is where the work
+goes. Work is busy time inside mongomock, which is CPU bound, so it stands
+in for member CPU.
+"""
+
+import inspect
+import itertools
+import threading
+import time
+
+from bson import Int64, Timestamp
+
+SET_NAME = "rs0"
+MEMBERS = ("primary", "secondary-1", "secondary-2")
+
+
+class Members:
+    """Per-member operation counts and busy seconds"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next_secondary = itertools.cycle(MEMBERS[1:])
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.ops = {member: 0 for member in MEMBERS}
+            self.busy = {member: 0.0 for member in MEMBERS}
+
+    def pick(self, read_preference):
+        # Mode 0 is primary, 1 primaryPreferred; the rest prefer secondaries
+        if read_preference is None or read_preference.mode <= 1:
+            return MEMBERS[0]
+        with self._lock:
+            return next(self._next_secondary)
+
+    def charge(self, member, seconds):
+        with self._lock:
+            self.ops[member] += 1
+            self.busy[member] += seconds
+
+    def stats(self):
+        with self._lock:
+            return {member: {"ops": self.ops[member], "busy_s": round(self.busy[member], 3)} for member in MEMBERS}
+
+
+class StandInSession:
+    """Enough of a causally consistent session for the app's use"""
+
+    def __init__(self, client):
+        self._client = client
+        self.cluster_time = None
+        self.operation_time = None
+
+    def advance_cluster_time(self, cluster_time):
+        self.cluster_time = cluster_time
+
+    def advance_operation_time(self, operation_time):
+        if self.operation_time is None or operation_time > self.operation_time:
+            self.operation_time = operation_time
+
+    def _observe(self):
+        now = self._client.tick()
+        self.operation_time = now
+        self.cluster_time = {"clusterTime": now, "signature": {"hash": b"\0" * 20, "keyId": Int64(0)}}
+
+    async def with_transaction(self, callback):
+        return await callback(self)
+
+    async def end_session(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+
+class _Cursor:
+    def __init__(self, cursor, member, members):
+        self._cursor = cursor
+        self._member = member
+        self._members = members
+
+    def __getattr__(self, name):
+        method = getattr(self._cursor, name)
+
+        def chained(*args, **kwargs):
+            method(*args, **kwargs)
+            return self
+        return chained
+
+    async def to_list(self, length=None):
+        started = time.perf_counter()
+        docs = await self._cursor.to_list(length)
+        self._members.charge(self._member, time.perf_counter() - started)
+        return docs
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        started = time.perf_counter()
+        try:
+            return await self._cursor.next()
+        except StopAsyncIteration:
+            raise
+        finally:
+            self._members.charge(self._member, time.perf_counter() - started)
+
+
+class _Collection:
+    _CURSOR_METHODS = ("find", "aggregate", "list_indexes")
+
+    def __init__(self, collection, read_preference, client):
+        self._collection = collection
+        self._read_preference = read_preference
+        self._client = client
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if not callable(attr):
+            return attr
+        members = self._client.members
+
+        if name in self._CURSOR_METHODS:
+            def cursor(*args, session=None, **kwargs):
+                if session is not None:
+                    session._observe()
+                return _Cursor(attr(*args, **kwargs), members.pick(self._read_preference), members)
+            return cursor
+
+        async def call(*args, session=None, **kwargs):
+            # Writes always land on the primary
+            member = members.pick(self._read_preference if name in _READS else None)
+            started = time.perf_counter()
+            try:
+                result = attr(*args, **kwargs)
+                return await result if inspect.isawaitable(result) else result
+            finally:
+                members.charge(member, time.perf_counter() - started)
+                if session is not None:
+                    session._observe()
+        return call
+
+
+_READS = {"find_one", "count_documents", "estimated_document_count", "distinct"}
+
+
+class _Database:
+    def __init__(self, database, read_preference, client):
+        self._database = database
+        self._read_preference = read_preference
+        self._client = client
+
+    def __getitem__(self, name):
+        return _Collection(self._database[name], self._read_preference, self._client)
+
+    def __getattr__(self, name):
+        if name == "command":
+            return self.command
+        return self[name]
+
+    async def command(self, command, *args, **kwargs):
+        name = command if isinstance(command, str) else next(iter(command))
+        if name == "hello":
+            return {"isWritablePrimary": True, "setName": SET_NAME, "ok": 1.0}
+        return await self._database.command(command, *args, **kwargs)
+
+
+class ReplicaSetStandIn:
+    """Motor-style client over mongomock that behaves like a replica set"""
+
+    def __init__(self, async_client):
+        self._client = async_client
+        self.members = Members()
+        self._clock = itertools.count(1)
+        self._clock_lock = threading.Lock()
+
+    def tick(self):
+        with self._clock_lock:
+            return Timestamp(int(time.time()), next(self._clock) % 2 ** 32)
+
+    def __getitem__(self, name):
+        return self.get_database(name)
+
+    def get_database(self, name, read_preference=None, **kwargs):
+        return _Database(self._client[name], read_preference, self)
+
+    async def start_session(self, causal_consistency=True, **kwargs):
+        return StandInSession(self)
+
+    def close(self):
+        self._client.close()
+
+
+def use_replica_set_standin():
+    """Point the database module at a mongomock-backed replica set stand-in; returns it"""
+    import mongomock
+    from mongomock_motor import AsyncMongoMockClient
+    from app.database import database
+
+    client = mongomock.MongoClient()
+    standin = ReplicaSetStandIn(AsyncMongoMockClient(mock_mongo_client=client))
+    database.mongo.attach(client, standin)
+    return standin
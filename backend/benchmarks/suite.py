@@ -0,0 +1,258 @@
+"""
+End-to-end load test for the API.
+
+Starts ``app.main:app`` in-process (lifespan included) against a seeded
+catalog and drives a weighted mix of register/login/list/get/create/update
+requests at one or more concurrency levels. Reports RPS and p50/p95/p99 per
+endpoint and writes the results to a JSON file so runs can be compared
+across commits. Usage (from ``backend/``)::
+
+    python -m benchmarks.suite                                   # 1k catalog, mongomock
+    python -m benchmarks.suite --scenarios 1k,100k --concurrency 10,50
+    python -m benchmarks.suite --scenarios 1m --mongodb-url mongodb://localhost:27017
+    python -m benchmarks.suite --compare benchmarks/results/<previous>.json
+
+mongomock scans the whole collection on every query and needs several GB to
+hold 1M products, so use a real MongoDB (``--mongodb-url``) for the 100k and
+1m scenarios. The target database is dropped and reseeded for every scenario.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from benchmarks import common
+
+SCENARIOS = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+
+# Default request mix, by relative weight: mostly reads, a few writes and auth
+DEFAULT_MIX = "list=50,get=20,update=15,create=8,login=5,register=2"
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongodb-url", help="benchmark against a real MongoDB instead of mongomock")
+    parser.add_argument("--scenarios", default="1k", help=f"comma separated catalog sizes: {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", default="10,50", help="comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per concurrency level")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="endpoint weights, e.g. list=50,get=20,update=15")
+    parser.add_argument("--rounds", type=int, default=4, help="bcrypt cost factor for register/login")
+    parser.add_argument("--no-response-cache", action="store_true", help="disable the product response cache")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the request sequence")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<commit>-<time>.json)")
+    parser.add_argument("--compare", help="previous results file to diff p95 and RPS against")
+    return parser.parse_args()
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ENDPOINTS:
+            raise SystemExit(f"Unknown endpoint in --mix: {name!r} (choose from {', '.join(ENDPOINTS)})")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class Workload:
+    """Builds one request for each endpoint name against the seeded catalog"""
+
+    def __init__(self, client, catalog_size, product_ids, rng):
+        self.client = client
+        self.catalog_size = catalog_size
+        self.product_ids = product_ids
+        self.rng = rng
+        self.run_id = f"{int(time.time() * 1000):x}"
+        # Usernames and SKUs must stay unique across every run of the session
+        self.sequence = itertools.count()
+
+    def register(self, i):
+        return self.client.post("/api/v1/register",
+                                json={"username": f"bench-{self.run_id}-{next(self.sequence)}", "password": "bench-password"})
+
+    def login(self, i):
+        return self.client.post("/api/v1/login", json={"username": "bench", "password": "bench-password"})
+
+    def list(self, i):
+        # Mostly the first pages, as the UI does, with an occasional deeper page
+        pages = max(1, min(100, self.catalog_size // 20))
+        page = self.rng.randrange(min(10, pages)) if self.rng.random() < 0.9 else self.rng.randrange(pages)
+        return self.client.get("/api/v1/products", params={"skip": page * 20, "limit": 20})
+
+    def get(self, i):
+        return self.client.get(f"/api/v1/products/{self.rng.choice(self.product_ids)}")
+
+    def create(self, i):
+        n = next(self.sequence)
+        return self.client.post("/api/v1/products", json={
+            "name": f"Bench product {self.run_id}-{n}",
+            "type": "Benchmark",
+            "sku": f"BENCH-{self.run_id}-{n}",
+            "quantity": self.rng.randrange(100),
+            "price": round(self.rng.uniform(1, 500), 2),
+        })
+
+    def update(self, i):
+        return self.client.put(f"/api/v1/products/{self.rng.choice(self.product_ids)}/quantity",
+                               json={"quantity": self.rng.randrange(1000)})
+
+
+ENDPOINTS = {
+    "register": "POST /register",
+    "login": "POST /login",
+    "list": "GET /products",
+    "get": "GET /products/{id}",
+    "create": "POST /products",
+    "update": "PUT /products/{id}/quantity",
+}
+
+
+async def drive_mix(concurrency, total, workload, mix, rng):
+    """Like ``common.drive`` but records latencies per endpoint of the mix"""
+    names = list(mix)
+    plan = rng.choices(names, weights=[mix[name] for name in names], k=total)
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    counter = iter(enumerate(plan))
+
+    async def worker():
+        for i, name in counter:
+            started = time.perf_counter()
+            try:
+                response = await getattr(workload, name)(i)
+                if response.status_code >= 400:
+                    errors[name] += 1
+            except Exception:
+                errors[name] += 1
+            latencies[name].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    endpoints = {ENDPOINTS[name]: common.summarize(latencies[name], elapsed, errors[name]) for name in names}
+    overall = common.summarize([value for values in latencies.values() for value in values],
+                               elapsed, sum(errors.values()))
+    return endpoints, overall
+
+
+def prepare_database(args, catalog_size):
+    from app.database import database
+
+    if args.mongodb_url:
+        database.mongo.db.products.drop()
+        database.mongo.db.users.drop()
+    else:
+        common.use_mongomock()
+    started = time.perf_counter()
+    common.seed_products(database, catalog_size)
+    token = common.seed_user(database)
+    print(f"Seeded {catalog_size} products in {time.perf_counter() - started:.1f}s")
+    sample = database.mongo.db.products.aggregate([{"$sample": {"size": 1000}}, {"$project": {"_id": 1}}])
+    return [str(doc["_id"]) for doc in sample], token
+
+
+async def run(args):
+    from app.main import app
+    from app.cache.responses import product_cache
+
+    mix = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+    runs = []
+    for scenario in args.scenarios.split(","):
+        catalog_size = SCENARIOS[scenario.strip().lower()]
+        product_ids, token = prepare_database(args, catalog_size)
+        if args.no_response_cache:
+            product_cache.backend = None
+
+        async with app.router.lifespan_context(app):
+            async with common.make_client(app, token) as client:
+                workload = Workload(client, catalog_size, product_ids, rng)
+                # One untimed pass so process pools and caches are not part of the first run
+                await drive_mix(1, len(mix) * 2, workload, mix, rng)
+                for concurrency in [int(c) for c in args.concurrency.split(",")]:
+                    endpoints, overall = await drive_mix(concurrency, args.requests, workload, mix, rng)
+                    runs.append({"scenario": scenario, "catalog_size": catalog_size,
+                                 "concurrency": concurrency, "overall": overall, "endpoints": endpoints})
+                    print_run(runs[-1])
+    return {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "database": "mongodb" if args.mongodb_url else "mongomock",
+        "requests": args.requests,
+        "mix": mix,
+        "bcrypt_rounds": args.rounds,
+        "response_cache": not args.no_response_cache,
+        "runs": runs,
+    }
+
+
+def print_run(run):
+    print(f"\n{run['scenario']} catalog, {run['concurrency']} clients")
+    rows = list(run["endpoints"].items()) + [("total", run["overall"])]
+    for name, row in rows:
+        print(f"  {name:30} rps={row['rps']:8.1f} p50={row['p50_ms']:8.2f}ms p95={row['p95_ms']:8.2f}ms "
+              f"p99={row['p99_ms']:8.2f}ms errors={row['errors']}")
+
+
+def compare(results, baseline_path):
+    """Print the p95 and RPS change of every endpoint against a previous run"""
+    with open(baseline_path) as handle:
+        baseline = json.load(handle)
+    previous = {(run["scenario"], run["concurrency"]): run for run in baseline["runs"]}
+    print(f"\nCompared with {baseline['commit']} ({baseline['created_at']}):")
+    for run in results["runs"]:
+        before = previous.get((run["scenario"], run["concurrency"]))
+        if before is None:
+            continue
+        print(f"{run['scenario']} catalog, {run['concurrency']} clients")
+        rows = list(run["endpoints"].items()) + [("total", run["overall"])]
+        for name, row in rows:
+            old = before["overall"] if name == "total" else before["endpoints"].get(name)
+            if not old or not old["p95_ms"] or not old["rps"]:
+                continue
+            p95 = (row["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100
+            rps = (row["rps"] - old["rps"]) / old["rps"] * 100
+            print(f"  {name:30} p95 {old['p95_ms']:8.2f} -> {row['p95_ms']:8.2f}ms ({p95:+6.1f}%)  "
+                  f"rps {old['rps']:8.1f} -> {row['rps']:8.1f} ({rps:+6.1f}%)")
+
+
+def main():
+    args = parse_args()
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    if args.mongodb_url:
+        os.environ["MONGODB_URL"] = args.mongodb_url
+        os.environ.setdefault("DATABASE_NAME", "fimoney_inventory_bench")
+    results = asyncio.run(run(args))
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{results['commit']}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as handle:
+        json.dump(results, handle, indent=2)
+    print(f"\nResults written to {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
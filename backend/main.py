@@ -3,43 +3,268 @@
 Main entry point for FIMoney Inventory Management Backend
 """
 
+import argparse
+import importlib.util
 import os
 import sys
 import uvicorn
 from dotenv import load_dotenv
 
+try:
+    from uvicorn.workers import UvicornWorker
+except ImportError:  # gunicorn is optional (not available on Windows)
+    UvicornWorker = None
+
 # Load environment variables from .env file
 load_dotenv()
 
 # Add the app directory to Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
 
+def ensure_indexes():
+    """Apply the declarative index registry (idempotent)"""
+    from app.database.database import mongo
+    from app.database.indexes import ensure_indexes
+
+    failed = False
+    for entry in ensure_indexes(mongo.db):
+        if entry["error"]:
+            failed = True
+            print(f"❌ {entry['collection']}: {entry['error']}")
+            if "sku_unique" in entry["error"]:
+                print("   Duplicate SKUs must be merged first: python main.py dedupe-skus --fix")
+        else:
+            print(f"✅ {entry['collection']}: {', '.join(entry['indexes'])}")
+    return 1 if failed else 0
+
+def check_indexes():
+    """Explain every hot-path crud query; fail on collection scans and unindexed keyset sorts"""
+    from app.database.database import mongo
+    from app.database.indexes import explain_hot_queries, missing_unique_indexes
+
+    failed = False
+    for collection, name in missing_unique_indexes(mongo.db):
+        # Without it duplicates are accepted silently instead of answering 409
+        failed = True
+        print(f"❌ {collection}.{name}: missing, duplicates are not rejected")
+        if name == "sku_unique":
+            print("   Merge duplicate SKUs, then build it: python main.py dedupe-skus --fix && python main.py ensure-indexes")
+    for entry in explain_hot_queries(mongo.db):
+        plan = " -> ".join(reversed(entry["stages"]))
+        if entry["collscan"]:
+            failed = True
+            print(f"❌ {entry['query']}: COLLSCAN ({plan})")
+        elif entry["failed"]:
+            failed = True
+            print(f"❌ {entry['query']}: in-memory SORT ({plan})")
+        elif entry["in_memory_sort"]:
+            print(f"⚠️  {entry['query']}: in-memory SORT ({plan})")
+        elif entry["uncovered"]:
+            print(f"⚠️  {entry['query']}: not covered by the index ({plan})")
+        else:
+            print(f"✅ {entry['query']}: {plan}")
+    return 1 if failed else 0
+
+def reconcile_inventory(fix: bool):
+    """Recompute the inventory summary from products and print any drift"""
+    import asyncio
+    from app.crud import crud
+
+    report = asyncio.run(crud.reconcile_inventory_summary(fix=fix))
+    for entry in report["drift"]:
+        print(f"❌ {entry['type']} {entry['field']}: stored {entry['stored']}, expected {entry['expected']}")
+    for label in ("low_stock_missing", "low_stock_stale"):
+        if report[label]:
+            print(f"❌ {label.replace('_', ' ')}: {report[label]}")
+    drifted = bool(report["drift"] or report["low_stock_missing"] or report["low_stock_stale"])
+    if not drifted:
+        print(f"✅ Inventory summary matches {report['products']} products ({report['elapsed_seconds']}s)")
+    elif report["fixed"]:
+        print("✅ Inventory summary rebuilt")
+    return 1 if drifted and not fix else 0
+
+def dedupe_skus(fix: bool):
+    """List products sharing a SKU; with --fix merge each group into its oldest product"""
+    import asyncio
+    from app.warehouses import warehouses
+
+    report = asyncio.run(warehouses.merge_duplicate_skus(fix=fix))
+    for entry in report:
+        merged = f", merged {entry['moved']} units" if fix else ""
+        print(f"{'✅' if fix else '❌'} {entry['sku']}: kept {entry['kept']}, "
+              f"{'removed' if fix else 'duplicates'} {', '.join(entry['duplicates'])}{merged}")
+    if not report:
+        print("✅ Every SKU belongs to one product")
+    return 1 if report and not fix else 0
+
+def snapshot_stock():
+    """Materialize current stock for point-in-time queries"""
+    import asyncio
+    from app.ledger import ledger
+
+    report = asyncio.run(ledger.take_snapshot())
+    print(f"✅ Stock snapshot {report['snapshot_id']}: {report['products']} products, {report['units']} units")
+    return 0
+
 def main():
-    """Start the FastAPI server with production configuration"""
-    
-    # Get configuration from environment variables
-    host = os.getenv("HOST", "0.0.0.0")
-    port = int(os.getenv("PORT", 8000))
+    """Start the FastAPI server, or run a maintenance command"""
+    parser = argparse.ArgumentParser(description="FIMoney Inventory Management Backend")
+    parser.add_argument(
+        "command",
+        nargs="?",
+        default="serve",
+        choices=["serve", "ensure-indexes", "check-indexes", "reconcile-inventory", "snapshot-stock", "dedupe-skus"],
+        help="serve (default), ensure-indexes, check-indexes (explain hot queries, fail on COLLSCAN), "
+             "reconcile-inventory (report inventory summary drift), snapshot-stock "
+             "or dedupe-skus (report products sharing a SKU)"
+    )
+    parser.add_argument("--fix", action="store_true",
+                        help="reconcile-inventory: rewrite the summary on drift; dedupe-skus: merge duplicates")
+    parser.add_argument("--workers", type=int, help="serve: worker processes (default: WEB_CONCURRENCY, else CPU count)")
+    args = parser.parse_args()
+    if args.command == "reconcile-inventory":
+        sys.exit(reconcile_inventory(args.fix))
+    if args.command == "snapshot-stock":
+        sys.exit(snapshot_stock())
+    if args.command == "dedupe-skus":
+        sys.exit(dedupe_skus(args.fix))
+    if args.command == "ensure-indexes":
+        sys.exit(ensure_indexes())
+    if args.command == "check-indexes":
+        sys.exit(check_indexes())
+    serve(workers=args.workers)
+
+def available_cpus():
+    """CPUs this process may use: affinity mask and container CPU quota included"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # macOS, Windows
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as handle:
+            quota, period = handle.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+def _pick(setting, preferred, fallback):
+    """Resolve an "auto" loop/http setting to the fast implementation when it is installed"""
+    if setting != "auto":
+        return setting
+    return preferred if importlib.util.find_spec(preferred) else fallback
+
+def server_config(workers=None):
+    """Production server settings from the environment"""
     debug = os.getenv("DEBUG", "False").lower() == "true"
+    if workers is None:
+        concurrency = os.getenv("WEB_CONCURRENCY", "auto")
+        workers = available_cpus() if concurrency == "auto" else int(concurrency)
+    return {
+        "host": os.getenv("HOST", "0.0.0.0"),
+        "port": int(os.getenv("PORT", 8000)),
+        "debug": debug,
+        # The reloader only supports a single process
+        "workers": 1 if debug else max(1, workers),
+        "loop": _pick(os.getenv("SERVER_LOOP", "auto"), "uvloop", "asyncio"),
+        "http": _pick(os.getenv("SERVER_HTTP", "auto"), "httptools", "h11"),
+        # Keep idle client connections longer than the proxy/load balancer does,
+        # so it never reuses a connection the server has just closed
+        "keep_alive": int(os.getenv("KEEP_ALIVE_SECONDS", 65)),
+        "backlog": int(os.getenv("SERVER_BACKLOG", 2048)),
+        "graceful_timeout": int(os.getenv("GRACEFUL_TIMEOUT_SECONDS", 30)),
+        # Recycle a worker after this many requests (0 = never), +/- jitter
+        "max_requests": int(os.getenv("MAX_REQUESTS", 0)),
+        "max_requests_jitter": int(os.getenv("MAX_REQUESTS_JITTER", 0)),
+    }
+
+if UvicornWorker is not None:
+    class ProductionWorker(UvicornWorker):
+        """uvicorn worker for gunicorn with the loop/http choice from the environment"""
+        _config = server_config(workers=1)
+        CONFIG_KWARGS = {
+            "loop": _config["loop"],
+            "http": _config["http"],
+            # Let in-flight requests finish before gunicorn's own graceful timeout
+            "timeout_graceful_shutdown": max(1, _config["graceful_timeout"] - 1),
+        }
+
+def run_gunicorn(app, config):
+    """Supervise uvicorn workers with gunicorn: SIGHUP reloads them one by one"""
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            settings = {
+                "bind": f"{config['host']}:{config['port']}",
+                "workers": config["workers"],
+                "worker_class": "main.ProductionWorker",
+                "keepalive": config["keep_alive"],
+                "backlog": config["backlog"],
+                "graceful_timeout": config["graceful_timeout"],
+                "max_requests": config["max_requests"],
+                "max_requests_jitter": config["max_requests_jitter"],
+                # Import the app in each worker after fork, so MongoDB clients,
+                # process pools and event loops are never shared between workers
+                "preload_app": False,
+                "loglevel": "warning",
+            }
+            for key, value in settings.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return uvicorn.importer.import_from_string(app)
+
+    Server().run()
+
+def serve(workers=None, app="app.main:app"):
+    """Start the FastAPI server with production configuration.
+
+    With more than one worker, gunicorn supervises uvicorn workers when it
+    is installed (graceful ``kill -HUP`` reloads, worker recycling);
+    otherwise uvicorn's own process manager is used.
+    """
+    config = server_config(workers)
+    use_gunicorn = config["workers"] > 1 and UvicornWorker is not None
     
     print("🚀 Starting FIMoney Inventory Management Backend...")
     print("=" * 50)
     print("📋 Configuration:")
-    print(f"   Host: {host}")
-    print(f"   Port: {port}")
-    print(f"   Debug: {debug}")
+    print(f"   Host: {config['host']}")
+    print(f"   Port: {config['port']}")
+    print(f"   Debug: {config['debug']}")
+    print(f"   Workers: {config['workers']} ({'gunicorn' if use_gunicorn else 'uvicorn'}, "
+          f"loop={config['loop']}, http={config['http']})")
     print(f"   MongoDB: {os.getenv('MONGODB_URL', 'mongodb://localhost:27017')}")
     print(f"   Database: {os.getenv('DATABASE_NAME', 'fimoney_inventory')}")
     print("=" * 50)
+    if config["workers"] > 1:
+        per_worker = [name for name in ("RESPONSE_CACHE_BACKEND", "RATE_LIMIT_BACKEND", "JOBS_BACKEND")
+                      if os.getenv(name, "memory").lower() == "memory"]
+        if per_worker:
+            print(f"⚠️  {config['workers']} workers with in-process {', '.join(per_worker)}: each worker keeps its "
+                  f"own copy (stale cached listings, per-worker rate limits). Use redis/mongo or --workers 1.")
     
     try:
+        if use_gunicorn:
+            print(f"   Graceful reload: kill -HUP {os.getpid()}")
+            run_gunicorn(app, config)
+            return
         # Start the server with appropriate configuration
         uvicorn.run(
-            "app.main:app",
-            host=host,
-            port=port,
-            reload=debug,  # Only reload in debug mode
-            log_level="info" if debug else "warning"
+            app,
+            host=config["host"],
+            port=config["port"],
+            reload=config["debug"],  # Only reload in debug mode
+            workers=config["workers"],
+            loop=config["loop"],
+            http=config["http"],
+            timeout_keep_alive=config["keep_alive"],
+            backlog=config["backlog"],
+            timeout_graceful_shutdown=config["graceful_timeout"],
+            limit_max_requests=config["max_requests"] or None,
+            log_level="info" if config["debug"] else "warning"
         )
     except KeyboardInterrupt:
         print("\n🛑 Server stopped by user")
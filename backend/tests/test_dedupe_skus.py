@@ -0,0 +1,56 @@
+import asyncio
+
+import mongomock
+from mongomock_motor import AsyncMongoMockClient
+
+from app.crud import crud
+from app.database import database, indexes
+from app.warehouses import warehouses
+
+
+def setup_function():
+    client = mongomock.MongoClient()
+    database.mongo.attach(client, AsyncMongoMockClient(mock_mongo_client=client))
+    crud._summary_state["built"] = False
+
+
+def _seed_per_location_duplicates():
+    db = database.mongo.db
+    ids = [db.products.insert_one({"name": "Widget", "type": "Hardware", "sku": "W-1", "image_url": None,
+                                   "description": None, "quantity": quantity, "price": 2.0}).inserted_id
+           for quantity in (5, 7, 3)]
+    db.products.insert_one({"name": "Bolt", "type": "Hardware", "sku": "B-1", "image_url": None,
+                            "description": None, "quantity": 1, "price": 1.0})
+    db[warehouses.COLLECTION].insert_one({"_id": warehouses.location_id(ids[1], "north"), "p": ids[1],
+                                          "w": "north", "sku": "W-1", "q": 4})
+    return ids
+
+
+def test_duplicate_skus_leave_sku_unique_missing_and_fail_the_check():
+    _seed_per_location_duplicates()
+    db = database.mongo.db
+
+    report = {entry["collection"]: entry for entry in indexes.ensure_indexes(db)}
+
+    assert "sku_unique" in report["products"]["error"]
+    assert "name_id" in report["products"]["indexes"]
+    assert indexes.missing_unique_indexes(db) == [("products", "sku_unique")]
+
+
+def test_merge_keeps_the_oldest_product_and_all_stock():
+    keep, first, second = _seed_per_location_duplicates()
+    db = database.mongo.db
+
+    assert asyncio.run(warehouses.merge_duplicate_skus())[0]["duplicates"] == [str(first), str(second)]
+    assert db.products.count_documents({}) == 4
+
+    report = asyncio.run(warehouses.merge_duplicate_skus(fix=True))
+
+    assert report == [{"sku": "W-1", "kept": str(keep), "duplicates": [str(first), str(second)], "moved": 10}]
+    assert [doc["_id"] for doc in db.products.find({"sku": "W-1"})] == [keep]
+    assert db.products.find_one({"_id": keep})["quantity"] == 15
+    assert list(db[warehouses.COLLECTION].find({}, {"_id": 1, "p": 1, "q": 1})) == [
+        {"_id": warehouses.location_id(keep, "north"), "p": keep, "q": 4}]
+    assert asyncio.run(crud.reconcile_inventory_summary())["drift"] == []
+    assert all(entry["error"] is None for entry in indexes.ensure_indexes(db))
+    assert indexes.missing_unique_indexes(db) == []
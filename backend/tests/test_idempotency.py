@@ -0,0 +1,81 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+import pytest
+from fastapi import HTTPException
+from mongomock_motor import AsyncMongoMockClient
+from starlette.requests import Request
+
+from app.database import database
+from app.idempotency import idempotency
+from app.schemas import schema
+
+USER = {"username": "alice"}
+
+
+def setup_function():
+    client = mongomock.MongoClient()
+    database.mongo.attach(client, AsyncMongoMockClient(mock_mongo_client=client))
+
+
+def _request(key):
+    return Request({"type": "http", "method": "PUT", "path": "/api/v1/products/1/quantity", "query_string": b"",
+                    "headers": [(b"idempotency-key", key.encode())]})
+
+
+def _run(key, operation, headers=None):
+    return asyncio.run(idempotency.run_once(_request(key), USER, schema.ProductUpdate(quantity=3), operation,
+                                            headers=headers))
+
+
+def test_replay_keeps_response_headers():
+    headers = {}
+
+    async def update():
+        headers["X-Consistency-Token"] = "token-1"
+        return {"quantity": 3}
+
+    first = _run("k1", update, headers)
+    replay = _run("k1", update, {})
+    assert first.headers["x-consistency-token"] == "token-1"
+    assert replay.headers["x-consistency-token"] == "token-1"
+    assert replay.headers["idempotent-replayed"] == "true"
+    assert replay.body == first.body
+
+
+def test_unstored_response_is_never_run_again(monkeypatch):
+    calls = []
+
+    async def update():
+        calls.append(1)
+        return {"quantity": 3}
+
+    class FailingCompletion:
+        def __init__(self, collection):
+            self._collection = collection
+
+        def __getattr__(self, name):
+            return getattr(self._collection, name)
+
+        async def update_one(self, *args, **kwargs):
+            raise ConnectionError("primary stepped down")
+
+    real_get_database = idempotency.get_database
+    monkeypatch.setattr(idempotency, "get_database",
+                        lambda: {idempotency.COLLECTION: FailingCompletion(real_get_database()[idempotency.COLLECTION])})
+    sleep = asyncio.sleep
+    monkeypatch.setattr(idempotency.asyncio, "sleep", lambda seconds: sleep(0))
+    assert _run("k2", update).status_code == 200
+    monkeypatch.setattr(idempotency, "get_database", real_get_database)
+
+    with pytest.raises(HTTPException) as in_progress:
+        _run("k2", update)
+    assert in_progress.value.headers == {"Retry-After": "1"}
+
+    old = datetime.now(timezone.utc) - timedelta(seconds=idempotency.IDEMPOTENCY_LOCK_SECONDS + 1)
+    database.mongo.db[idempotency.COLLECTION].update_one({"_id": "alice:k2"}, {"$set": {"created_at": old}})
+    with pytest.raises(HTTPException) as unfinished:
+        _run("k2", update)
+    assert unfinished.value.status_code == 409 and "did not finish" in unfinished.value.detail
+    assert calls == [1]
@@ -0,0 +1,108 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.images import images
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    monkeypatch.setattr(images, "IMAGE_FETCH_ALLOWED_HOSTS", [])
+    pipeline = images.ImagePipeline(workers=0)
+    pipeline.cache = images.DiskCache(str(tmp_path), 2**20)
+    yield pipeline
+    asyncio.run(pipeline.close())
+
+
+def _serve(pipeline, monkeypatch, handler, addresses):
+    async def resolve(host, port):
+        return addresses[host]
+    monkeypatch.setattr(images, "_resolve", resolve)
+    pipeline._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1:27017/",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://10.0.0.5/a.png",
+    "http://[::1]/a.png",
+    "http://[::ffff:192.168.1.1]/a.png",
+])
+def test_internal_addresses_are_not_served(url):
+    assert images.classify_source(url) == (None, None)
+    with pytest.raises(images.ImageSourceBlocked):
+        asyncio.run(images.check_fetch_destination(url))
+
+
+def test_hostnames_resolving_to_internal_addresses_are_refused(pipeline, monkeypatch):
+    requests = []
+    _serve(pipeline, monkeypatch, lambda request: requests.append(request) or httpx.Response(200, content=b"x"),
+           {"metadata.internal": {"169.254.169.254"}})
+    with pytest.raises(images.ImageSourceBlocked):
+        asyncio.run(pipeline._fetch("http://metadata.internal/latest", "a/b/source"))
+    assert requests == []
+
+
+def test_every_redirect_hop_is_checked(pipeline, monkeypatch):
+    def handler(request):
+        if request.headers["host"] == "img.example.com":
+            return httpx.Response(302, headers={"location": "http://localhost:27017/"})
+        return httpx.Response(200, content=b"secret")
+    _serve(pipeline, monkeypatch, handler, {"img.example.com": {"93.184.216.34"}, "localhost": {"127.0.0.1"}})
+    with pytest.raises(images.ImageSourceBlocked):
+        asyncio.run(pipeline._fetch("http://img.example.com/a.png", "a/b/source"))
+
+
+def test_public_redirects_are_followed(pipeline, monkeypatch):
+    def handler(request):
+        if request.url.path == "/old.png":
+            return httpx.Response(301, headers={"location": "/new.png"})
+        return httpx.Response(200, content=b"image-bytes")
+    _serve(pipeline, monkeypatch, handler, {"img.example.com": {"93.184.216.34"}})
+    path = asyncio.run(pipeline._fetch("http://img.example.com/old.png", "a/b/source"))
+    with open(path, "rb") as handle:
+        assert handle.read() == b"image-bytes"
+
+
+def test_allowlist_limits_remote_hosts(pipeline, monkeypatch):
+    monkeypatch.setattr(images, "IMAGE_FETCH_ALLOWED_HOSTS", ["cdn.example.com", "*.images.example.org"])
+    assert images.classify_source("https://cdn.example.com/a.png")[0] == "http"
+    assert images.classify_source("https://eu.images.example.org/a.png")[0] == "http"
+    assert images.classify_source("https://evil.example.net/a.png") == (None, None)
+
+    requests = []
+    _serve(pipeline, monkeypatch, lambda request: requests.append(request) or httpx.Response(200, content=b"x"),
+           {"evil.example.net": {"93.184.216.34"}})
+    with pytest.raises(images.ImageSourceBlocked):
+        asyncio.run(pipeline._fetch("https://evil.example.net/a.png", "a/b/source"))
+    assert requests == []
+
+
+def test_fetch_connects_to_the_checked_address(pipeline, monkeypatch):
+    answers = iter([["93.184.216.34"], ["127.0.0.1"]])
+
+    async def rebinding_resolve(host, port):
+        return next(answers)
+    requests = []
+    monkeypatch.setattr(images, "_resolve", rebinding_resolve)
+    pipeline._client = httpx.AsyncClient(transport=httpx.MockTransport(
+        lambda request: requests.append(request) or httpx.Response(200, content=b"image-bytes")))
+
+    asyncio.run(pipeline._fetch("https://img.example.com/a.png", "a/b/source"))
+    request, = requests
+    assert request.url.host == "93.184.216.34"
+    assert request.headers["host"] == "img.example.com"
+    assert request.extensions["sni_hostname"] == "img.example.com"
+
+
+def test_only_uploads_are_cached_immutably(monkeypatch):
+    monkeypatch.setattr(images, "IMAGE_SOURCE_MAX_AGE_SECONDS", 3600)
+    assert "immutable" in images.cache_control("upload:abc.png")
+    assert images.cache_control("https://img.example.com/a.png") == "public, max-age=3600"
+
+    monkeypatch.setattr(images.time, "time", lambda: 0)
+    before = images.variant_name("https://img.example.com/a.png", "thumb")
+    assert images.variant_name("upload:abc.png", "thumb").count("/") == 2
+    monkeypatch.setattr(images.time, "time", lambda: 3600)
+    assert images.variant_name("https://img.example.com/a.png", "thumb") != before
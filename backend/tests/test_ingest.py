@@ -0,0 +1,33 @@
+import asyncio
+
+import mongomock
+from mongomock_motor import AsyncMongoMockClient
+
+from app.crud import crud
+from app.database import database
+from app.ingest import ingest
+
+
+def setup_function():
+    client = mongomock.MongoClient()
+    database.mongo.attach(client, AsyncMongoMockClient(mock_mongo_client=client))
+    crud._summary_state["built"] = False
+
+
+async def _chunks(*parts):
+    for part in parts:
+        yield part
+
+
+def test_malformed_stream_keeps_earlier_rows_and_reports_where_it_stopped():
+    body = (b"name,type,sku,quantity,price\n"
+            b"A,Hardware,A-1,1,2.0\n"
+            b"B,Hardware,B-1,1,2.0\n"
+            b'C,"Hardware,C-1,1,2.0\n'
+            b"D,Hardware,D-1,1,2.0\n")
+    result = asyncio.run(ingest.ingest_products(_chunks(body), "csv", chunk_size=1))
+
+    assert result.aborted.startswith("Malformed upload")
+    assert (result.rows, result.inserted, result.failed) == (3, 2, 1)
+    assert result.errors[-1].row == 3
+    assert sorted(database.mongo.db.products.distinct("sku")) == ["A-1", "B-1"]
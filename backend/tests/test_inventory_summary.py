@@ -0,0 +1,44 @@
+import asyncio
+
+import mongomock
+from mongomock_motor import AsyncMongoMockClient
+
+from app.crud import crud
+from app.database import database
+from app.models import model
+
+
+def setup_function():
+    client = mongomock.MongoClient()
+    database.mongo.attach(client, AsyncMongoMockClient(mock_mongo_client=client))
+    crud._summary_state["built"] = False
+
+
+def _product(i, quantity=2):
+    return {"name": f"Item {i}", "type": "Hardware", "sku": f"I-{i}", "quantity": quantity, "price": 5.0}
+
+
+def test_existing_catalog_is_aggregated_until_built():
+    database.mongo.db.products.insert_many([_product(i) for i in range(3)])
+
+    assert asyncio.run(crud.ensure_inventory_summary()) is True
+    asyncio.run(crud.create_product(model.Product(**_product(3, quantity=50))))
+    summary = asyncio.run(crud.get_inventory_summary())
+    assert summary["status"] == "building"
+    assert (summary["totals"]["products"], summary["totals"]["units"]) == (4, 56)
+    assert database.mongo.db.inventory_summary.count_documents({}) == 0
+
+    asyncio.run(crud.reconcile_inventory_summary(fix=True))
+    asyncio.run(crud.create_product(model.Product(**_product(4))))
+    summary = asyncio.run(crud.get_inventory_summary())
+    assert summary["status"] == "built"
+    assert (summary["totals"]["products"], summary["totals"]["units"]) == (5, 58)
+    assert asyncio.run(crud.reconcile_inventory_summary())["drift"] == []
+
+
+def test_new_database_is_tracked_from_the_first_write():
+    assert asyncio.run(crud.ensure_inventory_summary()) is False
+    asyncio.run(crud.create_product(model.Product(**_product(0))))
+
+    assert database.mongo.db.inventory_summary.find_one({"_id": "Hardware"})["products"] == 1
+    assert asyncio.run(crud.get_inventory_summary())["status"] == "built"
@@ -0,0 +1,78 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+
+from app.database import database
+from app.ledger import ledger
+
+T0 = datetime(2024, 5, 1, 9, 0, tzinfo=timezone.utc)
+
+
+def setup_function():
+    client = mongomock.MongoClient()
+    database.mongo.attach(client, AsyncMongoMockClient(mock_mongo_client=client))
+
+
+def _record(product, quantities, t):
+    # Inserted one by one, so _id follows insertion order within the shared timestamp
+    for quantity in quantities:
+        database.mongo.db.stock_movements.insert_one({"p": product, "t": t, "q": quantity, "d": 1, "k": "u"})
+
+
+def test_pages_do_not_drop_movements_sharing_a_timestamp():
+    product = ObjectId()
+    _record(product, [1, 2], T0)
+    _record(product, [3, 4, 5], T0 + timedelta(milliseconds=1))
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = asyncio.run(ledger.get_movements(str(product), cursor=cursor, limit=2))
+        seen += [movement["quantity"] for movement in page]
+        if cursor is None:
+            break
+    assert seen == [5, 4, 3, 2, 1]
+
+
+def test_latest_quantity_breaks_timestamp_ties_by_insertion_order():
+    product = ObjectId()
+    _record(product, [7, 9, 4], T0)
+
+    assert asyncio.run(ledger.get_stock_at(str(product), T0))["quantity"] == 4
+    assert asyncio.run(ledger.get_catalog_stock_at(T0))["units"] == 4
+
+
+def test_concurrent_writers_replay_in_write_order():
+    from app.crud import crud
+
+    crud._summary_state["built"] = False
+    product = database.mongo.db.products.insert_one({"name": "Widget", "type": "Hardware", "sku": "W-1",
+                                                      "quantity": 5, "price": 2.0}).inserted_id
+    record = ledger.record_movements
+    second_recorded = asyncio.Event()
+
+    async def record_out_of_order(changes, kind):
+        # The first write's movement is stamped only after the second one's
+        if changes[0][1]["quantity"] == 10:
+            await second_recorded.wait()
+        await record(changes, kind)
+        second_recorded.set()
+
+    async def writers():
+        ledger.record_movements = record_out_of_order
+        try:
+            await asyncio.gather(crud.update_product_quantity(str(product), 10),
+                                 crud.update_product_quantity(str(product), 20))
+        finally:
+            ledger.record_movements = record
+
+    asyncio.run(writers())
+
+    assert database.mongo.db.products.find_one({"_id": product})["quantity"] == 20
+    movements, _ = asyncio.run(ledger.get_movements(str(product)))
+    assert [m["quantity"] for m in movements] == [20, 10]
+    now = datetime.now(timezone.utc)
+    assert asyncio.run(ledger.get_stock_at(str(product), now))["quantity"] == 20
+    assert asyncio.run(ledger.get_catalog_stock_at(now))["units"] == 20
@@ -0,0 +1,69 @@
+import asyncio
+
+import mongomock
+from mongomock_motor import AsyncMongoMockClient
+
+from app.crud import crud
+from app.database import database
+from app.schemas import schema
+
+
+def setup_function():
+    client = mongomock.MongoClient()
+    database.mongo.attach(client, AsyncMongoMockClient(mock_mongo_client=client))
+    crud._summary_state["built"] = False
+
+
+def _seed(quantity):
+    db = database.mongo.db
+    oid = db.products.insert_one({"name": "Widget", "type": "Hardware", "sku": "W-1", "image_url": None,
+                                  "description": None, "quantity": quantity, "price": 2.0}).inserted_id
+    asyncio.run(crud.reconcile_inventory_summary(fix=True))
+    return oid
+
+
+def _ops(*operations):
+    return [schema.QuantityOperation(**op) for op in operations]
+
+
+def test_mixed_id_and_sku_operations_are_netted_together():
+    oid = _seed(5)
+    results = asyncio.run(crud.apply_quantity_operations(_ops({"id": str(oid), "delta": -3},
+                                                              {"sku": "W-1", "delta": -100})))
+
+    assert [status for status, _ in results] == ["insufficient_stock", "insufficient_stock"]
+    assert database.mongo.db.products.find_one({"_id": oid})["quantity"] == 5
+    assert database.mongo.db.stock_movements.count_documents({}) == 0
+    assert asyncio.run(crud.reconcile_inventory_summary())["drift"] == []
+
+
+def test_mixed_id_and_sku_operations_apply_once():
+    oid = _seed(5)
+    results = asyncio.run(crud.apply_quantity_operations(_ops({"id": str(oid), "delta": -3},
+                                                              {"sku": "W-1", "delta": 10},
+                                                              {"sku": "missing", "delta": 1})))
+
+    assert [status for status, _ in results] == ["applied", "applied", "not_found"]
+    assert database.mongo.db.products.find_one({"_id": oid})["quantity"] == 12
+    movements = list(database.mongo.db.stock_movements.find({"p": oid}))
+    assert [(m["q"], m["d"]) for m in movements] == [(12, 7)]
+    assert asyncio.run(crud.reconcile_inventory_summary())["drift"] == []
+
+
+def test_batch_racing_single_updates_keeps_summary_and_ledger_exact():
+    oid = _seed(50)
+
+    async def race():
+        await asyncio.gather(
+            *(crud.apply_quantity_operations(_ops({"sku": "W-1", "delta": -1}, {"id": str(oid), "delta": 3}))
+              for _ in range(5)),
+            *(crud.update_product_quantity(str(oid), quantity) for quantity in (7, 40)),
+        )
+    asyncio.run(race())
+
+    product = database.mongo.db.products.find_one({"_id": oid})
+    assert "recent_batches" not in product
+    movements = list(database.mongo.db.stock_movements.find({"p": oid}).sort([("t", 1), ("_id", 1)]))
+    assert movements[-1]["q"] == product["quantity"]
+    assert all(m["q"] - m["d"] == prev["q"] for prev, m in zip(movements, movements[1:]))
+    assert asyncio.run(crud.reconcile_inventory_summary())["drift"] == []